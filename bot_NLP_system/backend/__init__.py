@@ -1,4 +1,10 @@
 # Этот файл делает папку backend Python пакетом
 
+import os
+import sys
 
-
+# Общий код ботов (пакет gsp_common) лежит в корне репозитория,
+# а в Docker-образе копируется рядом с backend/.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
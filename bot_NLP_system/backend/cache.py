@@ -0,0 +1,182 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query):
+    """Ключ точного совпадения: нижний регистр, ё -> е, без пунктуации и лишних пробелов."""
+    query = query.lower().replace("ё", "е")
+    query = re.sub(r"[^\w\s-]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class CacheEntry:
+    __slots__ = ("value", "embedding", "created_at", "compute_time")
+
+    def __init__(self, value, embedding, compute_time):
+        self.value = value
+        self.embedding = embedding
+        self.created_at = time.monotonic()
+        self.compute_time = compute_time
+
+
+class AnswerCache:
+    """
+    Кэш готовых ответов с вытеснением по LRU и временем жизни записей (TTL).
+
+    Поиск идет в два шага: сначала по нормализованному тексту запроса
+    (без векторизации), затем по косинусной близости векторов запросов —
+    так перефразированные повторы вопросов тоже попадают в кэш.
+    Кэш сбрасывается целиком, когда меняется версия индекса
+    (version_getter), то есть после загрузки новых документов.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600, similarity_threshold=0.95, version_getter=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version_getter = version_getter
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = version_getter() if version_getter else None
+        # Матрица нормированных векторов запросов для поиска похожих. Новый
+        # ответ занимает свободную строку или добавляется в конец, строка
+        # удаленного обнуляется и переиспользуется: матрица не пересобирается.
+        self._matrix = None
+        self._matrix_keys = []
+        self._rows = {}
+        self._free_rows = []
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _check_version(self):
+        if self.version_getter is None:
+            return
+        version = self.version_getter()
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                self._entries.clear()
+                self._reset_matrix()
+                self.invalidations += 1
+
+    def _reset_matrix(self):
+        self._matrix = None
+        self._matrix_keys = []
+        self._rows = {}
+        self._free_rows = []
+
+    def _add_row(self, key, embedding):
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._matrix_keys)
+            self._matrix_keys.append(None)
+            if self._matrix is None:
+                self._matrix = np.zeros((16, len(embedding)), dtype=np.float32)
+            elif row == len(self._matrix):
+                # Емкость удваивается, поэтому копирование редкое
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+        self._matrix[row] = embedding
+        self._matrix_keys[row] = key
+        self._rows[key] = row
+
+    def _remove(self, key):
+        """Удаляет запись и освобождает ее строку в матрице векторов."""
+        self._entries.pop(key, None)
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._matrix[row] = 0
+            self._matrix_keys[row] = None
+            self._free_rows.append(row)
+
+    def _is_expired(self, entry):
+        return time.monotonic() - entry.created_at > self.ttl
+
+    def _hit(self, key, entry, semantic):
+        self._entries.move_to_end(key)
+        if semantic:
+            self.semantic_hits += 1
+        else:
+            self.exact_hits += 1
+        self.saved_seconds += entry.compute_time
+        return entry.value
+
+    def get_exact(self, query):
+        """Ищет ответ по нормализованному тексту запроса. Возвращает None при промахе."""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry):
+                self._remove(key)
+                return None
+            return self._hit(key, entry, semantic=False)
+
+    def get_similar(self, query_embedding):
+        """
+        Ищет ответ на самый близкий по смыслу закэшированный запрос.
+        Кандидаты с близостью не ниже similarity_threshold проверяются от самого
+        близкого: устаревшие удаляются, и берется следующий. Засчитывает промах,
+        если действующих кандидатов нет.
+        """
+        with self._lock:
+            self._check_version()
+            if self._rows:
+                similarities = self._matrix[:len(self._matrix_keys)] @ _unit(query_embedding)
+                candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+                for row in candidates[np.argsort(-similarities[candidates])]:
+                    key = self._matrix_keys[row]
+                    if key is None:
+                        continue
+                    entry = self._entries[key]
+                    if not self._is_expired(entry):
+                        return self._hit(key, entry, semantic=True)
+                    self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, query, query_embedding, value, compute_time):
+        """
+        Сохраняет ответ; compute_time — сколько секунд занял расчет (для статистики).
+        Без вектора запроса (query_embedding=None) ответ находится только по тексту.
+        """
+        key = normalize_query(query)
+        embedding = _unit(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            self._check_version()
+            self._remove(key)
+            self._entries[key] = CacheEntry(value, embedding, compute_time)
+            # Ответы, найденные без векторизации запроса, доступны только по тексту
+            if embedding is not None:
+                self._add_row(key, embedding)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,104 @@
+from functools import lru_cache
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Нарезка текста на чанки. Отдельный модуль без модели и Chroma:
+# его импортируют и процессы-парсеры, и загрузчик.
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Возвращает сплиттер с заданными параметрами. Сплиттер не хранит состояния,
+    поэтому создается один раз и переиспользуется для всех документов.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+
+def split_text_into_chunks(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Разделяет большой текст на более мелкие чанки.
+    """
+    if len(text) <= chunk_size:
+        # Короткий текст (строка таблицы) сплиттер вернул бы целиком, без крайних пробелов
+        stripped = text.strip()
+        return [stripped] if stripped else []
+    return get_text_splitter(chunk_size, chunk_overlap).split_text(text)
+
+
+class StreamingChunker:
+    """
+    Нарезка потока фрагментов (страниц, параграфов, строк) на чанки без сборки
+    всего документа в одну строку. Фрагменты склеиваются через перевод строки
+    в буфер; когда он дорастает до window символов, буфер режется тем же
+    сплиттером, готовые чанки отдаются, а последний (возможно, неполный) чанк
+    остается в буфере и дорезается вместе со следующими фрагментами. Так
+    перекрытие между чанками сохраняется и на границах страниц, а память
+    ограничена размером окна, а не документа.
+
+    Для каждого чанка известны номера страниц, на которых он начинается
+    и заканчивается (если фрагменты переданы с номерами страниц).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, window=None):
+        self.splitter = get_text_splitter(chunk_size, chunk_overlap)
+        self.window = window or chunk_size * 8
+        self.buffer = ""
+        # Начала фрагментов в буфере: [(смещение, номер страницы)]
+        self.pages = []
+
+    def feed(self, text, page=None):
+        """Добавляет фрагмент; отдает готовые чанки (текст, первая страница, последняя страница)."""
+        if self.buffer:
+            self.buffer += "\n"
+        if not self.pages or self.pages[-1][1] != page:
+            self.pages.append((len(self.buffer), page))
+        self.buffer += text
+        if len(self.buffer) >= self.window:
+            yield from self._drain(final=False)
+
+    def finish(self):
+        """Отдает чанки из остатка буфера."""
+        yield from self._drain(final=True)
+
+    def _page_at(self, offset):
+        page = None
+        for start, number in self.pages:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def _drain(self, final):
+        chunks = self.splitter.split_text(self.buffer)
+        # Чанки — подстроки буфера (без крайних пробелов): находим их начала по порядку
+        positions = []
+        cursor = 0
+        for chunk in chunks:
+            position = self.buffer.find(chunk, cursor)
+            if position < 0:
+                position = cursor
+            positions.append(position)
+            cursor = position + 1
+
+        ready = len(chunks) if final else len(chunks) - 1
+        for chunk, position in zip(chunks[:ready], positions[:ready]):
+            yield chunk, self._page_at(position), self._page_at(position + len(chunk) - 1)
+
+        if final or ready <= 0:
+            if final:
+                self.buffer = ""
+                self.pages = []
+            return
+        # Оставляем последний чанк: он дорежется вместе со следующими фрагментами
+        cut = positions[ready]
+        first_page = self._page_at(cut)
+        self.pages = [(0, first_page)] + [(start - cut, page) for start, page in self.pages if start > cut]
+        self.buffer = self.buffer[cut:]
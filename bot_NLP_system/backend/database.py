@@ -1,11 +1,27 @@
 import chromadb
-from chromadb.utils import embedding_functions
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+from datetime import datetime
+import numpy as np
 import os
+import threading
+import time
 import uuid
 
-# Используем предообученную модель для векторизации
-EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+from .chunking import split_text_into_chunks
+from .embedding_cache import EMBEDDING_CACHE_ENABLED, EmbeddingCache
+from .embeddings import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCHING_ENABLED,
+    EMBEDDING_MODEL,
+    MicroBatcher,
+    create_embedding_backend,
+)
+from .lexical import LexicalIndex, LexicalStore, index_path
+from .manifest import make_chunk_ids
+from .metrics import RERANKS, timed
+from .rerank import RERANK_CANDIDATES, RERANK_ENABLED, RERANK_PARTITIONS, Reranker
 
 # --- Явно указываем путь для сохранения базы данных ---
 # Определяем путь к директории, где находится этот скрипт (т.е. backend/)
@@ -13,78 +29,600 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Путь для сохранения ChromaDB
 db_path = os.path.join(script_dir, "chroma")
 
-# Создаем клиент, который будет СОХРАНЯТЬ данные на диск в указанную папку
-client = chromadb.PersistentClient(path=db_path)
-
-# Создаем коллекцию для хранения векторов
-# get_or_create_collection гарантирует, что коллекция будет создана, если ее нет
-collection = client.get_or_create_collection(
-    name="gsp_collection_with_metadata",
-    embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBEDDING_MODEL
-    ),
-    # ЯВНО УКАЗЫВАЕМ ИСПОЛЬЗОВАТЬ КОСИНУСНУЮ МЕТРИКУ!
-    # Это ключевое исправление.
-    metadata={"hnsw:space": "cosine"}
-)
+# Клиент Chroma, модель и коллекции создаются лениво, при первом обращении
+# (или явно из lifespan сервера), а не при импорте модуля: импорт backend
+# остается дешевым, а перезапуск при разработке не ждет загрузки модели.
+_client = None
+_collections = None
+_embedding_function = None
+_embedding_batcher = None
+_embedding_cache = None
+_reranker = None
+_warmed_up = False
+_init_lock = threading.RLock()
+
+# Сколько чанков накапливать перед одним прогоном модели и одной записью в Chroma
+# при загрузке данных. Можно переопределить переменной окружения.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+
+# Векторизация и поиск в Chroma — блокирующие операции. Чтобы не останавливать
+# цикл событий FastAPI, они выполняются в ограниченном пуле потоков.
+# Размер пула ограничивает число одновременных прогонов модели на CPU.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+# Категория для каталога ИТ-услуг (должна совпадать с именем папки)
+IT_SERVICE_CATALOG_CATEGORY = "it_service_catalog"
+
+# Индекс разделен по шагам каскада поиска: каждый шаг ищет в своей
+# компактной коллекции без фильтров по метаданным. Фильтрованный поиск
+# по общей коллекции замедляется и теряет полноту по мере ее роста.
+PARTITION_COLLECTIONS = {
+    "it_catalog": "gsp_it_catalog",
+    "knowledge": "gsp_knowledge",
+    "routing": "gsp_routing",
+}
+# Гибридный поиск: к векторной схожести добавляется лексическая (BM25) оценка,
+# чтобы точные совпадения ("СПИ-20", коды услуг, добавочные номера)
+# не проигрывали перефразировкам. Итоговая оценка: vec + w * lex * (1 - vec),
+# то есть лексика только поднимает документ и не выводит оценку за 1.
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH", "1") == "1"
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "0.3"))
+# Сколько кандидатов брать из каждого индекса перед объединением
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+
+# Общая коллекция со всеми типами документов (до разделения).
+# Используется только для переноса данных в разделы.
+LEGACY_COLLECTION_NAME = "gsp_collection_with_metadata"
+
+# Архив прежних версий документов. Поиск по нему не идет: в разделах индекса
+# всегда только последняя версия каждого файла, а архив нужен, чтобы можно
+# было посмотреть или восстановить замененные чанки. Выключен по умолчанию.
+ARCHIVE_VERSIONS_ENABLED = os.getenv("ARCHIVE_VERSIONS", "0") == "1"
+ARCHIVE_COLLECTION_NAME = "gsp_archive"
+
+
+def get_client():
+    """Клиент, который СОХРАНЯЕТ данные на диск в папку db_path (создается при первом вызове)."""
+    global _client
+    with _init_lock:
+        if _client is None:
+            _client = chromadb.PersistentClient(path=db_path)
+        return _client
+
+
+def get_collections():
+    """Коллекции для хранения векторов, по одной на раздел."""
+    global _collections
+    with _init_lock:
+        if _collections is None:
+            _collections = {partition: _open_collection(name) for partition, name in PARTITION_COLLECTIONS.items()}
+        return _collections
+
+
+def get_embedding_function():
+    """
+    Функция векторизации (загружается при первом вызове). Держим ссылку на нее,
+    чтобы векторизовать запрос один раз и переиспользовать вектор на всех шагах
+    поиска. Бэкенд (PyTorch, ONNX Runtime, int8) выбирается переменной EMBEDDING_BACKEND.
+    Вызов до fork (preload в gunicorn) дает одну копию весов на все воркеры.
+    """
+    global _embedding_function
+    with _init_lock:
+        if _embedding_function is None:
+            _embedding_function = create_embedding_backend()
+        return _embedding_function
 
 
-def split_text_into_chunks(text, chunk_size=1000, chunk_overlap=200):
+def get_embedding_batcher():
     """
-    Разделяет большой текст на более мелкие чанки.
+    Очередь пакетной векторизации или None, если она выключена. Одновременные
+    запросы к серверу векторизуются одним прогоном модели. Фоновый поток
+    очереди создается в том процессе, который ее использует (потоки не
+    переживают fork).
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
+    global _embedding_batcher
+    if not EMBEDDING_BATCHING_ENABLED:
+        return None
+    with _init_lock:
+        if _embedding_batcher is None:
+            _embedding_batcher = MicroBatcher(get_embedding_function())
+        return _embedding_batcher
+
+
+def get_embedding_cache():
+    """
+    Постоянный кэш векторов чанков для загрузки данных или None, если он выключен
+    (EMBEDDING_CACHE=0). Ключ — модель с вариантом бэкенда и хэш текста чанка.
+    """
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _init_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(f"{EMBEDDING_MODEL}:{EMBEDDING_BACKEND}")
+        return _embedding_cache
+
+
+def get_reranker():
+    """Кросс-энкодер для переоценки результатов (загружается при первом вызове) или None, если RERANK=0."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    with _init_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
+
+
+def embed_documents(documents):
+    """
+    Векторы для чанков документов. Неизменившиеся чанки берутся из кэша
+    векторов, модель загружается и вызывается только для новых текстов.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return get_embedding_function()(documents)
+    return cache.embed(documents, lambda texts: get_embedding_function()(texts))
+
+
+def warm_up():
+    """
+    Открывает коллекции, загружает модель и делает пробный прогон, чтобы первый
+    запрос пользователя не ждал инициализации. Вызывается из lifespan сервера.
+    """
+    global _warmed_up
+    get_collections()
+    get_embedding_function()(["прогрев"])
+    get_embedding_batcher()
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.predict([("прогрев", "прогрев")])
+    _warmed_up = True
+
+
+def readiness():
+    """Состояние инициализации для проверки готовности: (готов ли, подробности)."""
+    details = {
+        "database": _collections is not None,
+        "embedding_model": _embedding_function is not None,
+        "warmed_up": _warmed_up,
+    }
+    return _warmed_up, details
+
+
+def _open_collection(name):
+    # get_or_create_collection гарантирует, что коллекция будет создана, если ее нет
+    return get_client().get_or_create_collection(
+        name=name,
+        # Векторы всегда передаются в Chroma явно (embeddings / query_embeddings),
+        # поэтому функция векторизации коллекции не нужна
+        embedding_function=None,
+        # ЯВНО УКАЗЫВАЕМ ИСПОЛЬЗОВАТЬ КОСИНУСНУЮ МЕТРИКУ!
+        # Это ключевое исправление.
+        metadata={"hnsw:space": "cosine"}
     )
-    chunks = text_splitter.split_text(text)
-    return chunks
 
 
-def add_documents_to_collection(documents, metadatas):
+
+# Лексические индексы разделов (читаются с диска лениво)
+lexical_store = LexicalStore()
+
+
+def partition_for(metadata):
+    """Раздел индекса, в который попадает чанк с такими метаданными."""
+    if metadata.get("doc_type") == "routing_example":
+        return "routing"
+    if metadata.get("category") == IT_SERVICE_CATALOG_CATEGORY:
+        return "it_catalog"
+    return "knowledge"
+
+
+def collection_count():
+    """Число чанков во всех разделах."""
+    return sum(collection.count() for collection in get_collections().values())
+
+
+def legacy_collection_exists():
+    """Есть ли в базе общая коллекция, созданная до разделения индекса."""
+    return LEGACY_COLLECTION_NAME in [c if isinstance(c, str) else c.name for c in get_client().list_collections()]
+
+
+def reset_collection():
+    """Удаляет все разделы (и общую коллекцию, если она есть) и создает разделы заново пустыми."""
+    if legacy_collection_exists():
+        get_client().delete_collection(LEGACY_COLLECTION_NAME)
+    for partition, name in PARTITION_COLLECTIONS.items():
+        get_client().delete_collection(name)
+        get_collections()[partition] = _open_collection(name)
+
+
+def migrate_legacy_collection(page_size=None):
     """
-    Добавляет документы и их метаданные в коллекцию ChromaDB.
+    Переносит чанки из общей коллекции в разделы вместе с сохраненными
+    векторами (модель повторно не вызывается), затем удаляет общую коллекцию.
+    Возвращает словарь {source_path: раздел} для обновления манифеста
+    или None, если переносить нечего.
+    """
+    if not legacy_collection_exists():
+        return None
+    legacy = get_client().get_collection(LEGACY_COLLECTION_NAME, embedding_function=None)
+
+    page_size = page_size or get_client().get_max_batch_size()
+    source_partitions = {}
+    moved = 0
+    offset = 0
+    while True:
+        page = legacy.get(
+            limit=page_size, offset=offset, include=["documents", "metadatas", "embeddings"]
+        )
+        if not page["ids"]:
+            break
+        groups = {}
+        for i, metadata in enumerate(page["metadatas"]):
+            partition = partition_for(metadata)
+            groups.setdefault(partition, []).append(i)
+            if metadata.get("source_path"):
+                source_partitions[metadata["source_path"]] = partition
+        for partition, indexes in groups.items():
+            get_collections()[partition].upsert(
+                ids=[page["ids"][i] for i in indexes],
+                documents=[page["documents"][i] for i in indexes],
+                metadatas=[page["metadatas"][i] for i in indexes],
+                embeddings=[page["embeddings"][i] for i in indexes],
+            )
+        moved += len(page["ids"])
+        offset += len(page["ids"])
+
+    get_client().delete_collection(LEGACY_COLLECTION_NAME)
+    print(f"  [+] Перенесено {moved} чанков из общей коллекции в разделы.")
+    return source_partitions
+
+
+def add_documents_to_collection(documents, metadatas, embeddings=None, ids=None):
+    """
+    Добавляет документы и их метаданные в ChromaDB, раскладывая их по разделам
+    индекса (partition_for). Векторы для всех документов считаются одним вызовом
+    модели (кроме найденных в кэше векторов, см. embed_documents), а запись
+    разбивается на пакеты не больше допустимого для Chroma размера.
+    Записи с уже существующими ID перезаписываются (upsert).
     """
     if not documents:
         return
 
-    # Генерируем уникальные ID для каждого чанка, чтобы избежать дубликатов
-    ids = [str(uuid.uuid4()) for _ in range(len(documents))]
+    if embeddings is None:
+        embeddings = embed_documents(documents)
 
-    collection.add(
-        documents=documents,
-        metadatas=metadatas,
-        ids=ids,
-    )
+    if ids is None:
+        # Без явных ID генерируем уникальные, чтобы избежать дубликатов
+        ids = [str(uuid.uuid4()) for _ in range(len(documents))]
+
+    groups = {}
+    for i, metadata in enumerate(metadatas):
+        groups.setdefault(partition_for(metadata), []).append(i)
+
+    max_batch = get_client().get_max_batch_size()
+    for partition, indexes in groups.items():
+        for start in range(0, len(indexes), max_batch):
+            batch = indexes[start:start + max_batch]
+            get_collections()[partition].upsert(
+                documents=[documents[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch],
+                embeddings=[embeddings[i] for i in batch],
+                ids=[ids[i] for i in batch],
+            )
     print(f"  [+] Добавлено {len(documents)} чанков в коллекцию.")
 
 
-def find_similar_documents(query, n_results=3, where_filter=None):
+def delete_chunks(ids, partition=None, archive=False):
     """
-    Ищет в коллекции документы, наиболее похожие на запрос.
-    Позволяет фильтровать по метаданным с помощью where_filter.
-    Возвращает кортеж: (список документов, список оценок схожести, список метаданных)
+    Удаляет чанки с указанными ID (пакетами, как и при записи).
+    Если раздел не указан, чанки удаляются из всех разделов.
+    С archive=True чанки перед удалением копируются в архивную коллекцию
+    вместе с векторами.
+    """
+    if not ids:
+        return
+    targets = [get_collections()[partition]] if partition else get_collections().values()
+    max_batch = get_client().get_max_batch_size()
+    archived = 0
+    for collection in targets:
+        for start in range(0, len(ids), max_batch):
+            batch = ids[start:start + max_batch]
+            if archive:
+                archived += _archive_chunks(collection, batch)
+            collection.delete(ids=batch)
+    if archived:
+        print(f"  [*] В архив перенесено {archived} чанков прежних версий.")
+    print(f"  [-] Удалено {len(ids)} устаревших чанков из коллекции.")
+
+
+def _archive_chunks(collection, ids):
+    """Копирует чанки из раздела в архивную коллекцию; возвращает их число."""
+    found = collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+    if not found["ids"]:
+        return 0
+    archived_at = datetime.now().isoformat()
+    archive = get_client().get_or_create_collection(
+        name=ARCHIVE_COLLECTION_NAME, embedding_function=None, metadata={"hnsw:space": "cosine"}
+    )
+    archive.upsert(
+        # Одна и та же версия чанка может попасть в архив повторно только под тем же ID
+        ids=found["ids"],
+        documents=found["documents"],
+        embeddings=found["embeddings"],
+        metadatas=[{**(meta or {}), "archived_at": archived_at} for meta in found["metadatas"]],
+    )
+    return len(found["ids"])
+
+
+class ChunkBatcher:
+    """
+    Накопитель чанков для пакетной загрузки.
+    Документы со всех файлов режутся на чанки и складываются в общий буфер;
+    когда в нем набирается batch_size чанков, они векторизуются одним прогоном
+    модели и записываются в Chroma одним вызовом.
+    """
+
+    def __init__(self, batch_size=None, on_flush=None):
+        self.batch_size = batch_size or INGEST_BATCH_SIZE
+        # Вызывается после каждой записи пакета в коллекцию
+        self.on_flush = on_flush
+        self.documents = []
+        self.metadatas = []
+        self.ids = []
+        self.total_chunks = 0
+        self.write_time = 0.0
+
+    def add(self, text, metadata, id_prefix=None, start_index=0):
+        """
+        Режет текст на чанки и добавляет их в буфер. Возвращает число чанков.
+        Если задан id_prefix, чанки получают детерминированные ID
+        "<id_prefix>-<номер>", начиная с start_index.
+        """
+        chunks = split_text_into_chunks(text)
+        return self.add_chunks(chunks, [metadata] * len(chunks), id_prefix, start_index)
+
+    def add_chunks(self, chunks, metadatas, id_prefix=None, start_index=0):
+        """
+        Добавляет в буфер уже нарезанные чанки, каждый со своими метаданными
+        (например, с номером страницы). Возвращает число чанков.
+        """
+        self.documents.extend(chunks)
+        self.metadatas.extend(metadatas)
+        if id_prefix is not None:
+            self.ids.extend(make_chunk_ids(id_prefix, len(chunks), start_index))
+        else:
+            self.ids.extend(str(uuid.uuid4()) for _ in chunks)
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+        return len(chunks)
+
+    def flush(self):
+        """Векторизует и записывает в коллекцию все накопленные чанки."""
+        if not self.documents:
+            return
+        started = time.perf_counter()
+        add_documents_to_collection(self.documents, self.metadatas, ids=self.ids)
+        self.write_time += time.perf_counter() - started
+        self.total_chunks += len(self.documents)
+        self.documents = []
+        self.metadatas = []
+        self.ids = []
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def throughput(self):
+        """Скорость векторизации и записи, чанков в секунду."""
+        return self.total_chunks / self.write_time if self.write_time else 0.0
+
+
+def embed_query(query):
+    """
+    Векторизует текст запроса. Результат можно передавать в
+    find_similar_documents_by_embedding сколько угодно раз без повторного
+    прогона модели.
     """
-    if where_filter is None:
-        where_filter = {}
+    embedding_batcher = get_embedding_batcher()
+    if embedding_batcher is not None:
+        return embedding_batcher(query)
+    return get_embedding_function()([query])[0]
+
+
+def rebuild_lexical_indexes():
+    """Перестраивает лексические индексы всех разделов по текущему содержимому коллекций."""
+    page_size = get_client().get_max_batch_size()
+    for partition, collection in get_collections().items():
+        ids, documents, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            offset += len(page["ids"])
+        index = LexicalIndex.build(ids, documents, metadatas)
+        index.save(index_path(partition))
+        print(f"  [+] Лексический индекс '{partition}': {len(index)} чанков, {len(index.terms)} термов.")
+
+
+def lexical_indexes_missing():
+    """Нет ли на диске лексического индекса хотя бы одного раздела."""
+    return any(not os.path.exists(index_path(partition)) for partition in PARTITION_COLLECTIONS)
 
-    results = collection.query(
-        query_texts=[query],
+
+def find_lexical_documents(query, partition, n_results=3):
+    """
+    Лексический поиск (BM25) в разделе без векторизации запроса.
+    Оценка — доля значимых слов запроса, найденных в чанке (от 0 до 1).
+    Возвращает кортеж: (список документов, список оценок, список метаданных)
+    """
+    index = lexical_store.get(partition)
+    if index is None:
+        return [], [], []
+    documents, scores, metadatas = [], [], []
+    for doc_index, score in index.search(query, n_results):
+        _, document, metadata = index.chunk(doc_index)
+        documents.append(document)
+        scores.append(score)
+        metadatas.append(metadata)
+    return documents, scores, metadatas
+
+
+def _query_partition(partition, query_embedding, n_results, where_filter):
+    results = get_collections()[partition].query(
+        query_embeddings=[query_embedding],
         n_results=n_results,
-        where=where_filter,  # Добавляем фильтрацию
+        where=where_filter or None,  # Фильтрация по метаданным внутри раздела
         include=["documents", "distances", "metadatas"]  # Запрашиваем также и метаданные
     )
-    
+
     if not results or not results["documents"]:
-        return [], [], []
+        return [], [], [], []
 
     documents = results["documents"][0]
     distances = results["distances"][0]
     metadatas = results["metadatas"][0]
     scores = [1 - dist for dist in distances]
-    
-    return documents, scores, metadatas
+
+    return results["ids"][0], documents, scores, metadatas
+
+
+def _hybrid_query(partition, query_embedding, query_text, n_results):
+    """
+    Объединяет кандидатов векторного и лексического поиска в разделе.
+    Для найденных только лексически чанков векторная схожесть считается
+    по их сохраненным векторам.
+    Возвращает кортеж: (ID чанков, документы, оценки, метаданные)
+    """
+    candidates = max(n_results, HYBRID_CANDIDATES)
+    ids, documents, scores, metadatas = _query_partition(partition, query_embedding, candidates, None)
+    found = {chunk_id: [doc, score, meta, 0.0] for chunk_id, doc, score, meta in zip(ids, documents, scores, metadatas)}
+
+    index = lexical_store.get(partition)
+    lexical_hits = index.search(query_text, candidates) if index is not None else []
+    missing = {}
+    for doc_index, lexical_score in lexical_hits:
+        chunk_id, document, metadata = index.chunk(doc_index)
+        if chunk_id in found:
+            found[chunk_id][3] = lexical_score
+        else:
+            missing[chunk_id] = [document, 0.0, metadata, lexical_score]
+
+    if missing:
+        stored = get_collections()[partition].get(ids=list(missing), include=["embeddings"])
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        for chunk_id, vector in zip(stored["ids"], stored["embeddings"]):
+            vector = np.asarray(vector, dtype=np.float32)
+            missing[chunk_id][1] = float(vector @ query_vector / (np.linalg.norm(vector) or 1.0))
+            found[chunk_id] = missing[chunk_id]
+
+    ranked = sorted(
+        ((score + LEXICAL_WEIGHT * lexical_score * (1 - score), chunk_id, doc, meta)
+         for chunk_id, (doc, score, meta, lexical_score) in found.items()),
+        key=lambda item: item[0],
+        reverse=True,
+    )[:n_results]
+    return ([chunk_id for _, chunk_id, _, _ in ranked], [doc for _, _, doc, _ in ranked],
+            [score for score, _, _, _ in ranked], [meta for _, _, _, meta in ranked])
+
+
+def _search_partition(partition, query_embedding, n_results, where_filter, query_text):
+    """Поиск в одном разделе: гибридный, если передан текст запроса. Возвращает (ID, документы, оценки, метаданные)."""
+    if query_text and HYBRID_SEARCH_ENABLED and not where_filter:
+        return _hybrid_query(partition, query_embedding, query_text, n_results)
+    return _query_partition(partition, query_embedding, n_results, where_filter)
+
+
+def find_similar_documents_by_embedding(query_embedding, n_results=3, where_filter=None, partition=None,
+                                        query_text=None, rerank=None):
+    """
+    Ищет документы, наиболее похожие на уже векторизованный запрос.
+    partition — раздел индекса ("it_catalog", "knowledge", "routing"); если не задан,
+    поиск идет по всем разделам и результаты объединяются по схожести.
+    Позволяет дополнительно фильтровать по метаданным с помощью where_filter.
+    Если передан текст запроса (query_text), поиск в разделе гибридный:
+    векторная оценка дополняется лексической (см. HYBRID_SEARCH).
+    В разделах из RERANK_PARTITIONS (при RERANK=1) из индекса берется
+    RERANK_CANDIDATES кандидатов, и они переоцениваются кросс-энкодером: он меняет
+    только порядок, оценки остаются векторными (гибридными), и пороги уверенности
+    применяются к ним, как и без переоценки. rerank=False выключает переоценку,
+    rerank=True включает ее и вне RERANK_PARTITIONS (для сравнения качества).
+    Возвращает кортеж: (список документов, список оценок схожести, список метаданных)
+    """
+    if partition is not None:
+        if rerank is None:
+            rerank = partition in RERANK_PARTITIONS
+        reranker = get_reranker() if rerank and query_text else None
+        if reranker is None:
+            return _search_partition(partition, query_embedding, n_results, where_filter, query_text)[1:]
+        candidates = _search_partition(
+            partition, query_embedding, max(n_results, RERANK_CANDIDATES), where_filter, query_text
+        )
+        with timed("rerank"):
+            documents, scores, metadatas, outcome = reranker.rerank(query_text, *candidates, n_results)
+        RERANKS.labels(outcome).inc()
+        return documents, scores, metadatas
+
+    found = []
+    for name in get_collections():
+        _, documents, scores, metadatas = _query_partition(name, query_embedding, n_results, where_filter)
+        found.extend(zip(scores, documents, metadatas))
+    found.sort(key=lambda item: item[0], reverse=True)
+    found = found[:n_results]
+    return [doc for _, doc, _ in found], [score for score, _, _ in found], [meta for _, _, meta in found]
+
+
+def find_similar_documents(query, n_results=3, where_filter=None, query_embedding=None, partition=None):
+    """
+    Ищет документы, наиболее похожие на запрос (см. find_similar_documents_by_embedding).
+    Если вектор запроса уже посчитан (query_embedding), модель повторно не вызывается.
+    Возвращает кортеж: (список документов, список оценок схожести, список метаданных)
+    """
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    return find_similar_documents_by_embedding(query_embedding, n_results, where_filter, partition, query)
+
+
+async def run_in_search_pool(func, *args):
+    """
+    Выполняет func(*args) в пуле search_executor. run_in_executor не переносит
+    contextvars в поток, поэтому вызов идет в копии контекста: иначе замеры
+    этапов внутри (например, rerank) не попадут в заголовок Server-Timing.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(search_executor, contextvars.copy_context().run, func, *args)
+
+
+async def aembed_query(query):
+    """
+    Асинхронная версия embed_query. С пакетной векторизацией запрос ставится
+    в очередь MicroBatcher, иначе векторизация выполняется в пуле search_executor.
+    """
+    embedding_batcher = get_embedding_batcher()
+    if embedding_batcher is not None:
+        return await asyncio.wrap_future(embedding_batcher.submit(query))
+    return await run_in_search_pool(embed_query, query)
+
+
+async def afind_lexical_documents(query, partition, n_results=3):
+    """
+    Асинхронная версия find_lexical_documents. Поиск идет в пуле search_executor:
+    после обновления базы индекс раздела перечитывается с диска, и цикл событий
+    не должен этого ждать.
+    """
+    return await run_in_search_pool(find_lexical_documents, query, partition, n_results)
+
+
+async def afind_similar_documents_by_embedding(query_embedding, n_results=3, where_filter=None, partition=None,
+                                               query_text=None):
+    """Асинхронная версия find_similar_documents_by_embedding (поиск в пуле search_executor)."""
+    return await run_in_search_pool(
+        find_similar_documents_by_embedding, query_embedding, n_results, where_filter, partition, query_text,
+    )
 
 
 def process_and_add_text(text, metadata):
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+# Кэш векторов чанков для загрузчика. Лежит отдельно от базы: после полного
+# пересоздания коллекций (удаления папки chroma) он по-прежнему экономит прогон модели.
+script_dir = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(script_dir, "embedding_cache"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+
+def text_key(text):
+    """Ключ чанка: 128-битный хэш текста в hex."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Постоянный кэш векторов: ключ — хэш текста чанка, отдельный каталог на
+    каждую модель (и вариант бэкенда). На диске три файла:
+        vectors.f32 — векторы подряд, float32, читается через np.memmap;
+        keys.txt    — ключи по строке на вектор, в том же порядке;
+        meta.json   — модель, размерность и средняя стоимость векторизации.
+    Оба файла данных только дописываются, поэтому прерванная запись теряет
+    лишь хвост: при чтении берется столько строк, сколько есть полных векторов.
+    Писать в кэш должен один процесс (загрузчик).
+    """
+
+    def __init__(self, model_id, directory=EMBEDDING_CACHE_DIR):
+        self.model_id = model_id
+        slug = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in model_id)
+        self.directory = os.path.join(directory, slug)
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.txt")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+
+        self.meta = {"model": model_id, "dim": None, "seconds_per_text": None}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        self.rows = {}
+        self._vectors = None
+        self._load_keys()
+
+        # Статистика текущего запуска
+        self.hits = 0
+        self.misses = 0
+        self.embed_time = 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _load_keys(self):
+        dim = self.meta["dim"]
+        if not dim or not os.path.exists(self.keys_path) or not os.path.exists(self.vectors_path):
+            return
+        complete = os.path.getsize(self.vectors_path) // (dim * 4)
+        with open(self.keys_path, "r", encoding="ascii") as f:
+            for row, line in enumerate(f):
+                if row >= complete:
+                    break
+                key = line.strip()
+                if len(key) == 32:
+                    self.rows[key] = row
+
+    def _matrix(self):
+        if self._vectors is None and self.rows:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.meta["dim"])
+            )
+        return self._vectors
+
+    def embed(self, texts, embed):
+        """
+        Возвращает векторы texts: найденные берутся из кэша, остальные (без
+        повторов) считаются одним вызовом embed и сохраняются в кэш.
+        """
+        keys = [text_key(text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = {}
+        matrix = self._matrix()
+        for i, key in enumerate(keys):
+            row = self.rows.get(key)
+            if row is not None:
+                vectors[i] = np.array(matrix[row])
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            pending = [texts[positions[0]] for positions in missing.values()]
+            started = time.perf_counter()
+            computed = embed(pending)
+            self.embed_time += time.perf_counter() - started
+            self.misses += len(pending)
+            # Повторы одного текста в пакете векторизуются один раз
+            self.hits += sum(len(positions) - 1 for positions in missing.values())
+            for (key, positions), vector in zip(missing.items(), computed):
+                for i in positions:
+                    vectors[i] = vector
+            self._append(list(missing), computed)
+        return vectors
+
+    def _append(self, keys, vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.meta["dim"] is None:
+            # Размерность нужна для чтения файла векторов: сохраняем ее сразу
+            self.meta["dim"] = int(matrix.shape[1])
+            self.save_meta()
+        elif matrix.shape[1] != self.meta["dim"]:
+            # Другая размерность — значит, другая модель под тем же именем: в кэш не пишем
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._drop_incomplete_tail()
+        first_row = len(self.rows)
+        # Ключи пишем после векторов: ключ без полного вектора отбрасывается при чтении
+        with open(self.vectors_path, "ab") as f:
+            f.write(matrix.tobytes())
+        with open(self.keys_path, "a", encoding="ascii") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+        for offset, key in enumerate(keys):
+            self.rows[key] = first_row + offset
+        self._vectors = None
+
+    def _drop_incomplete_tail(self):
+        """Обрезает недописанный хвост файлов, чтобы новые записи шли строго после полных."""
+        size = len(self.rows) * self.meta["dim"] * 4
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != size:
+            os.truncate(self.vectors_path, size)
+        if os.path.exists(self.keys_path) and os.path.getsize(self.keys_path) != len(self.rows) * 33:
+            with open(self.keys_path, "w", encoding="ascii") as f:
+                f.write("".join(f"{key}\n" for key in sorted(self.rows, key=self.rows.get)))
+
+    def seconds_saved(self):
+        """Оценка сэкономленного времени: попадания x средняя стоимость векторизации текста."""
+        seconds_per_text = self.embed_time / self.misses if self.misses else self.meta["seconds_per_text"]
+        return self.hits * seconds_per_text if seconds_per_text else 0.0
+
+    def save_meta(self):
+        """Сохраняет размерность и среднюю стоимость векторизации (для оценки экономии в следующих запусках)."""
+        if self.meta["dim"] is None:
+            return
+        if self.misses:
+            self.meta["seconds_per_text"] = self.embed_time / self.misses
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+    def report(self):
+        """Строка отчета о работе кэша за текущий запуск."""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (f"Кэш векторов: попаданий {self.hits}, промахов {self.misses} ({rate:.0f}% из кэша), "
+                f"сэкономлено ~{self.seconds_saved():.1f} с, записей в кэше: {len(self)}.")
@@ -0,0 +1,260 @@
+"""
+Бэкенды векторизации текста для индекса и запросов.
+
+Выбор бэкенда — переменная окружения EMBEDDING_BACKEND:
+    torch       — исходная модель sentence-transformers в fp32 (по умолчанию);
+    torch-int8  — та же модель с динамической int8-квантизацией линейных слоев;
+    onnx        — экспорт модели в ONNX, выполнение в ONNX Runtime без PyTorch;
+    onnx-int8   — ONNX-модель с int8-квантизацией весов.
+
+ONNX-модели нужно один раз подготовить (нужны torch и sentence-transformers):
+    python -m backend.embeddings export
+"""
+import argparse
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Используем предообученную модель для векторизации
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+# Максимальная длина в токенах, как у исходной модели (max_seq_length)
+EMBEDDING_MAX_LENGTH = 128
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ONNX_MODEL_DIR = os.getenv(
+    "EMBEDDING_ONNX_DIR", os.path.join(script_dir, "models", EMBEDDING_MODEL.split("/")[-1])
+)
+# Потоков на один прогон модели; по умолчанию решает библиотека
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Объединение одновременных запросов в один прогон модели
+EMBEDDING_BATCHING_ENABLED = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+# Сколько ждать попутчиков после первого запроса в пакете
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+
+class SentenceTransformerBackend:
+    """Исходная модель sentence-transformers на PyTorch, при quantize — с int8-квантизацией."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, quantize=False):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if EMBEDDING_THREADS:
+            torch.set_num_threads(EMBEDDING_THREADS)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            # Веса линейных слоев хранятся в int8, активации квантуются на лету
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.name = "torch-int8" if quantize else "torch"
+
+    def __call__(self, texts):
+        vectors = self.model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=False)
+        return list(vectors)
+
+
+class OnnxBackend:
+    """
+    Экспортированный в ONNX трансформер в ONNX Runtime. Токенизация — библиотекой
+    tokenizers, усреднение токенов по маске внимания — в numpy, как в исходной
+    модели (Pooling mean), поэтому векторы совместимы с уже построенным индексом.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        file_name = "model_int8.onnx" if quantized else "model.onnx"
+        model_path = os.path.join(model_dir, file_name)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"Не найдена ONNX-модель {model_path}. Подготовьте ее: python -m backend.embeddings export"
+            )
+        options = onnxruntime.SessionOptions()
+        if EMBEDDING_THREADS:
+            options.intra_op_num_threads = EMBEDDING_THREADS
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(EMBEDDING_MAX_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("<pad>") or 0, pad_token="<pad>")
+        self.name = "onnx-int8" if quantized else "onnx"
+
+    def __call__(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, inputs)[0]
+        return list(mean_pooling(hidden, attention_mask))
+
+
+def mean_pooling(hidden, attention_mask):
+    """Среднее по векторам токенов без учета паддинга."""
+    mask = attention_mask[..., None].astype(np.float32)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def create_embedding_backend(name=None):
+    """Создает бэкенд векторизации по имени (по умолчанию EMBEDDING_BACKEND)."""
+    name = name or EMBEDDING_BACKEND
+    if name == "torch":
+        return SentenceTransformerBackend()
+    if name == "torch-int8":
+        return SentenceTransformerBackend(quantize=True)
+    if name == "onnx":
+        return OnnxBackend()
+    if name == "onnx-int8":
+        return OnnxBackend(quantized=True)
+    raise ValueError(f"Неизвестный бэкенд векторизации: {name}")
+
+
+class MicroBatcher:
+    """
+    Объединяет одновременные запросы на векторизацию в один прогон модели.
+    Фоновый поток берет первый запрос из очереди, ждет попутчиков не дольше
+    max_wait_ms (или пока не наберется max_batch) и векторизует всех разом.
+    """
+
+    def __init__(self, embed, max_batch=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_MAX_WAIT_MS):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Ставит текст в очередь; возвращает Future с вектором."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def __call__(self, text):
+        """Векторизует один текст (блокирующий вызов)."""
+        return self.submit(text).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # После истечения ожидания забираем только то, что уже лежит в очереди
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embed(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+def export_onnx(model_dir=ONNX_MODEL_DIR, model_name=EMBEDDING_MODEL, opset=17):
+    """
+    Готовит ONNX-модель (model.onnx) и токенизатор в model_dir и делает
+    int8-версию с динамической квантизацией весов (model_int8.onnx).
+    Сначала берется готовый экспорт из репозитория модели на Hugging Face,
+    если его нет — трансформер экспортируется локально. В конце векторы
+    ONNX сверяются с исходной моделью.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    model.tokenizer.save_pretrained(model_dir)
+    model_path = os.path.join(model_dir, "model.onnx")
+
+    if not download_onnx(model_name, model_path):
+        transformer = model[0].auto_model.eval()
+        sample = model.tokenizer(["пример запроса"], return_tensors="pt")
+        export_transformer(transformer, sample["input_ids"], sample["attention_mask"], model_path, opset)
+    print(f"[+] ONNX-модель сохранена: {model_path}")
+
+    quantized_path = os.path.join(model_dir, "model_int8.onnx")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"[+] Квантизованная модель сохранена: {quantized_path}")
+
+    samples = ["Как подключить VPN?", "Не работает принтер на третьем этаже", "Что такое СПИ-20?"]
+    reference = np.array(model.encode(samples, convert_to_numpy=True))
+    for quantized in (False, True):
+        vectors = np.array(OnnxBackend(model_dir, quantized=quantized)(samples))
+        cosine = (vectors * reference).sum(axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        marker = "[+]" if cosine.min() > 0.99 else "[!]"
+        print(f"{marker} Сходство с исходной моделью ({'int8' if quantized else 'fp32'}): "
+              f"минимальный косинус {cosine.min():.4f}")
+
+
+def download_onnx(model_name, model_path):
+    """Скачивает готовый ONNX-экспорт модели с Hugging Face; False, если его нет."""
+    try:
+        from huggingface_hub import hf_hub_download
+
+        downloaded = hf_hub_download(model_name, "onnx/model.onnx")
+    except Exception as e:
+        print(f"[!] Готовый ONNX-экспорт недоступен ({e}), экспортируем локально")
+        return False
+    shutil.copyfile(downloaded, model_path)
+    return True
+
+
+def export_transformer(transformer, input_ids, attention_mask, model_path, opset=17):
+    """Экспорт трансформера с динамическими размерами пакета и длины последовательности."""
+    import torch
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer),
+            (input_ids, attention_mask),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "last_hidden_state": dynamic},
+            opset_version=opset,
+            dynamo=False,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подготовка ONNX-моделей для векторизации")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+    export_onnx(args.output)
@@ -0,0 +1,352 @@
+import importlib.util
+import os
+import docx
+import pandas as pd
+import fitz  # PyMuPDF
+import multiprocessing
+import queue
+from datetime import datetime  # Импортируем datetime
+
+from .chunking import StreamingChunker
+
+# Этот модуль не импортирует database: его загружают процессы-парсеры,
+# которым не нужны ни модель векторизации, ни клиент Chroma.
+
+# Число процессов для разбора файлов. По умолчанию — по числу ядер.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Сколько сообщений с результатами может ждать обработки. Когда очередь
+# заполнена, парсеры останавливаются, пока векторизация их не догонит.
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", str(PARSE_WORKERS * 2)))
+# Как часто (в секундах) при ожидании результатов проверять, живы ли парсеры
+PARSE_CHECK_INTERVAL = 5
+# Сколько записей (строк XLSX или чанков документа) передается в одном сообщении
+RECORDS_PER_MESSAGE = 1000
+# Движок чтения XLSX: calamine (пакет python-calamine) читает в разы быстрее
+# openpyxl; если он не установлен, используется openpyxl
+XLSX_ENGINE = os.getenv("XLSX_ENGINE") or ("calamine" if importlib.util.find_spec("python_calamine") else "openpyxl")
+# Разделитель полей в CSV-выгрузках таблиц
+CSV_SEPARATOR = os.getenv("CSV_SEPARATOR", ",")
+
+
+def iter_docx_paragraphs(file_path):
+    """
+    Построчно (по параграфам) отдает текст файла .docx: пары (текст, номер страницы).
+    Нечитаемые параграфы пропускаются, чтобы поврежденный или сложный файл
+    все равно загрузился. Номер страницы считается по разрывам, которые Word
+    сохраняет при последней раскладке документа; если их нет, страница — 1.
+    """
+    doc = docx.Document(file_path)
+    page = 1
+    for para in doc.paragraphs:
+        try:
+            text = para.text
+            breaks = len(para.rendered_page_breaks)
+        except Exception as para_e:
+            # Если не удалось прочитать конкретный параграф, логируем и пропускаем
+            print(f"  [!] Пропущен нечитаемый параграф в файле {os.path.basename(file_path)}: {para_e}")
+            continue
+        if text.strip():
+            yield text, page
+        page += breaks
+
+
+def find_column(columns, keywords, default=None):
+    """Первый столбец, в названии которого есть одно из ключевых слов."""
+    return next((col for col in columns if any(word in str(col).lower() for word in keywords)), default)
+
+
+def read_table_columns(file_path):
+    """Названия столбцов таблицы (XLSX, CSV, Parquet) без чтения данных."""
+    return list(read_table(file_path, nrows=0).columns)
+
+
+def read_table(file_path, columns=None, nrows=None):
+    """
+    Читает таблицу целиком или только нужные столбцы. Кроме XLSX понимает
+    выгрузки тех же листов в CSV и Parquet: они читаются в разы быстрее.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(file_path, usecols=columns, nrows=nrows, sep=CSV_SEPARATOR)
+    if extension == ".parquet":
+        if nrows == 0:
+            import pyarrow.parquet as pq
+            return pq.read_schema(file_path).empty_table().to_pandas()
+        return pd.read_parquet(file_path, columns=columns)
+    return pd.read_excel(file_path, usecols=columns, nrows=nrows, engine=XLSX_ENGINE)
+
+
+def load_from_xlsx(file_path, category):
+    """
+    Гибкая загрузка каталога из таблицы. Справляется с одним или двумя столбцами.
+    Если есть только столбец с названием услуги, формирует осмысленный текст для поиска.
+    Читаются только нужные столбцы, тексты собираются операциями над столбцами.
+    """
+    try:
+        columns = read_table_columns(file_path)
+
+        # 1. Определяем столбец с названием
+        name_col = find_column(columns, ('услуг', 'название', 'тема'), columns[0])
+
+        # 2. Пытаемся найти столбец с описанием (он может отсутствовать)
+        content_col = find_column(columns, ('описание', 'содержание'))
+
+        print(f"  -> Обработка XLSX: '{os.path.basename(file_path)}'. Колонка с названием: '{name_col}'.", end=" ")
+        if content_col:
+            print(f"Колонка с описанием: '{content_col}'.")
+        else:
+            print("Колонка с описанием не найдена.")
+
+        df = read_table(file_path, list(dict.fromkeys(filter(None, (name_col, content_col)))))
+        df = df[df[name_col].notna()]
+        names = df[name_col].astype(str)
+
+        # 3. Формируем текст для поиска в зависимости от наличия описания:
+        # есть только название — создаем более описательный текст
+        texts = "В каталоге предоставляется ИТ-услуга: " + names
+        if content_col:
+            # Есть и название, и описание
+            has_content = df[content_col].notna()
+            texts = texts.where(~has_content, "ИТ-услуга: " + names + ". Описание: " + df[content_col].astype(str))
+
+        # Одна дата загрузки на файл
+        source = os.path.basename(file_path)
+        load_date = datetime.now().isoformat()
+        return [
+            (text, {
+                "source": source,
+                "category": category,
+                "doc_type": "knowledge",
+                "load_date": load_date,
+                "service_name": service_name,
+            })
+            for text, service_name in zip(texts.tolist(), df[name_col].tolist())
+        ]
+    except Exception as e:
+        print(f"!!! Ошибка при чтении XLSX файла {file_path}: {e}")
+        return []
+
+
+def iter_pdf_pages(file_path):
+    """Постранично отдает текст файла .pdf: пары (текст, номер страницы с 1)."""
+    with fitz.open(file_path) as doc:
+        for number, page in enumerate(doc, start=1):
+            text = page.get_text()
+            if text.strip():
+                yield text, number
+
+
+def iter_txt_lines(file_path):
+    """Построчно отдает текст файла .txt (без номеров страниц)."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\n'), None
+
+
+def load_from_routing_xlsx(file_path):
+    """Загружает примеры запросов и департаменты для маршрутизации."""
+    try:
+        columns = read_table_columns(file_path)
+
+        # Ищем столбцы для запроса и отдела
+        request_col = find_column(columns, ('запрос',), columns[0])
+        department_col = find_column(columns, ('отдел', 'департамент'), columns[1])
+
+        print(f"  -> Обработка XLSX для маршрутизации: '{os.path.basename(file_path)}'. Используются столбцы: '{request_col}' и '{department_col}'.")
+
+        df = read_table(file_path, list(dict.fromkeys((request_col, department_col))))
+        df = df[df[request_col].notna() & df[department_col].notna()]
+
+        source = os.path.basename(file_path)
+        load_date = datetime.now().isoformat()  # Дата загрузки, одна на файл
+        return [
+            (text, {
+                "source": source,
+                "department": department,
+                "doc_type": "routing_example",
+                "load_date": load_date,
+            })
+            for text, department in zip(df[request_col].astype(str).tolist(), df[department_col].tolist())
+        ]
+    except Exception as e:
+        print(f"!!! Ошибка при чтении XLSX файла для маршрутизации {file_path}: {e}")
+        return []
+
+
+# Табличные источники: каталог ИТ-услуг и примеры маршрутизации
+TABLE_EXTENSIONS = (".xlsx", ".csv", ".parquet")
+SUPPORTED_EXTENSIONS = TABLE_EXTENSIONS + (".docx", ".pdf", ".txt")
+
+
+# Потоковые извлекатели текста документов: отдают пары (фрагмент, номер страницы)
+DOCUMENT_SEGMENTS = {
+    ".docx": iter_docx_paragraphs,
+    ".pdf": iter_pdf_pages,
+    ".txt": iter_txt_lines,
+}
+
+
+def load_records(file_path, category, is_routing_file):
+    """Извлекает из таблицы список записей (текст, метаданные): по записи на строку."""
+    if is_routing_file:
+        return load_from_routing_xlsx(file_path)
+    return load_from_xlsx(file_path, category)
+
+
+def iter_document_chunks(file_path, filename, category):
+    """
+    Извлекает текст документа (DOCX, PDF, TXT) по страницам или параграфам
+    и сразу режет его на чанки: документ целиком в памяти не собирается.
+    Отдает пары (чанк, метаданные); у чанков PDF и DOCX в метаданных есть
+    номера первой и последней страницы (page, page_end).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    metadata = {
+        "source": filename,
+        "category": category,
+        "doc_type": "knowledge",
+        "load_date": datetime.now().isoformat()
+    }
+    chunker = StreamingChunker()
+    segments = DOCUMENT_SEGMENTS[extension](file_path)
+    for text, page in segments:
+        for chunk, first_page, last_page in chunker.feed(text, page):
+            yield chunk, page_metadata(metadata, first_page, last_page)
+    for chunk, first_page, last_page in chunker.finish():
+        yield chunk, page_metadata(metadata, first_page, last_page)
+
+
+def page_metadata(metadata, first_page, last_page):
+    if first_page is None:
+        return dict(metadata)
+    return {**metadata, "page": first_page, "page_end": last_page}
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_file(task):
+    """
+    Разбирает один файл и по частям отдает его записи.
+    Генерирует сообщения ("records", key, [(текст, метаданные), ...]) для строк
+    таблиц, которые еще нужно нарезать на чанки, или ("chunks", key, [...]) с уже
+    нарезанными чанками документов; в конце — ("done", key, число записей)
+    или ("error", key, текст ошибки). Ошибка может прийти и после части чанков.
+    """
+    key, file_path, filename, category, is_routing_file = task
+    try:
+        if filename.lower().endswith(TABLE_EXTENSIONS):
+            records = load_records(file_path, category, is_routing_file)
+            for start in range(0, len(records), RECORDS_PER_MESSAGE):
+                yield ("records", key, records[start:start + RECORDS_PER_MESSAGE])
+            yield ("done", key, len(records))
+            return
+
+        count = 0
+        for batch in _batches(iter_document_chunks(file_path, filename, category), RECORDS_PER_MESSAGE):
+            count += len(batch)
+            yield ("chunks", key, batch)
+        if not count:
+            print(f"  [!] Файл '{filename}' пуст или не удалось извлечь текст. Пропускается.")
+        yield ("done", key, count)
+    except Exception as e:
+        yield ("error", key, str(e))
+
+
+def _parse_worker(task_queue, result_queue):
+    """
+    Процесс-парсер: берет задачи из task_queue, пока не получит None.
+    Перед разбором сообщает ("started", key, pid), чтобы при падении процесса
+    было известно, какой файл остался неразобранным.
+    """
+    for task in iter(task_queue.get, None):
+        result_queue.put(("started", task[0], os.getpid()))
+        for message in parse_file(task):
+            result_queue.put(message)
+
+
+def _crashed_files(processes, pending, in_progress):
+    """
+    Сообщения об ошибке для файлов, которые разбирали аварийно завершившиеся
+    процессы. Если живых процессов не осталось, ошибкой завершаются все
+    неразобранные файлы. Найденные файлы убираются из pending.
+    """
+    keys = [
+        in_progress.pop(process.pid) for process in processes
+        if not process.is_alive() and process.exitcode and process.pid in in_progress
+    ]
+    if not any(process.is_alive() for process in processes):
+        keys = list(pending)
+    for key in keys:
+        if key in pending:
+            pending.discard(key)
+            yield ("error", key, "процесс-парсер аварийно завершился")
+
+
+def iter_parsed_files(tasks, workers=None):
+    """
+    Разбирает файлы в пуле процессов и отдает сообщения parse_file по мере готовности.
+    tasks — список кортежей (key, file_path, filename, category, is_routing_file).
+
+    Очередь результатов ограничена PARSE_QUEUE_SIZE, поэтому в памяти одновременно
+    находится лишь несколько порций записей, сколько бы файлов ни было.
+    При workers <= 1 файлы разбираются в текущем процессе.
+
+    Если процесс-парсер аварийно завершился (нехватка памяти, сбой библиотеки
+    на поврежденном PDF), для его файла приходит ("error", key, ...), а если
+    упали все процессы — и для всех еще не разобранных файлов.
+    """
+    workers = min(workers or PARSE_WORKERS, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield from parse_file(task)
+        return
+
+    context = multiprocessing.get_context()
+    task_queue = context.Queue()
+    result_queue = context.Queue(maxsize=PARSE_QUEUE_SIZE)
+    for task in tasks:
+        task_queue.put(task)
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = [
+        context.Process(target=_parse_worker, args=(task_queue, result_queue), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        pending = {task[0] for task in tasks}
+        # Файлы, которые сейчас разбирает каждый процесс: {pid: key}
+        in_progress = {}
+        while pending:
+            try:
+                message = result_queue.get(timeout=PARSE_CHECK_INTERVAL)
+            except queue.Empty:
+                yield from _crashed_files(processes, pending, in_progress)
+                continue
+            if message[0] == "started":
+                in_progress[message[2]] = message[1]
+                continue
+            if message[1] not in pending:
+                continue
+            # Файл разобран, только когда пришло "done" или "error";
+            # "records" и "chunks" — лишь очередные порции
+            if message[0] in ("done", "error"):
+                pending.discard(message[1])
+            yield message
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -1,20 +1,27 @@
-from langchain.schema import HumanMessage, SystemMessage
-from langchain_gigachat import GigaChat
 from dotenv import load_dotenv
+import logging
 import os
+import time
 from pathlib import Path
 
+from gsp_common.gigachat_client import create_client
+
+from .metrics import LLM_CALLS, record_span, timed
+
 # Явно указываем путь к .env файлу, который лежит в той же директории,
 # что и этот скрипт (backend/). Это самый надежный способ.
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+logger = logging.getLogger("gsp.gigachat")
+
 # Получаем креды из переменных окружения
 # Убедитесь, что у вас есть файл .env с этой переменной
 GIGACHAT_CREDENTIALS = os.getenv("GIGACHAT_CREDENTIALS")
 
-# Глобальная переменная для хранения объекта чата.
-# Будет инициализирована при первом запросе.
+# Глобальная переменная для хранения клиента GigaChat (общий клиент из gsp_common
+# с повторами, таймаутами и выключателем). Создается при старте сервера (warm_up_chat)
+# или, если старт пропущен, при первом запросе.
 chat = None
 
 # Промпт для случая, когда найдено несколько релевантных фрагментов из разных областей
@@ -37,17 +44,20 @@ MULTIPLE_CONTEXT_PROMPT_TEMPLATE = """
 """
 
 
+# Стандартный текст с контактами службы поддержки
+CONTACT_SUPPORT_TEXT = """К сожалению, я не смог найти готовое решение в базе знаний. Вы можете обратиться в службу поддержки одним из следующих способов:
+- По телефону: 8-800-555-35-35
+- По электронной почте: support@gsp.ru"""
+
 # Промпт для случая, когда релеватный контекст не найден и нужно предоставить контакты
-CONTACT_SUPPORT_PROMPT_TEMPLATE = """
+CONTACT_SUPPORT_PROMPT_TEMPLATE = f"""
 Ты — вежливый и полезный ассистент службы поддержки компании "Газстройпром".
 Твоя задача — вежливо сообщить пользователю, что готового ответа в базе знаний не нашлось, и предоставить контакты для связи со службой поддержки.
 
 Не придумывай ответ. Не извиняйся.
 
 Твой ответ должен содержать следующий текст без изменений:
-"К сожалению, я не смог найти готовое решение в базе знаний. Вы можете обратиться в службу поддержки одним из следующих способов:
-- По телефону: 8-800-555-35-35
-- По электронной почте: support@gsp.ru"
+"{CONTACT_SUPPORT_TEXT}"
 """
 
 # Промпт для уверенного ответа на основе найденного контекста
@@ -117,57 +127,203 @@ ROUTING_PROMPT_TEMPLATE = """
 """
 
 
-def get_gigachat_response(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
+# Текст сообщения о маршрутизации, который формируется без обращения к модели
+ROUTING_RESPONSE_TEMPLATE = 'Ваш запрос направлен в отдел "{department}". Специалисты отдела рассмотрят его и свяжутся с вами.'
+
+# Типы ответов, которые формируются локально по шаблону, без обращения к GigaChat.
+# Для этих типов модель лишь повторяет фиксированный текст, поэтому вызов
+# модели только добавляет секунды задержки и расходы на API.
+# Список задается через запятую; пустое значение возвращает генерацию моделью.
+LOCAL_RESPONSE_TYPES = {
+    item.strip()
+    for item in os.getenv("GIGACHAT_LOCAL_RESPONSES", "contact,routing").split(",")
+    if item.strip()
+}
+
+
+def get_response_type(context_documents, is_confident, routing_info=None, found_in=None):
+    """Определяет тип ответа: routing, it_catalog, confident, multiple_context или contact."""
+    if routing_info and routing_info.get("department"):
+        return "routing"
+    if is_confident and context_documents:
+        if len(context_documents) > 1:
+            return "multiple_context"
+        return "it_catalog" if found_in == "it_catalog" else "confident"
+    return "contact"
+
+
+def render_local_response(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
     """
-    Отправляет запрос в GigaChat с учетом найденных документов
-    и возвращает ответ модели.
-    routing_info - это словарь с ключом "department", если запрос нужно маршрутизировать.
-    found_in - флаг, указывающий, где был найден ответ ('it_catalog' или др.)
+    Возвращает готовый текст ответа, если ответ этого типа формируется локально
+    (см. LOCAL_RESPONSE_TYPES), иначе None.
+    """
+    response_type = get_response_type(context_documents, is_confident, routing_info, found_in)
+    if response_type not in LOCAL_RESPONSE_TYPES:
+        return None
+    if response_type == "contact":
+        return CONTACT_SUPPORT_TEXT
+    if response_type == "routing":
+        return ROUTING_RESPONSE_TEMPLATE.format(department=routing_info["department"])
+    return None
+
+
+def get_chat():
+    """
+    Возвращает клиент GigaChat, создавая его при первом вызове.
+    Возвращает None, если инициализировать клиент не удалось.
     """
     global chat
-    # "Ленивая" инициализация: создаем объект только при первом вызове
     if chat is None:
-        print("Инициализация GigaChat...")
+        logger.info("Инициализация GigaChat...")
         try:
-            chat = GigaChat(credentials=GIGACHAT_CREDENTIALS, verify_ssl_certs=False)
-            print("GigaChat успешно инициализирован.")
+            chat = create_client(credentials=GIGACHAT_CREDENTIALS)
+            logger.info("GigaChat успешно инициализирован.")
         except Exception as e:
-            print(f"!!! Ошибка при инициализации GigaChat: {e}")
-            return "Не удалось инициализировать модель GigaChat. Проверьте креды и сетевое подключение."
+            logger.error("Ошибка при инициализации GigaChat: %s", e)
+            return None
+    return chat
 
-    if routing_info and routing_info.get("department"):
+
+def warm_up_chat():
+    """Создает клиент и заранее получает токен, чтобы первый запрос не ждал авторизации."""
+    llm = get_chat()
+    return llm is not None and llm.warm_up()
+
+
+def build_messages(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
+    """
+    Выбирает шаблон промпта по результатам поиска и формирует список сообщений для GigaChat.
+    routing_info - это словарь с ключом "department", если запрос нужно маршрутизировать.
+    found_in - флаг, указывающий, где был найден ответ ('it_catalog' или др.)
+    """
+    response_type = get_response_type(context_documents, is_confident, routing_info, found_in)
+    context = "\n\n---\n\n".join(context_documents)
+
+    if response_type == "routing":
         # Логика для маршрутизации
         department = routing_info["department"]
         prompt = ROUTING_PROMPT_TEMPLATE.format(department=department, user_prompt=user_prompt)
         system_message = f"Ты — ассистент, который информирует пользователя о перенаправлении его запроса в отдел {department}."
-    elif is_confident and context_documents:
-        context = "\n\n---\n\n".join(context_documents)
-        # Если найден только один документ, используем старые промпты
-        if len(context_documents) == 1:
-            if found_in == "it_catalog":
-                prompt = IT_CATALOG_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
-                system_message = "Ты — ассистент, который находит решения в каталоге ИТ-услуг."
-            else:
-                prompt = CONFIDENT_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
-                system_message = "Ты — полезный ассистент, который помогает пользователям, отвечая на их вопросы на основе предоставленного контекста."
-        else:
-             # Если найдено несколько документов, используем новый промпт
-            prompt = MULTIPLE_CONTEXT_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
-            system_message = "Ты — полезный ассистент, который анализирует несколько фрагментов контекста и предлагает пользователю выбор, если они из разных тем."
-
+    elif response_type == "it_catalog":
+        prompt = IT_CATALOG_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
+        system_message = "Ты — ассистент, который находит решения в каталоге ИТ-услуг."
+    elif response_type == "confident":
+        prompt = CONFIDENT_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
+        system_message = "Ты — полезный ассистент, который помогает пользователям, отвечая на их вопросы на основе предоставленного контекста."
+    elif response_type == "multiple_context":
+        # Если найдено несколько документов, используем промпт с выбором вариантов
+        prompt = MULTIPLE_CONTEXT_PROMPT_TEMPLATE.format(context=context, user_prompt=user_prompt)
+        system_message = "Ты — полезный ассистент, который анализирует несколько фрагментов контекста и предлагает пользователю выбор, если они из разных тем."
     else:
-        # Используем новый промпт для контактов, если ответ не уверен
+        # Используем промпт для контактов, если ответ не уверен
         prompt = CONTACT_SUPPORT_PROMPT_TEMPLATE
         system_message = "Ты — ассистент, который предоставляет контактную информацию службы поддержки."
 
-    messages = [
-        SystemMessage(content=system_message),
-        HumanMessage(content=prompt),
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt},
     ]
 
+
+INIT_ERROR_ANSWER = "Не удалось инициализировать модель GigaChat. Проверьте креды и сетевое подключение."
+API_ERROR_ANSWER = "Извините, произошла ошибка при подключении к сервису GigaChat. Попробуйте позже."
+
+
+def is_error_answer(text):
+    """Проверяет, содержит ли ответ сообщение об ошибке GigaChat вместо ответа модели."""
+    return INIT_ERROR_ANSWER in text or API_ERROR_ANSWER in text
+
+
+def get_gigachat_response(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
+    """
+    Отправляет запрос в GigaChat с учетом найденных документов
+    и возвращает ответ модели.
+    Блокирующий вызов: из асинхронного кода используйте aget_gigachat_response.
+    """
+    local_answer = render_local_response(user_prompt, context_documents, is_confident, routing_info, found_in)
+    if local_answer is not None:
+        LLM_CALLS.labels("local").inc()
+        return local_answer
+
+    llm = get_chat()
+    if llm is None:
+        LLM_CALLS.labels("init_error").inc()
+        return INIT_ERROR_ANSWER
+
+    messages = build_messages(user_prompt, context_documents, is_confident, routing_info, found_in)
+
+    try:
+        with timed("llm"):
+            response = llm.chat({"messages": messages})
+        LLM_CALLS.labels("ok").inc()
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.error("Ошибка при обращении к GigaChat API: %s", e)
+        LLM_CALLS.labels("error").inc()
+        return API_ERROR_ANSWER
+
+
+async def aget_gigachat_response(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
+    """
+    Асинхронная версия get_gigachat_response. Использует нативный асинхронный
+    клиент (achat), поэтому ожидание ответа GigaChat не блокирует цикл событий.
+    """
+    local_answer = render_local_response(user_prompt, context_documents, is_confident, routing_info, found_in)
+    if local_answer is not None:
+        LLM_CALLS.labels("local").inc()
+        return local_answer
+
+    llm = get_chat()
+    if llm is None:
+        LLM_CALLS.labels("init_error").inc()
+        return INIT_ERROR_ANSWER
+
+    messages = build_messages(user_prompt, context_documents, is_confident, routing_info, found_in)
+
+    try:
+        with timed("llm"):
+            response = await llm.achat({"messages": messages})
+        LLM_CALLS.labels("ok").inc()
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.error("Ошибка при обращении к GigaChat API: %s", e)
+        LLM_CALLS.labels("error").inc()
+        return API_ERROR_ANSWER
+
+
+async def astream_gigachat_response(user_prompt, context_documents, is_confident, routing_info=None, found_in=None):
+    """
+    Потоковая версия aget_gigachat_response: асинхронный генератор фрагментов
+    ответа в том порядке, в каком их выдает GigaChat.
+    """
+    local_answer = render_local_response(user_prompt, context_documents, is_confident, routing_info, found_in)
+    if local_answer is not None:
+        LLM_CALLS.labels("local").inc()
+        yield local_answer
+        return
+
+    llm = get_chat()
+    if llm is None:
+        LLM_CALLS.labels("init_error").inc()
+        yield INIT_ERROR_ANSWER
+        return
+
+    messages = build_messages(user_prompt, context_documents, is_confident, routing_info, found_in)
+
     try:
-        response = chat.invoke(messages)
-        return response.content
+        # Время до первого фрагмента замеряем отдельно от полной генерации
+        started = time.perf_counter()
+        first_token = True
+        with timed("llm"):
+            async for chunk in llm.astream({"messages": messages}):
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    if first_token:
+                        record_span("llm_first_token", time.perf_counter() - started)
+                        first_token = False
+                    yield content
+        LLM_CALLS.labels("ok").inc()
     except Exception as e:
-        print(f"Ошибка при обращении к GigaChat API: {e}")
-        return "Извините, произошла ошибка при подключении к сервису GigaChat. Попробуйте позже."
+        logger.error("Ошибка при обращении к GigaChat API: %s", e)
+        LLM_CALLS.labels("error").inc()
+        yield API_ERROR_ANSWER
@@ -0,0 +1,255 @@
+import json
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from .manifest import read_index_version
+
+# Лексический (BM25) индекс хранится рядом с базой, по файлу на раздел
+script_dir = os.path.dirname(os.path.abspath(__file__))
+LEXICAL_DIR = os.path.join(script_dir, "chroma", "lexical")
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Слова, которые встречаются почти в каждом вопросе и ничего не говорят о теме
+STOP_WORDS = frozenset(
+    "а без бы в вам вас ваш во вот все всё вы где да для до его ее её если есть же за и из или им их "
+    "к как ко когда кто ли либо мне мой мы на над не нет ни но о об от по под при про с со так там "
+    "то того тоже только у уже хочу что чтобы это эта этот я можно нужно надо моя какой какая "
+    "какие каким такое такой такая такие почему зачем сколько куда откуда".split()
+)
+
+# Окончания для упрощенного стемминга русских слов (от длинных к коротким)
+_RUSSIAN_ENDINGS = sorted(
+    (
+        "иями ями ами ого его ому ему ыми ими ость ости остью ться тся ется ешь ишь ает яет ует ют ят "
+        "ые ие ое ая яя ую юю ой ей ий ый ом ем ам ям ах ях ов ев ия ья ью ть ет ит ут "
+        "а я о е и ы у ю ь й"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+_CYRILLIC = re.compile(r"[а-я]")
+# Слово или составной токен через дефис, точку или слэш: "спи-20", "1.2.3", "вн/123"
+_TOKEN = re.compile(r"[0-9a-zа-я]+(?:[-./][0-9a-zа-я]+)*")
+
+
+def stem(token):
+    """Упрощенный стемминг: отрезает типичное окончание у русских слов длиннее 4 букв."""
+    if len(token) <= 4 or not _CYRILLIC.search(token) or any(ch.isdigit() for ch in token):
+        return token
+    for ending in _RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(text):
+    """
+    Разбивает текст на термы: нижний регистр, ё -> е, без стоп-слов, со стеммингом.
+    Составные токены ("СПИ-20", "123-45-67") сохраняются целиком и дополнительно
+    разбиваются на части, чтобы находились и при написании через пробел.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower().replace("ё", "е")):
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            terms.append(token)
+        for part in parts:
+            if part and part not in STOP_WORDS:
+                terms.append(stem(part))
+    return terms
+
+
+def has_exact_token(text):
+    """Есть ли в тексте токен с цифрами: код услуги, модель, добавочный номер."""
+    return any(any(ch.isdigit() for ch in token) for token in _TOKEN.findall(text.lower()))
+
+
+# Строковые поля индекса; в файле каждое хранится парой массивов <поле>_data и <поле>_offsets
+PACKED_FIELDS = ("ids", "documents", "metadatas", "terms")
+
+
+class PackedStrings:
+    """
+    Список строк в двух массивах numpy: байты UTF-8 всех строк подряд и
+    смещения начала каждой строки (как списки вхождений в формате CSR).
+    В отличие от массива строк numpy, строки не дополняются до длины самой
+    длинной, поэтому один длинный чанк не раздувает индекс.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings):
+        encoded = [text.encode("utf-8") for text in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class LexicalIndex:
+    """
+    Инвертированный индекс BM25 в компактных массивах numpy:
+    словарь термов, списки вхождений в формате CSR (смещения, номера чанков,
+    частоты) и длины чанков. Тексты и метаданные чанков хранятся здесь же
+    (PackedStrings), чтобы лексический поиск не обращался к Chroma.
+    """
+
+    def __init__(self, ids, documents, metadatas, terms, offsets, postings, frequencies, lengths):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+
+        size = len(lengths)
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((size - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        # IDF терма, которого нет в индексе: такой терм снижает полноту совпадения
+        self.missing_idf = math.log1p((size + 0.5) / 0.5) if size else 0.0
+        average_length = float(lengths.mean()) if size and lengths.any() else 1.0
+        # Знаменатель BM25 без частоты терма, считается один раз на чанк
+        self.length_norm = (BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)).astype(np.float32) \
+            if size else np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, ids, documents, metadatas):
+        """Строит индекс по текстам чанков."""
+        postings_by_term = {}
+        lengths = np.zeros(len(ids), dtype=np.int32)
+        for doc_index, text in enumerate(documents):
+            terms = tokenize(text or "")
+            lengths[doc_index] = len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings_by_term.setdefault(term, []).append((doc_index, count))
+
+        terms = sorted(postings_by_term)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings_by_term[term])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        frequencies = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            entries = postings_by_term[term]
+            postings[offsets[i]:offsets[i + 1]] = [doc for doc, _ in entries]
+            frequencies[offsets[i]:offsets[i + 1]] = [count for _, count in entries]
+
+        return cls(
+            PackedStrings.pack(ids),
+            PackedStrings.pack(text or "" for text in documents),
+            PackedStrings.pack(json.dumps(meta, ensure_ascii=False) for meta in metadatas),
+            PackedStrings.pack(terms),
+            offsets, postings, frequencies, lengths,
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        strings = {}
+        for name in PACKED_FIELDS:
+            packed = getattr(self, name)
+            strings[f"{name}_data"] = packed.data
+            strings[f"{name}_offsets"] = packed.offsets
+        np.savez(
+            tmp_path, **strings,
+            offsets=self.offsets, postings=self.postings, frequencies=self.frequencies, lengths=self.lengths,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            strings = [PackedStrings(data[f"{name}_data"], data[f"{name}_offsets"]) for name in PACKED_FIELDS]
+            return cls(*strings, data["offsets"], data["postings"], data["frequencies"], data["lengths"])
+
+    def search(self, query, n_results=3):
+        """
+        Ищет чанки по термам запроса. Чанки ранжируются по BM25, а возвращаемая
+        оценка от 0 до 1 — доля "веса" (IDF) термов запроса, найденных в чанке:
+        1.0 означает, что в чанке есть все значимые слова запроса.
+        Возвращает список пар (номер чанка, оценка).
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms or not len(self):
+            return []
+
+        bm25 = np.zeros(len(self), dtype=np.float32)
+        matched_idf = np.zeros(len(self), dtype=np.float32)
+        total_idf = 0.0
+        for term in query_terms:
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                total_idf += self.missing_idf
+                continue
+            idf = self.idf[term_id]
+            total_idf += idf
+            docs = self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]
+            tf = self.frequencies[self.offsets[term_id]:self.offsets[term_id + 1]]
+            bm25[docs] += idf * tf * (BM25_K1 + 1) / (tf + self.length_norm[docs])
+            matched_idf[docs] += idf
+
+        candidates = np.flatnonzero(bm25)
+        if not len(candidates):
+            return []
+        if len(candidates) > n_results:
+            candidates = candidates[np.argpartition(-bm25[candidates], n_results - 1)[:n_results]]
+        candidates = candidates[np.argsort(-bm25[candidates])]
+        return [(int(i), float(matched_idf[i] / total_idf)) for i in candidates]
+
+    def chunk(self, index):
+        """(ID, текст, метаданные) чанка по его номеру в индексе."""
+        return self.ids[index], self.documents[index], json.loads(self.metadatas[index])
+
+
+def index_path(partition):
+    return os.path.join(LEXICAL_DIR, f"{partition}.npz")
+
+
+class LexicalStore:
+    """
+    Лексические индексы разделов для сервера. Индексы читаются с диска лениво
+    и перечитываются, когда загрузчик меняет версию индекса.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, partition):
+        version = read_index_version()
+        with self._lock:
+            if version != self._version:
+                self._indexes = {}
+                self._version = version
+            if partition not in self._indexes:
+                path = index_path(partition)
+                self._indexes[partition] = LexicalIndex.load(path) if os.path.exists(path) else None
+            return self._indexes[partition]
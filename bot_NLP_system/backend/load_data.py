@@ -1,9 +1,29 @@
 import os
-import docx
-import pandas as pd
-import fitz  # PyMuPDF
-from datetime import datetime  # Импортируем datetime
-from .database import process_and_add_text
+import time
+from .database import (
+    ARCHIVE_VERSIONS_ENABLED,
+    ChunkBatcher,
+    collection_count,
+    delete_chunks,
+    get_embedding_cache,
+    legacy_collection_exists,
+    lexical_indexes_missing,
+    migrate_legacy_collection,
+    partition_for,
+    rebuild_lexical_indexes,
+    reset_collection,
+)
+from .extractors import SUPPORTED_EXTENSIONS, iter_parsed_files
+from .manifest import (
+    bump_index_version,
+    chunk_id_prefix,
+    entry_chunk_ids,
+    file_sha256,
+    is_unchanged,
+    load_manifest,
+    make_chunk_ids,
+    save_manifest,
+)
 
 # Определяем путь к директории, где находится этот скрипт
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,211 +31,223 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 SOURCE_DIRECTORY = os.path.join(script_dir, "source_documents")
 
 
-def load_from_docx(file_path):
-    """
-    Извлекает текст из файла .docx, пропуская параграфы, которые не удается прочитать.
-    Это делает загрузку более устойчивой к поврежденным или сложным файлам.
-    """
-    full_text = []
-    try:
-        doc = docx.Document(file_path)
-        for para in doc.paragraphs:
-            try:
-                # Пытаемся добавить текст каждого параграфа отдельно
-                if para.text.strip():
-                    full_text.append(para.text)
-            except Exception as para_e:
-                # Если не удалось прочитать конкретный параграф, логируем и пропускаем
-                print(f"  [!] Пропущен нечитаемый параграф в файле {os.path.basename(file_path)}: {para_e}")
-                continue
-        
-        if not full_text:
-             print(f"  [!] Не удалось извлечь текст из файла {os.path.basename(file_path)}. Возможно, он пуст или содержит только нетекстовые элементы.")
-             return None
-
-        return '\n'.join(full_text)
-        
-    except Exception as e:
-        # Обработка общей ошибки, если файл не открывается в принципе
-        print(f"  [!] КРИТИЧЕСКАЯ ОШИБКА при чтении .docx файла {os.path.basename(file_path)}: {e}")
-        return None
-
-
-def load_from_xlsx(file_path, category):
-    """
-    Гибкая загрузка из XLSX. Справляется с одним или двумя столбцами.
-    Если есть только столбец с названием услуги, формирует осмысленный текст для поиска.
-    """
-    try:
-        df = pd.read_excel(file_path)
-        
-        # 1. Определяем столбец с названием
-        name_col = next((col for col in df.columns if 'услуг' in col.lower() or 'название' in col.lower() or 'тема' in col.lower()), df.columns[0])
-        
-        # 2. Пытаемся найти столбец с описанием (он может отсутствовать)
-        content_col = next((col for col in df.columns if 'описание' in col.lower() or 'содержание' in col.lower()), None)
-
-        print(f"  -> Обработка XLSX: '{os.path.basename(file_path)}'. Колонка с названием: '{name_col}'.", end=" ")
-        if content_col:
-            print(f"Колонка с описанием: '{content_col}'.")
-        else:
-            print("Колонка с описанием не найдена.")
-            
-        texts_with_metadata = []
-        for _, row in df.iterrows():
-            service_name = row[name_col]
-            if pd.isna(service_name):
-                continue
-
-            # 3. Формируем текст для поиска в зависимости от наличия описания
-            if content_col and pd.notna(row.get(content_col)):
-                # Есть и название, и описание
-                text = f"ИТ-услуга: {service_name}. Описание: {row[content_col]}"
-            else:
-                # Есть только название, создаем более описательный текст
-                text = f"В каталоге предоставляется ИТ-услуга: {service_name}"
-
-            metadata = {
-                "source": os.path.basename(file_path), 
-                "category": category, 
-                "doc_type": "knowledge",
-                "load_date": datetime.now().isoformat(),
-                "service_name": service_name
-            }
-            texts_with_metadata.append((text, metadata))
-            
-        return texts_with_metadata
-    except Exception as e:
-        print(f"!!! Ошибка при чтении XLSX файла {file_path}: {e}")
-        return []
-
-
-def load_from_pdf(file_path):
-    """Извлекает текст из файла .pdf."""
-    try:
-        doc = fitz.open(file_path)
-        full_text = [page.get_text() for page in doc]
-        doc.close()
-        return '\n'.join(full_text)
-    except Exception as e:
-        print(f"  [!] Ошибка при чтении .pdf файла {os.path.basename(file_path)}: {e}")
-        return None
-
-
-def load_from_txt(file_path):
-    """Извлекает текст из файла .txt."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        print(f"  [!] Ошибка при чтении .txt файла {os.path.basename(file_path)}: {e}")
-        return None
-
-
-def load_from_routing_xlsx(file_path):
-    """Загружает примеры запросов и департаменты для маршрутизации."""
-    try:
-        df = pd.read_excel(file_path)
-        
-        # Ищем столбцы для запроса и отдела
-        request_col = next((col for col in df.columns if 'запрос' in col.lower()), df.columns[0])
-        department_col = next((col for col in df.columns if 'отдел' in col.lower() or 'департамент' in col.lower()), df.columns[1])
-
-        print(f"  -> Обработка XLSX для маршрутизации: '{os.path.basename(file_path)}'. Используются столбцы: '{request_col}' и '{department_col}'.")
-
-        texts_with_metadata = []
-        for _, row in df.iterrows():
-            if pd.notna(row[request_col]) and pd.notna(row[department_col]):
-                text = row[request_col]
-                metadata = {
-                    "source": os.path.basename(file_path),
-                    "department": row[department_col],
-                    "doc_type": "routing_example",
-                    "load_date": datetime.now().isoformat() # Добавляем дату загрузки
-                }
-                texts_with_metadata.append((text, metadata))
-        return texts_with_metadata
-    except Exception as e:
-        print(f"!!! Ошибка при чтении XLSX файла для маршрутизации {file_path}: {e}")
-        return []
-
-
 def main():
     """
     Основная функция для рекурсивного обхода директории с документами,
     извлечения текста, формирования метаданных и добавления в векторную базу.
+
+    Загрузка инкрементальная: в манифесте хранятся размер, время изменения
+    и SHA-256 каждого файла. Заново разбираются и векторизуются только новые
+    и измененные файлы; чанки их прошлых версий и удаленных файлов
+    удаляются из коллекции сразу после записи новой версии (при
+    ARCHIVE_VERSIONS=1 — переносятся в архивную коллекцию). Поэтому в индексе
+    только последняя версия каждого файла, и поиску не нужно отбрасывать
+    устаревшие копии. Номер версии файла хранится в манифесте и в метаданных
+    чанков (version).
+
+    Измененные файлы разбираются параллельно в пуле процессов (PARSE_WORKERS),
+    а извлеченные записи по мере готовности уходят на векторизацию и запись.
+    Документы (PDF, DOCX, TXT) читаются по страницам и параграфам и режутся
+    на чанки потоково, поэтому память не зависит от размера документа.
+
+    Чанки раскладываются по разделам индекса (каталог ИТ-услуг, база знаний,
+    маршрутизация); раздел файла записывается в манифест. Данные из общей
+    коллекции прежних версий переносятся в разделы без повторной векторизации.
+    После изменений перестраиваются лексические (BM25) индексы разделов.
     """
     print("="*50)
     print("🚀 Запуск скрипта загрузки данных в векторную базу...")
     print(f"Ищем файлы в директории: {SOURCE_DIRECTORY}")
     print("="*50)
-    
+
     processed_files_count = 0
-    
+    unchanged_files_count = 0
+    started = time.perf_counter()
+
     if not os.path.isdir(SOURCE_DIRECTORY):
         print(f"❌ Ошибка: Директория '{SOURCE_DIRECTORY}' не найдена.")
         print("Пожалуйста, создайте ее и поместите в нее файлы для обработки.")
         return
 
+    manifest = load_manifest()
+    collection_reset = False
+    migrated_partitions = None
+    if manifest is not None:
+        # Перенос общей коллекции в разделы индекса (один раз после обновления)
+        migrated_partitions = migrate_legacy_collection()
+        for path, partition in (migrated_partitions or {}).items():
+            if path in manifest["files"]:
+                manifest["files"][path]["partition"] = partition
+    else:
+        if collection_count() > 0 or legacy_collection_exists():
+            # Коллекция заполнена старым загрузчиком (случайные ID, дубликаты версий).
+            # Сопоставить ее с файлами нельзя, поэтому строим индекс заново.
+            print("🟡 Манифест индекса не найден, коллекция будет пересоздана с нуля.")
+            reset_collection()
+            collection_reset = True
+        manifest = {"files": {}}
+    old_entries = manifest["files"]
+    new_entries = {}
+    # ID чанков, которые нужно убрать из индекса, по ключу (раздел, в архив ли):
+    # прошлые версии обработанных файлов, удаленные файлы и чанки файлов,
+    # разобранных с ошибкой. Раздел None — запись манифеста без раздела,
+    # чанки ищутся во всех разделах.
+    stale_ids = {}
+    removed_chunks = 0
+
+    def remove_stale_chunks():
+        """
+        Убирает накопленные устаревшие чанки. Вызывается после каждой записи
+        пакета: к этому моменту новые версии файлов, разбор которых закончен,
+        уже в коллекции, и старая и новая версии сосуществуют лишь до ближайшей записи.
+        """
+        nonlocal removed_chunks
+        for (partition, archive), ids in stale_ids.items():
+            delete_chunks(ids, partition, archive=archive)
+            removed_chunks += len(ids)
+        stale_ids.clear()
+
+    # Чанки со всех файлов копятся в общем буфере и пишутся в базу пакетами
+    batcher = ChunkBatcher(on_flush=remove_stale_chunks)
+
+    # --- Этап 1: поиск новых и измененных файлов ---
+    tasks = []
+    changed_files = {}
     # Рекурсивный обход всех папок и файлов
     for root, dirs, files in os.walk(SOURCE_DIRECTORY):
         # Исключаем временные файлы Excel
         files = [f for f in files if not f.startswith('~')]
-        
+
         for filename in files:
             file_path = os.path.join(root, filename)
-            
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                print(f"  [-] Пропуск файла {filename}: неподдерживаемый формат.")
+                continue
+
+            relative_file_path = os.path.relpath(file_path, SOURCE_DIRECTORY)
+            old_entry = old_entries.get(relative_file_path)
+
+            # Быстрая проверка по размеру и времени изменения, без чтения файла
+            stat_result = os.stat(file_path)
+            if is_unchanged(old_entry, stat_result):
+                new_entries[relative_file_path] = old_entry
+                unchanged_files_count += 1
+                continue
+
+            content_hash = file_sha256(file_path)
+            file_entry = {
+                "size": stat_result.st_size,
+                "mtime": stat_result.st_mtime_ns,
+                "sha256": content_hash,
+            }
+            if old_entry and old_entry["sha256"] == content_hash:
+                # Файл "тронули", но содержимое не изменилось
+                new_entries[relative_file_path] = {**old_entry, **file_entry}
+                unchanged_files_count += 1
+                continue
+
             # Определяем категорию и тип документа
             relative_path = os.path.relpath(root, SOURCE_DIRECTORY)
             is_routing_file = relative_path.startswith('routing_examples')
             category = os.path.basename(root) if not is_routing_file else 'routing'
 
-            print(f"[*] Обработка файла: {filename} (Категория: {category})")
-
-            # --- Новая, более четкая логика обработки ---
-
-            # 1. Обработка XLSX файлов (и для маршрутизации, и для базы знаний)
-            if filename.lower().endswith(".xlsx"):
-                records_to_process = []
-                if is_routing_file:
-                    records_to_process = load_from_routing_xlsx(file_path)
-                else:
-                    records_to_process = load_from_xlsx(file_path, category)
-                
-                # Обрабатываем каждую запись из файла
-                for text, metadata in records_to_process:
-                    process_and_add_text(text, metadata=metadata)
-                
-                if records_to_process:
-                    processed_files_count += 1
-                continue # Переходим к следующему файлу
-
-            # 2. Обработка остальных файлов базы знаний (DOCX, PDF, TXT)
-            text = None
-            if filename.lower().endswith(".docx"):
-                text = load_from_docx(file_path)
-            elif filename.lower().endswith(".pdf"):
-                text = load_from_pdf(file_path)
-            elif filename.lower().endswith(".txt"):
-                text = load_from_txt(file_path)
-            else:
-                print(f"  [-] Пропуск файла: неподдерживаемый формат.")
+            print(f"[*] Файл для обработки: {filename} (Категория: {category})")
+            tasks.append((relative_file_path, file_path, filename, category, is_routing_file))
+            changed_files[relative_file_path] = {
+                "filename": filename,
+                "entry": file_entry,
+                "old_entry": old_entry,
+                "id_prefix": chunk_id_prefix(relative_file_path, content_hash),
+                "chunk_count": 0,
+                "partition": None,
+                "version": old_entry.get("version", 1) + 1 if old_entry else 1,
+            }
+
+    # --- Этап 2: параллельный разбор, векторизация и запись ---
+    for kind, relative_file_path, payload in iter_parsed_files(tasks):
+        state = changed_files[relative_file_path]
+        old_entry = state["old_entry"]
+
+        if kind in ("records", "chunks"):
+            for text, metadata in payload:
+                # Все записи файла попадают в один раздел: он определяется папкой
+                state["partition"] = partition_for(metadata)
+                metadata["source_path"] = relative_file_path
+                metadata["content_hash"] = state["entry"]["sha256"]
+                metadata["version"] = state["version"]
+            if kind == "chunks":
+                # Документы приходят уже нарезанными на чанки (с номерами страниц)
+                state["chunk_count"] += batcher.add_chunks(
+                    [text for text, _ in payload], [metadata for _, metadata in payload],
+                    id_prefix=state["id_prefix"], start_index=state["chunk_count"],
+                )
                 continue
+            for text, metadata in payload:
+                state["chunk_count"] += batcher.add(
+                    text, metadata, id_prefix=state["id_prefix"], start_index=state["chunk_count"]
+                )
+            continue
+
+        if kind == "error" or not payload:
+            if kind == "error":
+                print(f"  [!] Ошибка при обработке документа '{state['filename']}': {payload}")
+                # Чанки, записанные до ошибки, удаляем вместе с устаревшими (без архива)
+                if state["chunk_count"]:
+                    stale_ids.setdefault((state["partition"], False), []).extend(
+                        make_chunk_ids(state["id_prefix"], state["chunk_count"])
+                    )
+            # Оставляем прошлую версию в индексе, попробуем в следующий раз
+            if old_entry:
+                new_entries[relative_file_path] = old_entry
+            continue
+
+        print(f"  [*] Документ '{state['filename']}' разбит на {state['chunk_count']} чанков.")
+        new_entries[relative_file_path] = {
+            **state["entry"], "chunk_count": state["chunk_count"], "partition": state["partition"],
+            "version": state["version"],
+        }
+        if old_entry:
+            stale_ids.setdefault((old_entry.get("partition"), ARCHIVE_VERSIONS_ENABLED), []).extend(
+                entry_chunk_ids(relative_file_path, old_entry)
+            )
+        if not batcher.documents:
+            # Новая версия уже целиком в коллекции: старую убираем сразу
+            remove_stale_chunks()
+        processed_files_count += 1
+
+    # Файлы, которые пропали из директории
+    removed_files = [path for path in old_entries if path not in new_entries]
+    for path in removed_files:
+        print(f"[*] Файл удален из источников: {path}")
+        stale_ids.setdefault((old_entries[path].get("partition"), ARCHIVE_VERSIONS_ENABLED), []).extend(
+            entry_chunk_ids(path, old_entries[path])
+        )
+
+    # Дописываем остаток буфера, и только после этого убираем оставшиеся старые
+    # версии: в любой момент в коллекции есть хотя бы одна версия каждого файла.
+    batcher.flush()
+    remove_stale_chunks()
+    manifest["files"] = new_entries
+    save_manifest(manifest)
+    index_changed = batcher.total_chunks or removed_chunks or collection_reset or migrated_partitions is not None
+    if index_changed or lexical_indexes_missing():
+        # Лексический индекс строится по тому же содержимому коллекций
+        rebuild_lexical_indexes()
+        # Сообщаем серверу, что закэшированные ответы и лексические индексы устарели
+        bump_index_version()
+    total_time = time.perf_counter() - started
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is not None:
+        embedding_cache.save_meta()
 
-            # Добавляем весь текст файла как один документ
-            if text and text.strip():
-                metadata = {
-                    "source": filename,
-                    "category": category,
-                    "doc_type": "knowledge",
-                    "load_date": datetime.now().isoformat()
-                }
-                if process_and_add_text(text, metadata=metadata):
-                    processed_files_count += 1
-            else:
-                print(f"  [!] Файл '{filename}' пуст или не удалось извлечь текст. Пропускается.")
-    
     print("="*50)
+    print(f"Без изменений: {unchanged_files_count} файлов, удалено из источников: {len(removed_files)}.")
+    print(f"Загружено чанков: {batcher.total_chunks} за {total_time:.1f} с "
+          f"(размер пакета: {batcher.batch_size}).")
+    print(f"Скорость векторизации и записи: {batcher.throughput():.1f} чанков/с, "
+          f"общая: {batcher.total_chunks / total_time if total_time else 0:.1f} чанков/с.")
+    if embedding_cache is not None:
+        print(embedding_cache.report())
     if processed_files_count > 0:
         print(f"✅ Успешно обработано и загружено: {processed_files_count} файлов.")
     else:
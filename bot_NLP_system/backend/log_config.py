@@ -0,0 +1,139 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# Уровень логов приложения (логгеры gsp.* и gsp_common.*)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Доля отладочных записей, которые попадут в лог: под нагрузкой
+# подробный вывод каждого запроса не нужен, достаточно выборки
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0.1"))
+# Размер очереди записей. Если фоновый поток не успевает писать,
+# новые записи отбрасываются, а не тормозят обработку запросов.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Логгер нераспознанных запросов пишет в отдельный файл
+UNRECOGNIZED_LOGGER_NAME = "unrecognized"
+APP_LOGGER_NAMES = ("gsp", "gsp_common", UNRECOGNIZED_LOGGER_NAME)
+
+# Стандартные атрибуты LogRecord: все остальное пришло через extra и идет в JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON; поля из extra добавляются как есть."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает все записи уровня INFO и выше и только долю rate отладочных."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class ExcludeFilter(logging.Filter):
+    """Отсекает записи логгера name (и его потомков)."""
+
+    def filter(self, record):
+        return not super().filter(record)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись и считает потери."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(unrecognized_log_path):
+    """
+    Настраивает асинхронное логирование: обработчики логгеров приложения только
+    кладут записи в очередь, а запись в stdout (JSON) и в файл нераспознанных
+    запросов выполняет фоновый поток. Повторный вызов ничего не делает.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(JsonFormatter())
+    stdout_handler.addFilter(ExcludeFilter(UNRECOGNIZED_LOGGER_NAME))
+
+    # Формат файла прежний: дата и сам запрос, его читают люди
+    file_handler = logging.FileHandler(unrecognized_log_path, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    file_handler.addFilter(logging.Filter(UNRECOGNIZED_LOGGER_NAME))
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # Выборка делается до постановки в очередь: отброшенные записи ничего не стоят
+    queue_handler.addFilter(SamplingFilter(DEBUG_LOG_SAMPLE_RATE))
+
+    for name in APP_LOGGER_NAMES:
+        logger = logging.getLogger(name)
+        logger.handlers = [queue_handler]
+        logger.setLevel(logging.INFO if name == UNRECOGNIZED_LOGGER_NAME else LOG_LEVEL)
+        logger.propagate = False
+
+    _queue_handler = queue_handler
+    _listener = logging.handlers.QueueListener(log_queue, stdout_handler, file_handler)
+    _listener.start()
+    # При остановке процесса дописываем то, что осталось в очереди
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_restart_in_child)
+    return _listener
+
+
+def _restart_in_child():
+    """
+    После fork (воркеры gunicorn с preload) фонового потока в дочернем процессе
+    нет: запускаем новый со своей очередью, иначе записи копились бы без вывода.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+def stop_logging():
+    """Останавливает фоновый поток, предварительно записав все записи из очереди."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,68 +1,140 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import asyncio
 import os
-import datetime
+import json
 import logging
+import time
 from collections import defaultdict
 
-from .database import find_similar_documents
-from .gigachat import get_gigachat_response
+from .cache import AnswerCache
+from .log_config import UNRECOGNIZED_LOGGER_NAME, setup_logging, stop_logging
+from .database import aembed_query, afind_lexical_documents, afind_similar_documents_by_embedding, readiness, warm_up
+from .gigachat import aget_gigachat_response, astream_gigachat_response, is_error_answer, warm_up_chat
+from .lexical import has_exact_token
+from .manifest import read_index_version
+from .metrics import (
+    ANSWERS,
+    CACHE_LOOKUPS,
+    CACHE_SAVED_SECONDS,
+    REQUEST_LATENCY,
+    TIMING_HEADER_ENABLED,
+    TimingMiddleware,
+    render_metrics,
+    timed,
+)
 
-# --- Настройка логирования для нераспознанных запросов ---
+# --- Настройка логирования ---
 # Определяем абсолютный путь к папке с логами для надежности
 script_dir = os.path.dirname(os.path.abspath(__file__))
 log_dir = os.path.join(script_dir, "logs")
 os.makedirs(log_dir, exist_ok=True)
 log_file_path = os.path.join(log_dir, "unrecognized_requests.log")
 
-# Создаем логгер для нераспознанных запросов
-unrecognized_logger = logging.getLogger('unrecognized')
-unrecognized_logger.setLevel(logging.INFO)
-# Создаем обработчик для записи в файл
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-# Создаем форматтер, чтобы в логе была дата и сам запрос
-formatter = logging.Formatter('%(asctime)s - %(message)s')
-file_handler.setFormatter(formatter)
-# Избегаем двойного добавления обработчика
-if not unrecognized_logger.hasHandlers():
-    unrecognized_logger.addHandler(file_handler)
+# Записи уходят в очередь, а в stdout (JSON) и в файл нераспознанных
+# запросов их пишет фоновый поток, не задерживая обработку запросов.
+setup_logging(log_file_path)
+logger = logging.getLogger("gsp.api")
+# Логгер для нераспознанных запросов
+unrecognized_logger = logging.getLogger(UNRECOGNIZED_LOGGER_NAME)
 # -----------------------------
 
+# Подробный лог каждого запроса с заголовками. Только для отладки:
+# включается переменной DEBUG_REQUESTS=1, записи прореживаются (DEBUG_LOG_SAMPLE_RATE).
+DEBUG_REQUESTS = os.getenv("DEBUG_REQUESTS", "0") == "1"
+
+
 # --- Отладочный Middleware для перехвата всех запросов ---
 class DebugMiddleware:
     def __init__(self, app):
         self.app = app
+        self.logger = logging.getLogger("gsp.requests")
+        self.logger.setLevel(logging.DEBUG)
 
     async def __call__(self, scope, receive, send):
         if scope["type"] == "http":
-            request = Request(scope, receive)
-            print("="*30)
-            print(f"DEBUG: Получен запрос: {request.method} {request.url.path}")
-            print("DEBUG: Заголовки:")
-            for name, value in request.headers.items():
-                print(f"  -> {name}: {value}")
-            print("="*30)
-        
+            self.logger.debug(
+                "Получен запрос",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "headers": {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]},
+                },
+            )
         await self.app(scope, receive, send)
 
 
+# Ошибка фоновой инициализации поиска (для /readyz)
+startup_error = None
+
+
+async def warm_up_search():
+    """Открывает базу и загружает модель в фоне, не задерживая старт сервера."""
+    global startup_error
+    started = time.perf_counter()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    except Exception as e:
+        startup_error = str(e)
+        logger.exception("Не удалось инициализировать поиск")
+        return
+    logger.info("Поиск готов к работе", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Прогреваем клиент GigaChat в фоне: сервер начинает принимать запросы сразу,
+    # а токен и соединение будут готовы к первому вопросу пользователя.
+    asyncio.get_running_loop().run_in_executor(None, warm_up_chat)
+    # Модель и Chroma тоже загружаются в фоне; пока они не готовы, /readyz отвечает 503
+    search_task = asyncio.create_task(warm_up_search())
+    yield
+    search_task.cancel()
+    # Дописываем логи, оставшиеся в очереди
+    stop_logging()
+
+
 app = FastAPI(
     title="GSP Keys Assistant API",
     description="Интеллектуальный ассистент для помощи сотрудникам.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- Добавляем Middleware ---
 # Сначала наш отладочный, чтобы он сработал первым
-app.add_middleware(DebugMiddleware)
+if DEBUG_REQUESTS:
+    app.add_middleware(DebugMiddleware)
+if TIMING_HEADER_ENABLED:
+    # Разбивка времени по этапам в заголовке Server-Timing каждого ответа
+    app.add_middleware(TimingMiddleware)
 
 # Порог уверенности. Если схожесть лучшего документа ниже, считаем ответ неуверенным.
 CONFIDENCE_THRESHOLD = 0.5 
 # Порог релевантности. Если схожесть ЛУЧШЕГО документа ниже, считаем, что ничего не найдено.
 SUGGESTION_THRESHOLD = 0.3 
-# Категория для каталога ИТ-услуг (должна совпадать с именем папки)
-IT_SERVICE_CATALOG_CATEGORY = "it_service_catalog"
+
+# --- Лексический быстрый путь ---
+# Если в запросе есть точный токен с цифрами ("СПИ-20", код услуги, добавочный номер)
+# и лексический индекс находит чанк, где есть не меньше этой доли значимых слов
+# запроса, ответ строится без векторизации запроса.
+LEXICAL_SHORTCUT_ENABLED = os.getenv("LEXICAL_SHORTCUT", "1") == "1"
+LEXICAL_SHORTCUT_SCORE = float(os.getenv("LEXICAL_SHORTCUT_SCORE", "0.9"))
+
+# --- Кэш готовых ответов ---
+# Повторяющиеся вопросы отдаются из кэша без поиска и обращения к GigaChat.
+# Похожим считается запрос, чей вектор близок к закэшированному не меньше порога.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+answer_cache = AnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+    version_getter=read_index_version,
+) if ANSWER_CACHE_ENABLED else None
 
 
 # Настройка CORS
@@ -95,33 +167,77 @@ UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-def filter_latest_documents(docs, metadatas):
+@dataclass
+class AnswerPlan:
     """
-    Фильтрует список документов, оставляя только самые новые версии для каждого источника.
+    Результат поиска по базе: что и откуда отвечать.
+    Если llm_kwargs заданы, текст ответа генерирует GigaChat (после answer_prefix),
+    иначе готовый текст лежит в answer. stage — шаг каскада, давший ответ (для метрик).
     """
-    if not docs:
-        return [], []
+    stage: str
+    source: str
+    confident: bool
+    show_fallback_button: bool = False
+    suggestions: list = field(default_factory=list)
+    answer: str = ""
+    answer_prefix: str = ""
+    llm_kwargs: dict = None
+
+    def metadata(self):
+        return {
+            "source": self.source,
+            "confident": self.confident,
+            "suggestions": self.suggestions,
+            "show_fallback_button": self.show_fallback_button,
+        }
 
-    latest_docs = {}
-    for i, meta in enumerate(metadatas):
-        source = meta.get("source")
-        # Убедимся, что дата в правильном формате и сравнима
-        load_date_str = meta.get("load_date")
-        if not source or not load_date_str:
-            continue
-        
-        load_date = datetime.datetime.fromisoformat(load_date_str)
+    def to_response(self, answer):
+        return QueryResponse(answer=answer, **self.metadata())
 
-        if source not in latest_docs or load_date > latest_docs[source]["date"]:
-            latest_docs[source] = {"date": load_date, "doc": docs[i], "meta": meta}
 
-    # Собираем отфильтрованные списки
-    filtered_docs = [data["doc"] for data in latest_docs.values()]
-    filtered_metadatas = [data["meta"] for data in latest_docs.values()]
-    
-    print(f"  [ИНФО] Фильтрация версий: из {len(docs)} документов оставлено {len(filtered_docs)} уникальных и самых новых.")
-    
-    return filtered_docs, filtered_metadatas
+async def resolve_query(query):
+    """
+    Ищет, чем ответить, от дешевых путей к дорогим: кэш по тексту запроса,
+    лексическое совпадение точного токена, затем векторизация, кэш по вектору
+    и многоступенчатый поиск.
+    Возвращает (ответ из кэша или None, план ответа или None, вектор запроса или None).
+    """
+    if answer_cache is not None:
+        saved_before = answer_cache.saved_seconds
+        with timed("cache_exact"):
+            cached = answer_cache.get_exact(query)
+        if cached is not None:
+            logger.debug("Ответ найден в кэше по тексту запроса")
+            CACHE_LOOKUPS.labels("exact_hit").inc()
+            CACHE_SAVED_SECONDS.inc(answer_cache.saved_seconds - saved_before)
+            return cached, None, None
+
+    with timed("lexical_shortcut"):
+        plan = await plan_lexical_answer(query)
+    if plan is not None:
+        return None, plan, None
+
+    # Векторизуем запрос один раз: один и тот же вектор используется на всех шагах
+    with timed("embed"):
+        query_embedding = await aembed_query(query)
+
+    if answer_cache is not None:
+        saved_before = answer_cache.saved_seconds
+        with timed("cache_semantic"):
+            cached = answer_cache.get_similar(query_embedding)
+        if cached is not None:
+            logger.debug("Ответ найден в кэше по похожему запросу")
+            CACHE_LOOKUPS.labels("semantic_hit").inc()
+            CACHE_SAVED_SECONDS.inc(answer_cache.saved_seconds - saved_before)
+            return cached, None, query_embedding
+        CACHE_LOOKUPS.labels("miss").inc()
+    return None, await plan_answer(query, query_embedding), query_embedding
+
+
+def store_in_answer_cache(query, query_embedding, response, started):
+    """Кэширует ответ, кроме ошибок GigaChat и нераспознанных запросов (их нужно логировать каждый раз)."""
+    if answer_cache is not None and response.source != "Не найдено" and not is_error_answer(response.answer):
+        answer_cache.put(query, query_embedding, response, time.perf_counter() - started)
 
 
 @app.post("/ask", response_model=QueryResponse, summary="Задать вопрос ассистенту")
@@ -132,108 +248,228 @@ async def ask_question(request: QueryRequest):
     2. Поиск в базе знаний (памятки).
     3. Поиск в примерах заявок для маршрутизации.
     4. Ответ по-умолчанию с контактами поддержки.
+    Повторные и близкие по смыслу вопросы обслуживаются из кэша ответов.
     """
     query = request.query
-    print(f"\n{'='*20}\nНОВЫЙ ЗАПРОС: '{query}'\n{'='*20}")
 
-    # --- Шаг 1: Поиск в каталоге ИТ-услуг ---
-    print(f"-> Шаг 1: Поиск в каталоге ИТ-услуг ('{IT_SERVICE_CATALOG_CATEGORY}')...")
-    it_docs, it_scores, it_metadatas = find_similar_documents(
-        query, n_results=1, where_filter={"category": IT_SERVICE_CATALOG_CATEGORY}
+    started = time.perf_counter()
+    cached, plan, query_embedding = await resolve_query(query)
+    if cached is not None:
+        ANSWERS.labels("cache").inc()
+        duration = time.perf_counter() - started
+        REQUEST_LATENCY.labels("/ask").observe(duration)
+        logger.info("Запрос обработан", extra={
+            "endpoint": "/ask", "query": query, "stage": "cache", "duration_ms": round(duration * 1000, 1),
+        })
+        return cached
+
+    answer = plan.answer
+    if plan.llm_kwargs is not None:
+        answer = plan.answer_prefix + await aget_gigachat_response(**plan.llm_kwargs)
+    response = plan.to_response(answer)
+
+    store_in_answer_cache(query, query_embedding, response, started)
+    ANSWERS.labels(plan.stage).inc()
+    duration = time.perf_counter() - started
+    REQUEST_LATENCY.labels("/ask").observe(duration)
+    logger.info("Запрос обработан", extra={
+        "endpoint": "/ask", "query": query, "stage": plan.stage, "source": plan.source,
+        "duration_ms": round(duration * 1000, 1),
+    })
+    return response
+
+
+def sse_event(event, data):
+    """Форматирует одно событие server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_answer(query):
+    """
+    Генератор событий для /ask/stream:
+    meta — источник и подсказки сразу после поиска, token — фрагменты ответа
+    по мере генерации, done — замеры времени (мс от начала запроса).
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    def elapsed_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    try:
+        cached, plan, query_embedding = await resolve_query(query)
+        if cached is not None:
+            ANSWERS.labels("cache").inc()
+            yield sse_event("meta", cached.model_dump(exclude={"answer"}))
+            timings["meta_ms"] = timings["first_token_ms"] = elapsed_ms()
+            yield sse_event("token", {"text": cached.answer})
+        else:
+            ANSWERS.labels(plan.stage).inc()
+            yield sse_event("meta", plan.metadata())
+            timings["meta_ms"] = elapsed_ms()
+
+            if plan.llm_kwargs is None:
+                parts = [plan.answer]
+                timings["first_token_ms"] = elapsed_ms()
+                yield sse_event("token", {"text": plan.answer})
+            else:
+                parts = [plan.answer_prefix]
+                if plan.answer_prefix:
+                    yield sse_event("token", {"text": plan.answer_prefix})
+                async for token in astream_gigachat_response(**plan.llm_kwargs):
+                    if "first_token_ms" not in timings:
+                        timings["first_token_ms"] = elapsed_ms()
+                    parts.append(token)
+                    yield sse_event("token", {"text": token})
+
+            response = plan.to_response("".join(parts))
+            store_in_answer_cache(query, query_embedding, response, started)
+    except Exception as e:
+        logger.exception("Ошибка при потоковой обработке запроса", extra={"query": query})
+        yield sse_event("error", {"detail": "Внутренняя ошибка сервера"})
+        return
+
+    timings["total_ms"] = elapsed_ms()
+    REQUEST_LATENCY.labels("/ask/stream").observe(timings["total_ms"] / 1000)
+    logger.info("Запрос обработан", extra={"endpoint": "/ask/stream", "query": query, **timings})
+    yield sse_event("done", timings)
+
+
+@app.post("/ask/stream", summary="Задать вопрос ассистенту (потоковый ответ)")
+async def ask_question_stream(request: QueryRequest):
+    """
+    То же, что /ask, но ответ приходит потоком server-sent events: метаданные
+    поиска отправляются сразу, а текст — по мере генерации GigaChat.
+    """
+    return StreamingResponse(
+        stream_answer(request.query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    # Проверяем, что лучший результат хоть сколько-нибудь релевантен
-    if it_docs and it_scores[0] >= SUGGESTION_THRESHOLD:
-        # Фильтруем по последней версии
-        it_docs, it_metadatas = filter_latest_documents(it_docs, it_metadatas)
-        
-        if it_docs and it_scores[0] >= CONFIDENCE_THRESHOLD:
-            service_name = it_metadatas[0].get('service_name', 'услугу')
-            source_file = it_metadatas[0].get("source", "Каталог ИТ-услуг")
-            
-            # Формируем уточняющий ответ
-            answer = f"Похоже, вас интересует '{service_name}'. Я нашел информацию об этом в каталоге ИТ-услуг. Готовлю ответ..."
-            
-            # Получаем полный ответ от GigaChat на основе найденного контекста
-            full_answer = get_gigachat_response(
-                user_prompt=query,
-                context_documents=it_docs,
-                is_confident=True,
-                found_in="it_catalog"
-            )
-            final_answer = f"{answer}\n\n---\n\n{full_answer}"
-            
-            return QueryResponse(answer=final_answer, source=source_file, confident=True, show_fallback_button=True)
 
-    print("  [ИНФО] В каталоге ИТ-услуг точного ответа не найдено.")
+def it_catalog_plan(query, it_docs, it_metadatas, stage="it_catalog"):
+    """Ответ по найденной услуге из каталога ИТ-услуг."""
+    service_name = it_metadatas[0].get('service_name', 'услугу')
+    source_file = it_metadatas[0].get("source", "Каталог ИТ-услуг")
 
-    # --- Шаг 2: Поиск в остальной базе знаний (памятки) ---
-    print(f"-> Шаг 2: Поиск в общей базе знаний (памятки)...")
-    knowledge_docs, knowledge_scores, knowledge_metadatas = find_similar_documents(
-        query, n_results=3, where_filter={
-            "$and": [
-                {"doc_type": {"$eq": "knowledge"}},
-                {"category": {"$ne": IT_SERVICE_CATALOG_CATEGORY}}
-            ]
-        }
+    # Формируем уточняющий ответ
+    answer = f"Похоже, вас интересует '{service_name}'. Я нашел информацию об этом в каталоге ИТ-услуг. Готовлю ответ..."
+
+    # Полный ответ GigaChat на основе найденного контекста пойдет после уточнения
+    return AnswerPlan(
+        stage=stage, source=source_file, confident=True, show_fallback_button=True,
+        answer_prefix=f"{answer}\n\n---\n\n",
+        llm_kwargs=dict(user_prompt=query, context_documents=it_docs, is_confident=True, found_in="it_catalog"),
+    )
+
+
+def knowledge_plan(query, confident_docs, knowledge_metadatas, stage="knowledge"):
+    """Ответ по уверенно найденным документам базы знаний."""
+    source_file = knowledge_metadatas[0].get("source", "База знаний")
+    return AnswerPlan(
+        stage=stage, source=source_file, confident=True, show_fallback_button=True,
+        llm_kwargs=dict(user_prompt=query, context_documents=confident_docs, is_confident=True),
+    )
+
+
+async def plan_lexical_answer(query):
+    """
+    Быстрый путь без векторизации для запросов с точным токеном ("СПИ-20",
+    код услуги, добавочный номер): шаги 1 и 2 каскада по лексическому индексу.
+    Возвращает план ответа или None, если уверенного лексического совпадения нет.
+    """
+    if not LEXICAL_SHORTCUT_ENABLED or not has_exact_token(query):
+        return None
+
+    it_docs, it_scores, it_metadatas = await afind_lexical_documents(query, "it_catalog", n_results=1)
+    if it_docs and it_scores[0] >= LEXICAL_SHORTCUT_SCORE:
+        return it_catalog_plan(query, it_docs, it_metadatas, stage="lexical_it_catalog")
+
+    knowledge_docs, knowledge_scores, knowledge_metadatas = await afind_lexical_documents(
+        query, "knowledge", n_results=3
     )
+    confident_docs = [doc for doc, score in zip(knowledge_docs, knowledge_scores) if score >= LEXICAL_SHORTCUT_SCORE]
+    if confident_docs:
+        return knowledge_plan(query, confident_docs, knowledge_metadatas, stage="lexical_knowledge")
+    return None
+
+
+async def plan_answer(query, query_embedding):
+    """
+    Многоступенчатый поиск по уже векторизованному запросу.
+    Обращения к GigaChat здесь нет — только решение, чем отвечать.
+    """
+    # --- Шаг 1: Поиск в каталоге ИТ-услуг ---
+    logger.debug("Шаг 1: поиск в каталоге ИТ-услуг")
+    with timed("search_it_catalog"):
+        it_docs, it_scores, it_metadatas = await afind_similar_documents_by_embedding(
+            query_embedding, n_results=1, partition="it_catalog", query_text=query
+        )
+
+    # В индексе только последние версии документов, отбрасывать устаревшие не нужно
+    if it_docs and it_scores[0] >= CONFIDENCE_THRESHOLD:
+        return it_catalog_plan(query, it_docs, it_metadatas)
+
+    # --- Шаг 2: Поиск в остальной базе знаний (памятки) ---
+    logger.debug("Шаг 2: поиск в общей базе знаний", extra={"it_catalog_score": it_scores[0] if it_scores else None})
+    with timed("search_knowledge"):
+        knowledge_docs, knowledge_scores, knowledge_metadatas = await afind_similar_documents_by_embedding(
+            query_embedding, n_results=3, partition="knowledge", query_text=query
+        )
 
     # Проверяем, что лучший результат хоть сколько-нибудь релевантен
     if knowledge_docs and knowledge_scores[0] >= SUGGESTION_THRESHOLD:
-        # Фильтруем по последней версии
-        knowledge_docs, knowledge_metadatas = filter_latest_documents(knowledge_docs, knowledge_metadatas)
-        
         # Отбираем те, что прошли порог уверенности
         confident_docs = [knowledge_docs[i] for i, score in enumerate(knowledge_scores) if score >= CONFIDENCE_THRESHOLD]
 
         if confident_docs:
-            print(f"  [УСПЕХ] Найдены релевантные документы в базе знаний.")
-            source_file = knowledge_metadatas[0].get("source", "База знаний")
-            answer = get_gigachat_response(
-                user_prompt=query,
-                context_documents=confident_docs,
-                is_confident=True
-            )
-            return QueryResponse(answer=answer, source=source_file, confident=True, show_fallback_button=True)
+            return knowledge_plan(query, confident_docs, knowledge_metadatas)
         else:
-            print("  [ИНФО] Уверенных ответов нет, но есть похожие темы. Предлагаем варианты.")
             # Для подсказок берем только те категории, что прошли минимальный порог
             relevant_metadatas = [knowledge_metadatas[i] for i, score in enumerate(knowledge_scores) if score >= SUGGESTION_THRESHOLD]
             suggestions = sorted(list(set(meta.get("category", "Без категории") for meta in relevant_metadatas if meta)))
             answer = "Я не нашел точного ответа, но, возможно, вас интересует одна из этих тем?"
-            return QueryResponse(answer=answer, source="Предложены варианты", confident=False, suggestions=suggestions)
-
-    print("  [ИНФО] В общей базе знаний ничего релевантного не найдено.")
+            return AnswerPlan(
+                stage="knowledge_suggestions", answer=answer, source="Предложены варианты",
+                confident=False, suggestions=suggestions,
+            )
 
     # --- Шаг 3: Попытка маршрутизации запроса ---
-    print("-> Шаг 3: Поиск примеров для маршрутизации...")
-    routing_docs, routing_scores, routing_metadatas = find_similar_documents(
-        query, n_results=3, where_filter={"doc_type": "routing_example"}
-    )
+    logger.debug("Шаг 3: поиск примеров для маршрутизации",
+                 extra={"knowledge_score": knowledge_scores[0] if knowledge_scores else None})
+    with timed("search_routing"):
+        routing_docs, routing_scores, routing_metadatas = await afind_similar_documents_by_embedding(
+            query_embedding, n_results=3, partition="routing", query_text=query
+        )
     
     # Проверяем, что лучший результат хоть сколько-нибудь релевантен
     if routing_docs and routing_scores[0] >= SUGGESTION_THRESHOLD:
         if routing_scores[0] >= 0.4: # Порог для маршрутизации можно оставить пониже
             department = routing_metadatas[0].get("department")
             if department:
-                print(f"  [УСПЕХ] Запрос классифицирован. Направляется в отдел: '{department}'.")
-                answer = get_gigachat_response(user_prompt=query, context_documents=[], is_confident=False, routing_info={"department": department})
-                return QueryResponse(answer=answer, source=f"Маршрутизация в '{department}'", confident=True, show_fallback_button=True)
+                return AnswerPlan(
+                    stage="routing", source=f"Маршрутизация в '{department}'", confident=True, show_fallback_button=True,
+                    llm_kwargs=dict(user_prompt=query, context_documents=[], is_confident=False, routing_info={"department": department}),
+                )
         else:
-            print("  [ИНФО] Уверенной маршрутизации нет. Предлагаем варианты отделов.")
             # Для подсказок берем только те отделы, что прошли минимальный порог
             relevant_metadatas = [routing_metadatas[i] for i, score in enumerate(routing_scores) if score >= SUGGESTION_THRESHOLD]
             suggestions = sorted(list(set(meta.get("department", "Неизвестный отдел") for meta in relevant_metadatas if meta)))
             answer = "Я не смог точно определить нужный отдел. Возможно, ваш запрос следует направить в один из этих?"
-            return QueryResponse(answer=answer, source="Предложены варианты маршрутизации", confident=False, suggestions=suggestions)
-
-    print("  [ИНФО] Не удалось найти примеры для маршрутизации.")
+            return AnswerPlan(
+                stage="routing_suggestions", answer=answer, source="Предложены варианты маршрутизации",
+                confident=False, suggestions=suggestions,
+            )
 
     # --- Шаг 4: Если ничего не помогло ---
-    print("-> Шаг 4: Ответ по умолчанию (контакты поддержки).")
+    logger.debug("Шаг 4: ответ по умолчанию (контакты поддержки)",
+                 extra={"routing_score": routing_scores[0] if routing_scores else None})
     unrecognized_logger.info(query)
-    answer = get_gigachat_response(query, [], is_confident=False)
-    return QueryResponse(answer=answer, source="Не найдено", confident=False, show_fallback_button=False)
+    return AnswerPlan(
+        stage="not_found", source="Не найдено", confident=False, show_fallback_button=False,
+        llm_kwargs=dict(user_prompt=query, context_documents=[], is_confident=False),
+    )
 
 
 @app.post("/fallback", response_model=QueryResponse, summary="Обработка 'не получил ответ'")
@@ -243,9 +479,42 @@ async def fallback_response(request: QueryRequest):
     Логирует запрос и возвращает стандартный ответ с контактами поддержки.
     """
     query = request.query
-    print(f"-> Fallback: Пользователь не удовлетворен ответом на запрос '{query}'.")
+    logger.info("Пользователь не получил ответ (fallback)", extra={"endpoint": "/fallback", "query": query})
     unrecognized_logger.info(f"FALLBACK: {query}") # Делаем пометку, что это был fallback
     
     # Возвращаем стандартный ответ с контактами
-    answer = get_gigachat_response(user_prompt="", context_documents=[], is_confident=False)
+    answer = await aget_gigachat_response(user_prompt="", context_documents=[], is_confident=False)
     return QueryResponse(answer=answer, source="Поддержка", confident=False, show_fallback_button=False)
+
+
+@app.get("/cache/stats", summary="Статистика кэша ответов")
+async def cache_stats():
+    """Возвращает число попаданий и промахов кэша и сэкономленное время."""
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+
+@app.get("/healthz", summary="Проверка, что процесс жив")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz", summary="Проверка готовности к обработке запросов")
+async def readyz():
+    ready, details = readiness()
+    if startup_error:
+        details["error"] = startup_error
+    status = "ready" if ready else "error" if startup_error else "starting"
+    return JSONResponse({"status": status, **details}, status_code=200 if ready else 503)
+
+
+@app.get("/metrics", summary="Метрики в формате Prometheus")
+async def metrics():
+    """
+    Гистограммы времени запросов и этапов (кэш ответов, векторизация, лексический
+    поиск, поиск по каждому разделу, переоценка кросс-энкодером, GigaChat),
+    счетчики шагов каскада, обращений к кэшу, вызовов GigaChat и переоценок.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
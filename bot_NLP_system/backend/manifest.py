@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import time
+
+# Манифест индекса хранится рядом с базой: если удалить папку chroma,
+# вместе с ней пропадет и манифест, и следующая загрузка будет полной.
+script_dir = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(script_dir, "chroma", "index_manifest.json")
+# Файл-метка версии индекса. Загрузчик обновляет его при каждом изменении
+# коллекции, а сервер по нему понимает, что кэш ответов устарел.
+INDEX_VERSION_PATH = os.path.join(script_dir, "chroma", "index_version")
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Читает манифест индекса. Возвращает None, если манифеста еще нет
+    (база создавалась до появления инкрементальной загрузки или пуста).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Атомарно сохраняет манифест: пишем во временный файл и подменяем."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest["format"] = MANIFEST_FORMAT_VERSION
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def bump_index_version(path=INDEX_VERSION_PATH):
+    """Отмечает, что содержимое коллекции изменилось."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(str(time.time_ns()))
+
+
+def read_index_version(path=INDEX_VERSION_PATH):
+    """Текущая версия индекса (время последнего изменения метки) или None."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """Считает SHA-256 содержимого файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_unchanged(entry, stat_result):
+    """Быстрая проверка без чтения файла: совпадают ли размер и время изменения."""
+    return (
+        entry is not None
+        and entry.get("size") == stat_result.st_size
+        and entry.get("mtime") == stat_result.st_mtime_ns
+    )
+
+
+def chunk_id_prefix(relative_path, content_hash):
+    """
+    Префикс ID чанков одной версии файла. ID детерминированы: повторная
+    загрузка той же версии перезаписывает те же записи, а не плодит дубликаты.
+    """
+    path_hash = hashlib.sha1(relative_path.encode('utf-8')).hexdigest()[:16]
+    return f"{path_hash}-{content_hash[:16]}"
+
+
+def make_chunk_ids(prefix, count, start=0):
+    """ID чанков с номерами start..start+count-1 для заданного префикса."""
+    return [f"{prefix}-{i}" for i in range(start, start + count)]
+
+
+def entry_chunk_ids(relative_path, entry):
+    """Все ID чанков версии файла, записанной в манифесте."""
+    prefix = chunk_id_prefix(relative_path, entry["sha256"])
+    return make_chunk_ids(prefix, entry.get("chunk_count", 0))
@@ -0,0 +1,125 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# Заголовок Server-Timing с разбивкой времени по этапам (видно во вкладке Network
+# браузера). По умолчанию выключен: раскрывает внутреннее устройство сервиса.
+TIMING_HEADER_ENABLED = os.getenv("TIMING_HEADER", "0") == "1"
+
+# Границы корзин гистограмм в секундах: от миллисекунд (поиск, кэш)
+# до десятков секунд (генерация ответа GigaChat)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "gsp_stage_duration_seconds",
+    "Время выполнения этапов обработки запроса",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "gsp_request_duration_seconds",
+    "Полное время обработки запроса к ассистенту",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+ANSWERS = Counter(
+    "gsp_answers_total",
+    "Ответы по шагу каскада, на котором они были найдены",
+    ["stage"],
+)
+CACHE_LOOKUPS = Counter(
+    "gsp_answer_cache_lookups_total",
+    "Обращения к кэшу ответов: exact_hit, semantic_hit или miss",
+    ["result"],
+)
+CACHE_SAVED_SECONDS = Counter(
+    "gsp_answer_cache_saved_seconds_total",
+    "Время расчета ответов, сэкономленное кэшем",
+)
+LLM_CALLS = Counter(
+    "gsp_llm_calls_total",
+    "Обращения к GigaChat: ok, error, init_error или local (ответ без модели)",
+    ["result"],
+)
+RERANKS = Counter(
+    "gsp_reranks_total",
+    "Переоценки кросс-энкодером: full, partial (часть кандидатов не уложилась в бюджет) или fallback",
+    ["result"],
+)
+
+# Замеры этапов текущего запроса для заголовка Server-Timing.
+# Список создает middleware; вне запроса (загрузчик, тесты) он не нужен.
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def record_span(stage, seconds):
+    """Учитывает замер этапа в гистограмме и в заголовке текущего запроса."""
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage):
+    """Контекстный менеджер: замеряет время блока как этап stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def render_metrics():
+    """Метрики в текстовом формате Prometheus: (тело, content-type)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Несколько воркеров gunicorn: метрики каждого процесса лежат в файлах
+        # каталога PROMETHEUS_MULTIPROC_DIR и суммируются при чтении
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def format_server_timing(spans):
+    """Значение заголовка Server-Timing: повторяющиеся этапы суммируются."""
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+class TimingMiddleware:
+    """
+    Собирает замеры этапов каждого запроса и добавляет их в заголовок Server-Timing.
+    У потоковых ответов (/ask/stream) заголовок уходит раньше, чем начинается
+    поиск, поэтому для них он не добавляется: замеры есть в событии done.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and spans:
+                total = ("total", time.perf_counter() - started)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(spans + [total]).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Переоценка кандидатов поиска кросс-энкодером: модель читает запрос и текст
+# чанка вместе и точнее би-энкодера отличает релевантный чанк от похожего
+# по словам. Дороже векторного поиска, поэтому применяется только к
+# нескольким десяткам кандидатов и укладывается в бюджет времени на запрос.
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+# Небольшая многоязычная модель, работает на CPU
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# Разделы индекса, в которых результаты переоцениваются
+RERANK_PARTITIONS = tuple(os.getenv("RERANK_PARTITIONS", "knowledge").split(","))
+# Сколько кандидатов брать из поиска для переоценки
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Пар (запрос, чанк) в одном прогоне модели
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+# Бюджет времени на переоценку в одном запросе
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# Сколько оценок пар (запрос, чанк) держать в памяти
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+
+
+class ScoreCache:
+    """LRU-кэш оценок кросс-энкодера по паре (запрос, ID чанка)."""
+
+    def __init__(self, max_size=RERANK_CACHE_SIZE):
+        self.max_size = max_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query, chunk_id):
+        with self._lock:
+            score = self._scores.get((query, chunk_id))
+            if score is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end((query, chunk_id))
+            self.hits += 1
+            return score
+
+    def put(self, query, chunk_id, score):
+        with self._lock:
+            self._scores[(query, chunk_id)] = score
+            self._scores.move_to_end((query, chunk_id))
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+
+class Reranker:
+    """
+    Кросс-энкодер sentence-transformers. Его оценки задают только порядок
+    кандидатов: шкала у них своя, и пороги уверенности ответа, подобранные
+    для векторной (гибридной) схожести, к ним неприменимы.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000
+        self.cache = ScoreCache()
+
+    def predict(self, pairs):
+        return [float(score) for score in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+    def rerank(self, query, ids, documents, scores, metadatas, n_results):
+        """
+        Переоценивает кандидатов (в порядке исходного поиска) пакетами, пока
+        укладывается в бюджет времени, и возвращает n_results лучших по оценке
+        кросс-энкодера, но с их исходными оценками поиска: по ним вызывающий
+        код сравнивает результат с порогами уверенности. Если в бюджет уложилось меньше n_results кандидатов,
+        возвращает исходную выдачу. Результат: (документы, оценки, метаданные, исход),
+        исход — "full", "partial" или "fallback".
+        """
+        rerank_scores = [self.cache.get(query, chunk_id) for chunk_id in ids]
+        pending = [i for i, score in enumerate(rerank_scores) if score is None]
+        started = time.perf_counter()
+        batch_seconds = 0.0
+        while pending:
+            elapsed = time.perf_counter() - started
+            # Первый пакет считаем всегда; следующий — если он, судя по прошлым, успеет
+            if batch_seconds and elapsed + batch_seconds > self.budget:
+                break
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            batch_started = time.perf_counter()
+            for i, score in zip(batch, self.predict([(query, documents[i]) for i in batch])):
+                rerank_scores[i] = score
+                self.cache.put(query, ids[i], score)
+            batch_seconds = time.perf_counter() - batch_started
+
+        scored = [i for i, score in enumerate(rerank_scores) if score is not None]
+        if len(scored) < min(n_results, len(ids)):
+            top = range(min(n_results, len(ids)))
+            return [documents[i] for i in top], [scores[i] for i in top], [metadatas[i] for i in top], "fallback"
+        scored.sort(key=lambda i: rerank_scores[i], reverse=True)
+        top = scored[:n_results]
+        outcome = "partial" if pending else "full"
+        return [documents[i] for i in top], [scores[i] for i in top], [metadatas[i] for i in top], outcome
@@ -0,0 +1,2 @@
+# Скрипты для замеров производительности. Запуск из папки bot_NLP_system:
+#   python -m benchmarks.<имя_скрипта>
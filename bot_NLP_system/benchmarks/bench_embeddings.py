@@ -0,0 +1,202 @@
+"""
+Сравнение бэкендов векторизации: PyTorch fp32 (текущий), PyTorch int8,
+ONNX Runtime и ONNX Runtime int8.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы честно измерить
+время загрузки и память (RSS). Для каждого замеряются:
+  - задержка векторизации одного запроса (p50/p99);
+  - пропускная способность при concurrency одновременных запросов
+    без объединения и через MicroBatcher;
+  - совпадение с текущей моделью: средний косинус векторов запросов
+    и доля общих документов в top-k поиска по корпусу.
+
+Корпус — чанки из лексических индексов (backend/chroma/lexical), если они
+построены, иначе небольшой встроенный набор текстов.
+ONNX-модели нужно подготовить заранее: python -m backend.embeddings export
+
+Пример:
+    python -m benchmarks.bench_embeddings --backends torch,onnx,onnx-int8 --concurrency 16
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUERIES = [
+    "Как подключить VPN из дома?",
+    "Не работает принтер на третьем этаже",
+    "Что такое СПИ-20?",
+    "Как получить доступ к общей папке отдела?",
+    "Забыл пароль от учетной записи",
+    "Где заказать справку 2-НДФЛ?",
+    "Как оформить командировку?",
+    "Нужен новый монитор, куда обратиться?",
+    "Как настроить корпоративную почту на телефоне?",
+    "Кто согласует отпуск?",
+    "Не открывается 1С",
+    "Как получить пропуск для гостя?",
+    "Сломался ноутбук",
+    "Как установить программу, если нет прав администратора?",
+    "Куда сдать больничный лист?",
+    "Как подать заявку на обучение?",
+]
+
+FALLBACK_CORPUS = QUERIES + [
+    "Для подключения к VPN установите клиент и войдите под доменной учетной записью.",
+    "Заявки на ремонт оргтехники принимает служба поддержки по добавочному 1234.",
+    "СПИ-20 — стандарт предприятия по работе с инцидентами.",
+    "Доступ к сетевым ресурсам предоставляется по заявке руководителя подразделения.",
+    "Сброс пароля выполняется через портал самообслуживания.",
+    "Справки о доходах выдает бухгалтерия в течение трех рабочих дней.",
+    "Командировки оформляются в системе электронного документооборота.",
+    "Пропуска для посетителей заказывает секретарь подразделения.",
+]
+
+
+def read_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_corpus(limit):
+    from backend.lexical import LEXICAL_DIR, LexicalIndex
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(LEXICAL_DIR, "*.npz"))):
+        documents.extend(LexicalIndex.load(path).documents)
+    return (documents or FALLBACK_CORPUS)[:limit]
+
+
+def throughput(embed_one, texts, concurrency):
+    """Запросов в секунду при concurrency потоках, каждый векторизует по одному тексту."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embed_one, texts))
+    return len(texts) / (time.perf_counter() - started)
+
+
+def run_worker(args):
+    """Замеры одного бэкенда; результат — JSON в stdout, векторы — в файлы .npy."""
+    from backend.embeddings import MicroBatcher, create_embedding_backend
+
+    rss_before = read_rss_mb()
+    started = time.perf_counter()
+    backend = create_embedding_backend(args.worker)
+    backend(["прогрев"])
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    for i in range(args.rounds):
+        query = QUERIES[i % len(QUERIES)]
+        started = time.perf_counter()
+        backend([query])
+        latencies.append(time.perf_counter() - started)
+
+    texts = [QUERIES[i % len(QUERIES)] for i in range(args.requests)]
+    sequential = throughput(lambda text: backend([text])[0], texts, args.concurrency)
+    batcher = MicroBatcher(backend)
+    batched = throughput(batcher, texts, args.concurrency)
+
+    corpus = load_corpus(args.corpus_size)
+    corpus_vectors = []
+    for start in range(0, len(corpus), 64):
+        corpus_vectors.extend(backend(corpus[start:start + 64]))
+    np.save(os.path.join(args.output, f"{args.worker}-queries.npy"), np.array(backend(QUERIES)))
+    np.save(os.path.join(args.output, f"{args.worker}-corpus.npy"), np.array(corpus_vectors))
+
+    print(json.dumps({
+        "backend": args.worker,
+        "load_s": load_seconds,
+        "rss_mb": read_rss_mb() - rss_before,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps_single": sequential,
+        "rps_batched": batched,
+        "avg_batch": batcher.texts / max(batcher.batches, 1),
+    }))
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def agreement(output, name, reference, k):
+    """Средний косинус с эталоном по запросам и доля общих документов в top-k."""
+    queries = normalize(np.load(os.path.join(output, f"{name}-queries.npy")))
+    corpus = normalize(np.load(os.path.join(output, f"{name}-corpus.npy")))
+    reference_queries = normalize(np.load(os.path.join(output, f"{reference}-queries.npy")))
+    reference_corpus = normalize(np.load(os.path.join(output, f"{reference}-corpus.npy")))
+
+    cosine = float((queries * reference_queries).sum(axis=1).mean())
+    k = min(k, len(corpus))
+    top = np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+    reference_top = np.argsort(-(reference_queries @ reference_corpus.T), axis=1)[:, :k]
+    overlap = statistics.mean(len(set(a) & set(b)) / k for a, b in zip(top, reference_top))
+    return cosine, overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов векторизации")
+    parser.add_argument("--backends", default="torch,torch-int8,onnx,onnx-int8")
+    parser.add_argument("--rounds", type=int, default=200, help="замеров задержки одного запроса")
+    parser.add_argument("--requests", type=int, default=256, help="запросов в замере пропускной способности")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--corpus-size", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    backends = args.backends.split(",")
+    reference = backends[0]
+    results = []
+    with tempfile.TemporaryDirectory() as output:
+        for name in backends:
+            print(f"[*] Замер бэкенда {name} ...")
+            command = [
+                sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", name, "--output", output,
+                "--rounds", str(args.rounds), "--requests", str(args.requests),
+                "--concurrency", str(args.concurrency), "--corpus-size", str(args.corpus_size),
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"[!] Бэкенд {name} не запустился:\n{completed.stderr.strip()[-2000:]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            if os.path.exists(os.path.join(output, f"{reference}-queries.npy")):
+                result["cosine"], result["overlap"] = agreement(output, name, reference, args.k)
+            else:
+                result["cosine"], result["overlap"] = float("nan"), float("nan")
+            results.append(result)
+
+    print(f"\nЭталон для сравнения векторов: {reference}, concurrency {args.concurrency}")
+    print(f"{'бэкенд':<11} {'загрузка, с':>11} {'RSS, МБ':>8} {'p50, мс':>8} {'p99, мс':>8} "
+          f"{'RPS':>7} {'RPS пакет':>9} {'пакет':>6} {'косинус':>8} {f'top-{args.k}':>6}")
+    for r in results:
+        print(f"{r['backend']:<11} {r['load_s']:>11.1f} {r['rss_mb']:>8.0f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['rps_single']:>7.1f} {r['rps_batched']:>9.1f} "
+              f"{r['avg_batch']:>6.1f} {r['cosine']:>8.4f} {r['overlap']:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
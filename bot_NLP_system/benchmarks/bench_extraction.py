@@ -0,0 +1,88 @@
+"""
+Пиковая память при извлечении и нарезке больших PDF.
+
+Создает во временной папке синтетические PDF на заданное число страниц и для
+каждого в отдельном процессе замеряет пиковый RSS, время и число чанков:
+  join   — прежний способ: текст всех страниц склеивается в одну строку
+           и режется на чанки целиком;
+  stream — постраничное извлечение с потоковой нарезкой (iter_document_chunks).
+Чанки только считаются, модель векторизации и Chroma не используются.
+
+Пример:
+    python -m benchmarks.bench_extraction --pages 100,500,2000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+WORDS = (
+    "регламент порядок заявка доступ пользователь система подразделение согласование "
+    "руководитель сотрудник документ отчет информационный ресурс требование срок"
+).split()
+
+
+def make_pdf(path, pages, seed=0):
+    """PDF с pages страницами по ~40 строк текста."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        lines = [" ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(40)]
+        page.insert_text((40, 40), "\n".join(lines), fontname="helv", fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def run_worker(mode, path):
+    from backend.chunking import split_text_into_chunks
+    from backend.extractors import iter_document_chunks
+
+    started = time.perf_counter()
+    if mode == "join":
+        with fitz.open(path) as doc:
+            text = "\n".join(page.get_text() for page in doc)
+        count = len(split_text_into_chunks(text))
+    else:
+        count = sum(1 for _ in iter_document_chunks(path, os.path.basename(path), "bench"))
+    print(json.dumps({
+        "chunks": count,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пиковая память при разборе больших PDF")
+    parser.add_argument("--pages", default="100,500,2000")
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    print(f"{'страниц':>8} {'способ':<7} {'чанков':>7} {'время, с':>9} {'пик RSS, МБ':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in map(int, args.pages.split(",")):
+            path = os.path.join(directory, f"doc_{pages}.pdf")
+            make_pdf(path, pages)
+            for mode in ("join", "stream"):
+                completed = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_extraction", "--worker", mode, path],
+                    capture_output=True, text=True, check=True,
+                )
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                print(f"{pages:>8} {mode:<7} {result['chunks']:>7} {result['seconds']:>9.2f} "
+                      f"{result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Замер масштабирования разбора документов по числу процессов.
+
+Создает синтетический корпус из PDF, DOCX и TXT файлов и прогоняет этап
+разбора (iter_parsed_files) с разным числом процессов. Векторизация и запись
+в Chroma в замер не входят.
+
+Пример:
+    python -m benchmarks.bench_parsing --documents 3000 --pages 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import docx
+import fitz  # PyMuPDF
+
+from backend.extractors import iter_parsed_files
+
+WORDS = (
+    "сотрудник заявка доступ приложение пароль кондиционер вентиляция кухня "
+    "пожарная безопасность самоспасатель справочник телефон инструкция отдел "
+    "сервер принтер почта портал учетная запись настройка обращение услуга"
+).split()
+
+
+def random_paragraph(rng, words=80):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def create_corpus(directory, documents, pages, seed=42):
+    """Создает documents файлов (по кругу PDF, DOCX, TXT) и возвращает задачи для разбора."""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(documents):
+        kind = ("pdf", "docx", "txt")[i % 3]
+        filename = f"doc_{i:05d}.{kind}"
+        file_path = os.path.join(directory, filename)
+        paragraphs = [random_paragraph(rng) for _ in range(pages * 4)]
+        if kind == "pdf":
+            pdf = fitz.open()
+            for page_number in range(pages):
+                page = pdf.new_page()
+                text = "\n".join(paragraphs[page_number * 4:(page_number + 1) * 4])
+                page.insert_textbox(page.rect + (40, 40, -40, -40), text, fontname="helv")
+            pdf.save(file_path)
+            pdf.close()
+        elif kind == "docx":
+            document = docx.Document()
+            for paragraph in paragraphs:
+                document.add_paragraph(paragraph)
+            document.save(file_path)
+        else:
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(paragraphs))
+        tasks.append((filename, file_path, filename, "benchmark", False))
+    return tasks
+
+
+def run(tasks, workers):
+    started = time.perf_counter()
+    records = 0
+    for kind, _, payload in iter_parsed_files(tasks, workers=workers):
+        if kind == "records":
+            records += len(payload)
+    return time.perf_counter() - started, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование разбора документов")
+    parser.add_argument("--documents", type=int, default=3000)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"[*] Создание синтетического корпуса: {args.documents} файлов по {args.pages} стр. ...")
+        tasks = create_corpus(directory, args.documents, args.pages)
+
+        print(f"{'процессов':>10} {'время, с':>10} {'файлов/с':>10} {'ускорение':>10}")
+        baseline = None
+        for workers in worker_counts:
+            elapsed, _ = run(tasks, workers)
+            baseline = baseline or elapsed
+            print(f"{workers:>10} {elapsed:>10.2f} {len(tasks) / elapsed:>10.1f} {baseline / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Сравнение поиска по разделам индекса с фильтрованным поиском по общей коллекции.
+
+Создает во временной базе Chroma синтетический индекс из кластеризованных
+векторов (каталог ИТ-услуг, база знаний, примеры маршрутизации) в двух
+вариантах: одна общая коллекция с фильтрами where, как было раньше, и по
+коллекции на каждый шаг каскада. Для каждого шага замеряет задержку поиска
+(p50/p99) и полноту recall@k относительно точного перебора numpy.
+Модель векторизации не используется.
+
+Пример:
+    python -m benchmarks.bench_partitions --routing 50000 --queries 300
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+IT_SERVICE_CATALOG_CATEGORY = "it_service_catalog"
+
+# Шаги каскада: (раздел, фильтр по общей коллекции, как в прежней версии /ask)
+STAGES = [
+    ("it_catalog", {"category": IT_SERVICE_CATALOG_CATEGORY}),
+    ("knowledge", {"$and": [
+        {"doc_type": {"$eq": "knowledge"}},
+        {"category": {"$ne": IT_SERVICE_CATALOG_CATEGORY}},
+    ]}),
+    ("routing", {"doc_type": "routing_example"}),
+]
+
+
+def make_vectors(rng, count, dim, clusters):
+    """Векторы вокруг clusters случайных центров, нормированные на единичную длину."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_metadata(partition, i):
+    if partition == "it_catalog":
+        return {"category": IT_SERVICE_CATALOG_CATEGORY, "doc_type": "knowledge"}
+    if partition == "knowledge":
+        return {"category": f"memo_{i % 20}", "doc_type": "knowledge"}
+    return {"category": "routing", "doc_type": "routing_example"}
+
+
+def fill(collection, ids, vectors, metadatas, batch_size):
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], embeddings=vectors[start:end], metadatas=metadatas[start:end])
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_stage(collection, queries, exact_ids, k, where=None):
+    """Возвращает задержки поиска (с) и среднюю полноту recall@k."""
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, exact_ids):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, where=where, include=["distances"])
+        latencies.append(time.perf_counter() - started)
+        recalls.append(len(set(result["ids"][0]) & expected) / len(expected))
+    return latencies, statistics.mean(recalls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск по разделам против фильтров по общей коллекции")
+    parser.add_argument("--it-catalog", type=int, default=2000)
+    parser.add_argument("--knowledge", type=int, default=5000)
+    parser.add_argument("--routing", type=int, default=30000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    sizes = {"it_catalog": args.it_catalog, "knowledge": args.knowledge, "routing": args.routing}
+    data = {}
+    for partition, count in sizes.items():
+        vectors = make_vectors(rng, count, args.dim, clusters=max(1, count // 200))
+        ids = [f"{partition}-{i}" for i in range(count)]
+        metadatas = [make_metadata(partition, i) for i in range(count)]
+        data[partition] = (ids, vectors, metadatas)
+
+    # Запросы — зашумленные копии документов каждого раздела
+    queries = {}
+    exact = {}
+    for partition, (ids, vectors, _) in data.items():
+        picked = vectors[rng.integers(0, len(vectors), args.queries)]
+        noisy = picked + 0.3 * rng.standard_normal(picked.shape).astype(np.float32)
+        noisy /= np.linalg.norm(noisy, axis=1, keepdims=True)
+        queries[partition] = noisy
+        top = np.argsort(-(noisy @ vectors.T), axis=1)[:, :args.k]
+        exact[partition] = [{ids[j] for j in row} for row in top]
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = chromadb.PersistentClient(path=directory)
+        batch_size = client.get_max_batch_size()
+        space = {"hnsw:space": "cosine"}
+
+        print(f"[*] Заполнение индексов: {sizes}, размерность {args.dim} ...")
+        shared = client.create_collection("shared", metadata=space)
+        partitions = {}
+        for partition, (ids, vectors, metadatas) in data.items():
+            fill(shared, ids, vectors, metadatas, batch_size)
+            partitions[partition] = client.create_collection(partition, metadata=space)
+            fill(partitions[partition], ids, vectors, metadatas, batch_size)
+
+        print(f"{'шаг':<12} {'вариант':<12} {'p50, мс':>9} {'p99, мс':>9} {f'recall@{args.k}':>10}")
+        for partition, where in STAGES:
+            for name, collection, stage_where in (
+                ("фильтр", shared, where),
+                ("раздел", partitions[partition], None),
+            ):
+                latencies, recall = run_stage(collection, queries[partition], exact[partition], args.k, stage_where)
+                print(f"{partition:<12} {name:<12} {percentile(latencies, 50) * 1000:>9.2f} "
+                      f"{percentile(latencies, 99) * 1000:>9.2f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Скорость загрузки больших таблиц маршрутизации.
+
+Создает во временной папке синтетический файл примеров маршрутизации
+(по умолчанию 500 000 строк, с лишними столбцами, как в выгрузках заявок)
+в форматах XLSX, CSV и Parquet и сравнивает:
+  iterrows         — прежний загрузчик: чтение всех столбцов через openpyxl,
+                     обход DataFrame.iterrows, дата загрузки на каждую строку,
+                     нарезка каждой строки сплиттером;
+  xlsx/<движок>    — load_from_routing_xlsx: только нужные столбцы,
+                     операции над столбцами, одна дата на файл;
+  csv, parquet     — то же по выгрузкам листа.
+Время разбито на чтение с формированием записей и нарезку на чанки.
+
+Пример:
+    python -m benchmarks.bench_xlsx --rows 500000
+"""
+import argparse
+import importlib.util
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from backend import extractors
+from backend.chunking import get_text_splitter, split_text_into_chunks
+
+DEPARTMENTS = ["ИТ-поддержка", "Кадровые вопросы", "Бухгалтерия", "АХО", "Безопасность", "Юридический отдел"]
+WORDS = "не работает принтер доступ к папке пароль пропуск справка отпуск ноутбук почта сеть vpn".split()
+
+
+def make_table(rows, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "Номер": range(rows),
+        "Дата": [f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(rows)],
+        "Запрос": [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) for _ in range(rows)],
+        "Отдел": [rng.choice(DEPARTMENTS) for _ in range(rows)],
+        "Исполнитель": [f"Сотрудник {rng.randint(1, 500)}" for _ in range(rows)],
+        "Статус": [rng.choice(["Закрыта", "В работе", "Отклонена"]) for _ in range(rows)],
+    })
+
+
+def legacy_load_routing(file_path):
+    """Загрузчик маршрутизации до перехода на операции над столбцами."""
+    df = pd.read_excel(file_path, engine="openpyxl")
+    request_col = next((col for col in df.columns if 'запрос' in col.lower()), df.columns[0])
+    department_col = next((col for col in df.columns if 'отдел' in col.lower()), df.columns[1])
+    records = []
+    for _, row in df.iterrows():
+        if pd.notna(row[request_col]) and pd.notna(row[department_col]):
+            metadata = {
+                "source": os.path.basename(file_path),
+                "department": row[department_col],
+                "doc_type": "routing_example",
+                "load_date": datetime.now().isoformat(),
+            }
+            records.append((row[request_col], metadata))
+    return records
+
+
+def measure(load, split):
+    started = time.perf_counter()
+    records = load()
+    loaded = time.perf_counter()
+    chunks = sum(len(split(text)) for text, _ in records)
+    return len(records), chunks, loaded - started, time.perf_counter() - loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость загрузки больших таблиц маршрутизации")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--skip-legacy", action="store_true", help="не замерять прежний загрузчик (он медленный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"[*] Создание таблицы на {args.rows} строк ...")
+        table = make_table(args.rows)
+        paths = {extension: os.path.join(directory, f"routing.{extension}") for extension in ("xlsx", "csv", "parquet")}
+        table.to_excel(paths["xlsx"], index=False)
+        table.to_csv(paths["csv"], index=False)
+        if importlib.util.find_spec("pyarrow"):
+            table.to_parquet(paths["parquet"], index=False)
+        else:
+            del paths["parquet"]
+        del table
+
+        splitter = get_text_splitter()
+        variants = []
+        if not args.skip_legacy:
+            variants.append(("iterrows", lambda: legacy_load_routing(paths["xlsx"]), splitter.split_text))
+        engines = ["openpyxl"] + (["calamine"] if importlib.util.find_spec("python_calamine") else [])
+        for engine in engines:
+            def load(engine=engine):
+                extractors.XLSX_ENGINE = engine
+                return extractors.load_from_routing_xlsx(paths["xlsx"])
+            variants.append((f"xlsx/{engine}", load, split_text_into_chunks))
+        for extension in ("csv", "parquet"):
+            if extension in paths:
+                variants.append((extension, lambda path=paths[extension]: extractors.load_from_routing_xlsx(path),
+                                 split_text_into_chunks))
+
+        results = []
+        for name, load, split in variants:
+            print(f"[*] {name} ...")
+            results.append((name, *measure(load, split)))
+
+    print(f"\n{'вариант':<15} {'записей':>8} {'чанков':>8} {'чтение, с':>10} {'нарезка, с':>11} {'всего, с':>9}")
+    for name, records, chunks, load_seconds, split_seconds in results:
+        print(f"{name:<15} {records:>8} {chunks:>8} {load_seconds:>10.2f} {split_seconds:>11.2f} "
+              f"{load_seconds + split_seconds:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Качество и задержка поиска с переоценкой кросс-энкодером и без нее.
+
+Работает по текущему индексу (backend/chroma) и двум наборам запросов:
+  маршрутизация — каждый пример из раздела routing используется как запрос,
+                  его собственный чанк (и дубликаты с тем же текстом)
+                  исключается из выдачи; считается точность отдела в топ-1;
+  памятки       — размеченные вопросы из benchmarks/data/memo_questions.json
+                  (source — ожидаемый файл, null — вопрос вне базы знаний);
+                  считаются hit@1 и MRR по источнику, доля нерелевантного
+                  контекста (чанки чужих источников с оценкой выше порога
+                  уверенности, то есть попавшие бы в промпт GigaChat) и доля
+                  вопросов вне базы, на которые нашелся "уверенный" ответ.
+Для каждого варианта — задержка поиска p50/p99 (без векторизации запроса).
+Вариант "rerank (кэш)" — повторный прогон тех же запросов: оценки пар
+берутся из кэша кросс-энкодера.
+
+Пример:
+    python -m benchmarks.eval_rerank --routing 300 --budget-ms 150
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+# Кросс-энкодер нужен скрипту независимо от настроек сервера
+os.environ.setdefault("RERANK", "1")
+
+from backend import database, rerank  # noqa: E402
+
+MEMO_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "memo_questions.json")
+# Порог уверенности ответа по базе знаний (CONFIDENCE_THRESHOLD в backend.main)
+CONFIDENCE_THRESHOLD = 0.5
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def search(query, embedding, partition, n_results, use_rerank):
+    started = time.perf_counter()
+    result = database.find_similar_documents_by_embedding(
+        embedding, n_results, partition=partition, query_text=query, rerank=use_rerank
+    )
+    return result, time.perf_counter() - started
+
+
+def eval_routing(examples, embeddings, use_rerank, k):
+    """Точность отдела в топ-1 без собственного чанка запроса; задержки поиска."""
+    correct = 0
+    latencies = []
+    for (text, department), embedding in zip(examples, embeddings):
+        (documents, _, metadatas), seconds = search(text, embedding, "routing", k, use_rerank)
+        latencies.append(seconds)
+        predicted = next((meta.get("department") for doc, meta in zip(documents, metadatas) if doc != text), None)
+        correct += predicted == department
+    return {"accuracy": correct / len(examples)}, latencies
+
+
+def eval_memos(questions, embeddings, use_rerank, k, threshold):
+    """hit@1, MRR по источнику, доля нерелевантного контекста и ложных уверенных ответов."""
+    hits, reciprocal_ranks, latencies = [], [], []
+    confident_chunks = irrelevant_chunks = 0
+    out_of_scope = out_of_scope_confident = 0
+    for item, embedding in zip(questions, embeddings):
+        (_, scores, metadatas), seconds = search(item["question"], embedding, "knowledge", k, use_rerank)
+        latencies.append(seconds)
+        sources = [meta.get("source") for meta in metadatas]
+        if item["source"] is None:
+            out_of_scope += 1
+            out_of_scope_confident += bool(scores) and scores[0] >= threshold
+            continue
+        hits.append(bool(sources) and sources[0] == item["source"])
+        rank = next((i + 1 for i, source in enumerate(sources) if source == item["source"]), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for score, source in zip(scores, sources):
+            if score >= threshold:
+                confident_chunks += 1
+                irrelevant_chunks += source != item["source"]
+    return {
+        "hit@1": statistics.mean(hits) if hits else 0.0,
+        "mrr": statistics.mean(reciprocal_ranks) if reciprocal_ranks else 0.0,
+        "irrelevant_context": irrelevant_chunks / confident_chunks if confident_chunks else 0.0,
+        "out_of_scope_confident": out_of_scope_confident / out_of_scope if out_of_scope else 0.0,
+    }, latencies
+
+
+def load_routing_examples(limit, seed):
+    index = database.lexical_store.get("routing")
+    if index is None:
+        return []
+    examples = []
+    for doc_index in range(len(index)):
+        _, document, metadata = index.chunk(doc_index)
+        examples.append((document, metadata.get("department")))
+    random.Random(seed).shuffle(examples)
+    return examples[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Качество и задержка поиска с переоценкой и без нее")
+    parser.add_argument("--routing", type=int, default=300, help="сколько примеров маршрутизации взять запросами")
+    parser.add_argument("--questions", default=MEMO_QUESTIONS_PATH)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=rerank.RERANK_CANDIDATES)
+    parser.add_argument("--budget-ms", type=float, default=rerank.RERANK_BUDGET_MS)
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    database.RERANK_CANDIDATES = args.candidates
+    print(f"[*] Загрузка кросс-энкодера {rerank.RERANK_MODEL} ...")
+    reranker = database.get_reranker()
+    reranker.budget = args.budget_ms / 1000
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = json.load(f)
+    routing_examples = load_routing_examples(args.routing, args.seed)
+    print(f"[*] Запросов: {len(questions)} вопросов по памяткам, {len(routing_examples)} примеров маршрутизации")
+
+    embed = database.get_embedding_function()
+    memo_embeddings = embed([item["question"] for item in questions])
+    routing_embeddings = embed([text for text, _ in routing_examples]) if routing_examples else []
+    # Прогрев: первый поиск открывает коллекции и лексические индексы
+    database.find_similar_documents_by_embedding(memo_embeddings[0], 1, partition="knowledge", rerank=False)
+    reranker.predict([("прогрев", "прогрев")])
+
+    variants = [("bi-encoder", False), ("rerank", True), ("rerank (кэш)", True)]
+    rows = []
+    for name, use_rerank in variants:
+        print(f"[*] {name} ...")
+        memo_metrics, memo_latencies = eval_memos(questions, memo_embeddings, use_rerank, args.k, args.threshold)
+        routing_metrics, routing_latencies = (
+            eval_routing(routing_examples, routing_embeddings, use_rerank, args.k + 1)
+            if routing_examples else ({"accuracy": 0.0}, [0.0])
+        )
+        rows.append((name, memo_metrics, memo_latencies, routing_metrics, routing_latencies))
+
+    print(f"\nПамятки (k={args.k}, порог {args.threshold}):")
+    print(f"{'вариант':<14} {'hit@1':>6} {'MRR':>6} {'чужой контекст':>15} {'уверенно вне базы':>18} "
+          f"{'p50, мс':>8} {'p99, мс':>8}")
+    for name, metrics, latencies, _, _ in rows:
+        print(f"{name:<14} {metrics['hit@1']:>6.2f} {metrics['mrr']:>6.2f} {metrics['irrelevant_context']:>15.2f} "
+              f"{metrics['out_of_scope_confident']:>18.2f} {percentile(latencies, 50) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f}")
+    print("\nМаршрутизация (топ-1 отдел):")
+    print(f"{'вариант':<14} {'точность':>9} {'p50, мс':>8} {'p99, мс':>8}")
+    for name, _, _, metrics, latencies in rows:
+        print(f"{name:<14} {metrics['accuracy']:>9.3f} {percentile(latencies, 50) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f}")
+    print(f"\nКэш оценок: попаданий {reranker.cache.hits}, промахов {reranker.cache.misses}.")
+
+
+if __name__ == "__main__":
+    main()
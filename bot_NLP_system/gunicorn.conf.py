@@ -0,0 +1,55 @@
+"""
+Конфигурация gunicorn для запуска сервера в эксплуатации:
+    gunicorn -c gunicorn.conf.py backend.main:app
+
+Несколько воркеров uvicorn, без автоперезагрузки. Приложение и модель
+векторизации загружаются один раз в мастер-процессе до fork (preload),
+поэтому веса модели разделяются воркерами (copy-on-write), а не копируются
+в каждый. Chroma и пробный прогон модели инициализируются уже в каждом
+воркере, в lifespan приложения.
+
+Для локальной разработки с автоперезагрузкой по-прежнему: python run_server.py
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Первый запрос воркера может ждать прогрева модели
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = None
+
+# Загружать ли модель в мастер-процессе, чтобы воркеры делили одну копию весов
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "1") == "1"
+
+# Метрики Prometheus от нескольких воркеров собираются через файлы в этом
+# каталоге. Готовим его до загрузки приложения (preload идет раньше хуков).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    for name in os.listdir(PROMETHEUS_MULTIPROC_DIR):
+        os.remove(os.path.join(PROMETHEUS_MULTIPROC_DIR, name))
+
+
+def when_ready(server):
+    if not PRELOAD_MODEL:
+        return
+    from backend.database import get_embedding_function, get_reranker
+
+    # Только загрузка весов: прогон модели в мастере запустил бы пулы потоков,
+    # которые не переживают fork. Прогрев делает каждый воркер сам.
+    get_embedding_function()
+    server.log.info("Модель векторизации загружена в мастер-процессе")
+    if get_reranker() is not None:
+        server.log.info("Кросс-энкодер загружен в мастер-процессе")
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
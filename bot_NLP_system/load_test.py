@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест для API ассистента.
+
+Сначала отправляет несколько последовательных запросов, чтобы измерить
+латентность одного запроса, затем — параллельную серию в /ask (или /fallback).
+Эффективный параллелизм = (число запросов * латентность одного) / общее время.
+Если обработчики блокируют цикл событий, сервер обрабатывает запросы строго
+друг за другом и параллелизм будет около 1.
+
+С флагом --stream запросы идут в /ask/stream, и дополнительно измеряются
+время до первого байта (метаданные поиска) и до первого токена ответа.
+
+Пример:
+    python load_test.py --url http://127.0.0.1:8000 --concurrency 8 --requests 32
+    python load_test.py --stream --requests 16
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_QUERIES = [
+    "Как войти в мобильное приложение?",
+    "Правила работы на кухне",
+    "Как пользоваться самоспасателем СПИ-20?",
+    "Не работает кондиционер в кабинете",
+    "Как найти телефон сотрудника?",
+]
+
+
+def send_request(base_url, endpoint, query, timeout, marks=None):
+    """
+    Отправляет один запрос и возвращает (время начала, время окончания, успех).
+    Если передан словарь marks, ответ читается построчно (поток server-sent events)
+    и в marks записываются задержки до первого байта ("ttfb") и первого токена ("first_token").
+    """
+    body = json.dumps({"query": query}).encode("utf-8")
+    req = urllib.request.Request(
+        f"{base_url}{endpoint}",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            if marks is None:
+                resp.read()
+            else:
+                for line in resp:
+                    now = time.perf_counter() - started
+                    marks.setdefault("ttfb", now)
+                    if line.startswith(b"event: token"):
+                        marks.setdefault("first_token", now)
+            ok = resp.status == 200
+    except Exception as e:
+        print(f"  [!] Ошибка запроса '{query}': {e}")
+        ok = False
+    return started, time.perf_counter(), ok
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /ask")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", default=None, help="По умолчанию /ask или /ask/stream")
+    parser.add_argument("--stream", action="store_true", help="Потоковый режим с замером времени до первого байта")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--baseline", type=int, default=3, help="Число последовательных запросов для замера")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    if args.endpoint is None:
+        args.endpoint = "/ask/stream" if args.stream else "/ask"
+
+    queries = [DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)] for i in range(args.requests)]
+
+    print(f"[*] Замер латентности одного запроса ({args.baseline} последовательных)...")
+    baseline = []
+    for i in range(args.baseline):
+        start, end, _ = send_request(args.url, args.endpoint, queries[i % len(queries)], args.timeout)
+        baseline.append(end - start)
+    single_latency = statistics.median(baseline)
+
+    print(f"[*] {args.requests} запросов в {args.url}{args.endpoint}, параллельно: {args.concurrency}")
+    wall_started = time.perf_counter()
+    marks = [{} if args.stream else None for _ in queries]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(
+            lambda q, m: send_request(args.url, args.endpoint, q, args.timeout, m), queries, marks
+        ))
+    wall_time = time.perf_counter() - wall_started
+
+    latencies = [end - start for start, end, _ in results]
+    errors = sum(1 for _, _, ok in results if not ok)
+
+    print("=" * 50)
+    print(f"Общее время:            {wall_time:.2f} с")
+    print(f"Ошибок:                 {errors}")
+    print(f"Латентность p50/p99:    {percentile(latencies, 50):.3f} / {percentile(latencies, 99):.3f} с")
+    print(f"Средняя латентность:    {statistics.mean(latencies):.3f} с")
+    if args.stream:
+        for name, title in (("ttfb", "До первого байта"), ("first_token", "До первого токена")):
+            values = [m[name] for m in marks if name in m]
+            if values:
+                print(f"{title + ' p50/p99:':<27}{percentile(values, 50):.3f} / {percentile(values, 99):.3f} с")
+    print(f"Латентность одного:     {single_latency:.3f} с")
+    print(f"Пропускная способность: {args.requests / wall_time:.2f} запр/с")
+    print(f"Эффективный параллелизм: {args.requests * single_latency / wall_time:.2f} "
+          f"(1.0 — запросы шли последовательно, максимум {args.concurrency})")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
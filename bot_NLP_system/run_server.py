@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 """
-Скрипт для запуска сервера FastAPI
+Скрипт для запуска сервера FastAPI в режиме разработки (с автоперезагрузкой).
+Модель и база загружаются в фоне после старта, готовность — GET /readyz.
+В эксплуатации: gunicorn -c gunicorn.conf.py backend.main:app
 """
 import uvicorn
 
 if __name__ == "__main__":
     uvicorn.run("backend.main:app", host="127.0.0.1", port=8000, reload=True)
-
-
-
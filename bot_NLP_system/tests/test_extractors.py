@@ -0,0 +1,47 @@
+import os
+import signal
+
+from backend import extractors
+from backend.extractors import iter_parsed_files
+
+
+def test_parallel_parsing_reports_every_file(tmp_path):
+    """
+    Файлов больше, чем процессов, и каждый документ дает сообщения "chunks":
+    пул не должен завершаться, пока все файлы не прислали "done".
+    """
+    tasks = []
+    for i in range(6):
+        path = tmp_path / f"doc_{i}.txt"
+        path.write_text("\n".join(f"Строка {j} документа {i} о настройке доступа." for j in range(200)), encoding="utf-8")
+        tasks.append((str(path), str(path), path.name, "test", False))
+
+    messages = list(iter_parsed_files(tasks, workers=2))
+
+    assert any(kind == "chunks" for kind, _, _ in messages)
+    done = {key for kind, key, _ in messages if kind == "done"}
+    assert done == {task[0] for task in tasks}
+    assert not [message for message in messages if message[0] == "error"]
+
+
+def test_crashed_parser_reports_error_instead_of_hanging(tmp_path, monkeypatch):
+    """Если процесс-парсер убит, его файл завершается ошибкой, а остальные разбираются."""
+    parse_file = extractors.parse_file
+
+    def crashing_parse_file(task):
+        if task[2] == "crash.txt":
+            os.kill(os.getpid(), signal.SIGKILL)
+        return parse_file(task)
+
+    monkeypatch.setattr(extractors, "parse_file", crashing_parse_file)
+    monkeypatch.setattr(extractors, "PARSE_CHECK_INTERVAL", 0.2)
+    tasks = []
+    for name in ("crash.txt", "doc_1.txt", "doc_2.txt", "doc_3.txt"):
+        path = tmp_path / name
+        path.write_text("Инструкция по подключению принтера.", encoding="utf-8")
+        tasks.append((name, str(path), name, "test", False))
+
+    messages = list(iter_parsed_files(tasks, workers=2))
+
+    finished = {key: kind for kind, key, _ in messages if kind in ("done", "error")}
+    assert finished == {"crash.txt": "error", "doc_1.txt": "done", "doc_2.txt": "done", "doc_3.txt": "done"}
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+from sqlite_store import SQLiteStore
+
+# Аналитика по завершенным задачам хранится в SQLite в режиме WAL:
+# каждая задача — одна строка в журнале событий, а итоги по дням и общие
+# итоги обновляются в той же транзакции. Запись не переписывает историю,
+# одновременные запросы (в том числе из разных процессов) не теряют событий,
+# а дашборд читает готовые агрегаты вместо пересчета всей истории.
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", "analytics.db")
+# Прежний формат: весь список событий в одном JSON-файле.
+# Переносится в базу при первом запуске и переименовывается.
+LEGACY_ANALYTICS_FILE = "analytics.json"
+# Сколько событий отдавать на одной странице raw_data
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    message_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT PRIMARY KEY,
+    tasks INTEGER NOT NULL,
+    messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tasks INTEGER NOT NULL,
+    messages INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, tasks, messages) VALUES (1, 0, 0);
+"""
+
+def _record(connection, timestamp, message_count):
+    """Добавляет событие и обновляет агрегаты (вызывается внутри транзакции)."""
+    day = datetime.fromisoformat(timestamp).strftime('%Y-%m-%d')
+    connection.execute(
+        "INSERT INTO events (timestamp, message_count) VALUES (?, ?)", (timestamp, message_count)
+    )
+    connection.execute(
+        "INSERT INTO daily_stats (day, tasks, messages) VALUES (?, 1, ?) "
+        "ON CONFLICT(day) DO UPDATE SET tasks = tasks + 1, messages = messages + excluded.messages",
+        (day, message_count),
+    )
+    connection.execute(
+        "UPDATE totals SET tasks = tasks + 1, messages = messages + ? WHERE id = 1", (message_count,)
+    )
+
+
+def migrate_legacy_file(connection):
+    """Переносит события из analytics.json в базу (один раз) и переименовывает файл."""
+    if not os.path.exists(LEGACY_ANALYTICS_FILE):
+        return
+    with open(LEGACY_ANALYTICS_FILE, 'r', encoding='utf-8') as f:
+        legacy_data = json.load(f)
+    # Другой процесс, стартовавший одновременно, дождется конца переноса
+    with store.transaction(connection):
+        if not os.path.exists(LEGACY_ANALYTICS_FILE):
+            return
+        for item in legacy_data:
+            _record(connection, item['timestamp'], item['message_count'])
+        os.replace(LEGACY_ANALYTICS_FILE, LEGACY_ANALYTICS_FILE + ".migrated")
+    logging.info(f"Аналитика перенесена из {LEGACY_ANALYTICS_FILE}: {len(legacy_data)} записей.")
+
+
+store = SQLiteStore(ANALYTICS_DB, SCHEMA, on_init=migrate_legacy_file)
+
+
+def record_task(message_count, timestamp=None):
+    """Записывает завершенную задачу: событие и агрегаты в одной транзакции."""
+    with store.transaction() as connection:
+        _record(connection, timestamp or datetime.now().isoformat(), message_count)
+
+
+def get_summary(limit=DEFAULT_PAGE_SIZE, offset=0):
+    """
+    Данные для дашборда: общие итоги и задачи по дням из агрегатов,
+    плюс страница сырых событий (новые первыми).
+    """
+    limit = max(0, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    connection = store.connection()
+    total_tasks, total_messages = connection.execute(
+        "SELECT tasks, messages FROM totals WHERE id = 1"
+    ).fetchone()
+    tasks_per_day = dict(connection.execute("SELECT day, tasks FROM daily_stats ORDER BY day"))
+    raw_data = [
+        {'timestamp': timestamp, 'message_count': message_count}
+        for timestamp, message_count in connection.execute(
+            "SELECT timestamp, message_count FROM events ORDER BY id DESC LIMIT ? OFFSET ?", (limit, offset)
+        )
+    ]
+    return {
+        'total_tasks': total_tasks,
+        'avg_messages_per_task': round(total_messages / total_tasks, 2) if total_tasks else 0,
+        'tasks_per_day': tasks_per_day,
+        'raw_data': raw_data,
+        'raw_data_total': total_tasks,
+        'limit': limit,
+        'offset': offset,
+    }
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
@@ -9,29 +9,59 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 import logging
 import re
 import sys
-import json
-from gigachat import GigaChat
-
-# Настройка логирования с правильной кодировкой
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import threading
+import time
+from urllib.parse import unquote
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Общий код ботов (пакет gsp_common) лежит в корне репозитория,
+# а в Docker-образе копируется рядом с app.py.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from gsp_common.gigachat_client import create_client
+
+import analytics
+import jobs
+import sessions
+import uploads
+
+def configure_logging():
+    """
+    Настройка логирования с правильной кодировкой. Вызывается в каждом
+    процессе сервера (см. init_worker), а не при импорте модуля.
+    Повторный вызов ничего не меняет.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('app.log', encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
 
 load_dotenv()
 
+class UploadRequest(Request):
+    """Запрос, в котором файлы из multipart-формы сразу пишутся в хранилище загрузок."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return uploads.HashingWriter()
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+# Запрос с Content-Length больше лимита отклоняется до чтения тела
+app.config['MAX_CONTENT_LENGTH'] = uploads.MAX_UPLOAD_BYTES + 64 * 1024
 CORS(app)
 
 # Создаем директории для заявок, если их нет
 REQUESTS_DIR = "requests"
 DOCX_DIR = "docx_files"
-UPLOADS_DIR = "uploads"
-for directory in [REQUESTS_DIR, DOCX_DIR, UPLOADS_DIR]:
+for directory in [REQUESTS_DIR, DOCX_DIR]:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
@@ -40,23 +70,80 @@ GIGACHAT_API_KEY = os.getenv('GIGACHAT_API_KEY')
 if not GIGACHAT_API_KEY:
     raise Exception("Не найден API ключ GigaChat. Пожалуйста, добавьте GIGACHAT_API_KEY в .env файл")
 
+# Ограничение длины краткого содержания диалога (в токенах)
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+
 # Путь к сертификату
 CA_BUNDLE_FILE = "russian_trusted_root_ca.cer"
 
 # Проверяем наличие сертификата
 
 
-# Инициализация GigaChat с сертификатом
-try:
-    giga = GigaChat(
-        credentials=GIGACHAT_API_KEY,
-
-        verify_ssl_certs=False
-    )
-    logging.info("GigaChat успешно инициализирован с сертификатом безопасности")
-except Exception as e:
-    logging.error(f"Ошибка инициализации GigaChat: {str(e)}")
-    raise Exception(f"Не удалось инициализировать GigaChat: {str(e)}")
+# Сколько обращений к GigaChat один процесс выполняет одновременно. Остальные
+# запросы ждут очереди не дольше LLM_QUEUE_TIMEOUT секунд, затем получают 503:
+# медленная модель не копит бесконечную очередь потоков.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+
+# Клиент GigaChat создается в каждом процессе сервера: его HTTP-соединения
+# и токен нельзя делить между процессами после fork
+_giga = None
+_giga_pid = None
+_giga_lock = threading.Lock()
+
+
+class LLMOverloadedError(Exception):
+    """Все слоты обращений к GigaChat заняты дольше LLM_QUEUE_TIMEOUT."""
+
+
+def get_giga():
+    """
+    Клиент GigaChat текущего процесса (создается при первом вызове).
+    Таймауты, повторы и выключатель настраиваются переменными окружения
+    GIGACHAT_* (см. gsp_common/gigachat_client.py).
+    """
+    global _giga, _giga_pid
+    with _giga_lock:
+        if _giga is None or _giga_pid != os.getpid():
+            try:
+                _giga = create_client(credentials=GIGACHAT_API_KEY)
+                _giga_pid = os.getpid()
+                logging.info("GigaChat успешно инициализирован")
+            except Exception as e:
+                logging.error(f"Ошибка инициализации GigaChat: {str(e)}")
+                raise Exception(f"Не удалось инициализировать GigaChat: {str(e)}")
+        return _giga
+
+
+def llm_chat(payload):
+    """Запрос к GigaChat с ограничением числа одновременных обращений."""
+    if not llm_slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+        raise LLMOverloadedError("Сервис перегружен, повторите запрос позже")
+    try:
+        return get_giga().chat(payload)
+    finally:
+        llm_slots.release()
+
+
+def init_worker():
+    """
+    Инициализация процесса сервера: логирование и клиент GigaChat. Токен
+    получаем в фоне, чтобы первый запрос не ждал авторизации.
+    """
+    configure_logging()
+    threading.Thread(target=get_giga().warm_up, daemon=True).start()
+
+
+def shutdown_worker():
+    """
+    Плавная остановка процесса: дожидаемся начатых документов
+    и закрываем соединения с GigaChat.
+    """
+    jobs.shutdown(wait=True)
+    if _giga is not None and _giga_pid == os.getpid():
+        _giga.close()
+    logging.info("Процесс сервера остановлен")
 
 def validate_input(text):
     """Валидация входного текста"""
@@ -74,11 +161,13 @@ def preprocess_text(text):
     text = re.sub(r'[^\w\s.,!?-]', '', text)
     return text
 
-def generate_chat_response(messages):
+def generate_chat_response(messages, summary=""):
+    """
+    Ответ модели на последнее сообщение. messages — несвернутая часть диалога,
+    summary — краткое содержание более ранней части (см. sessions.py).
+    Возвращает (текст ответа, usage ответа GigaChat или None).
+    """
     try:
-        # Последнее сообщение от пользователя
-        user_prompt = messages[-1]['text']
-
         # Формируем системный промпт
         system_prompt = """# Ты - ИИ-ассистент для сбора требований на разработку ПО.
         Твоя задача — вести диалог с пользователем, чтобы собрать всю необходимую информацию для составления технического задания (ТЗ).
@@ -97,6 +186,12 @@ def generate_chat_response(messages):
         Твой ответ должен быть только текстом следующего сообщения в чате.
         """
         
+        if summary:
+            system_prompt += f"""
+        ## Краткое содержание предыдущей части диалога
+        {summary}
+        """
+
         # Преобразуем историю сообщений в формат, понятный для GigaChat
         history = []
         for msg in messages:
@@ -115,15 +210,60 @@ def generate_chat_response(messages):
         }
         
         logging.info("Отправка запроса к GigaChat")
-        response = giga.chat(payload)
+        response = llm_chat(payload)
         
         generated_text = response.choices[0].message.content
-        return generated_text.strip()
+        return generated_text.strip(), getattr(response, 'usage', None)
         
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         logging.error(f"Ошибка генерации текста: {str(e)}")
         raise Exception(f"Ошибка при генерации текста: {str(e)}")
 
+def summarize_history(summary, messages):
+    """
+    Сворачивает старые реплики диалога в краткое содержание: модель дополняет
+    прежнее содержание (summary) репликами messages. Возвращает новый текст.
+    """
+    transcript = "\n".join(
+        f"{'Пользователь' if msg['sender'] == 'user' else 'Ассистент'}: {msg['text']}" for msg in messages
+    )
+    payload = {
+        "model": "GigaChat",
+        "messages": [
+            {"role": "system", "content": (
+                "Ты ведешь краткий конспект диалога о требованиях к разработке ПО. "
+                "Обнови конспект с учетом новых реплик. Сохрани все факты, которые нужны для "
+                "технического задания: цели, функции, пользователей, ограничения, сроки, бюджет, "
+                "прикрепленные файлы и вопросы, на которые уже получен ответ. "
+                f"Пиши сжато, не длиннее {SUMMARY_MAX_TOKENS} токенов, без вступлений."
+            )},
+            {"role": "user", "content": f"Текущий конспект:\n{summary or '(пусто)'}\n\nНовые реплики:\n{transcript}"},
+        ],
+        "max_tokens": SUMMARY_MAX_TOKENS,
+    }
+    logging.info(f"Сжатие истории диалога: {len(messages)} реплик")
+    response = llm_chat(payload)
+    return response.choices[0].message.content.strip()
+
+def compact_session(session, new_tokens):
+    """
+    Сворачивает старые реплики сессии, если история не укладывается в бюджет
+    токенов. Ошибка сжатия не прерывает диалог: история уйдет в модель без него.
+    Возвращает актуальную сессию.
+    """
+    old_messages = sessions.pending_compaction(session, new_tokens)
+    if not old_messages:
+        return session
+    try:
+        summary = summarize_history(session['summary'], old_messages)
+    except Exception as e:
+        logging.error(f"Ошибка сжатия истории диалога: {str(e)}")
+        return session
+    sessions.save_summary(session['id'], summary, old_messages[-1]['seq'])
+    return sessions.get_session(session['id'])
+
 def create_docx_from_chat(filename, messages):
     try:
         doc = Document()
@@ -165,133 +305,174 @@ def create_docx_from_chat(filename, messages):
         logging.error(f"Ошибка создания DOCX из чата: {str(e)}")
         return False
 
+def build_document(docx_filename, messages):
+    """Фоновая задача: собирает DOCX по истории диалога и записывает аналитику."""
+    if not create_docx_from_chat(os.path.join(DOCX_DIR, docx_filename), messages):
+        raise Exception("Не удалось создать документ")
+    log_analytics(messages)
+
 def log_analytics(chat_messages):
     """Логирование аналитики по завершенным задачам"""
     try:
-        analytics_file = 'analytics.json'
-        analytics_data = []
-        if os.path.exists(analytics_file):
-            with open(analytics_file, 'r', encoding='utf-8') as f:
-                analytics_data = json.load(f)
-
-        analytics_data.append({
-            'timestamp': datetime.now().isoformat(),
-            'message_count': len(chat_messages),
-        })
-
-        with open(analytics_file, 'w', encoding='utf-8') as f:
-            json.dump(analytics_data, f, ensure_ascii=False, indent=4)
-
+        analytics.record_task(len(chat_messages))
         logging.info("Аналитика по задаче успешно записана.")
     except Exception as e:
         logging.error(f"Ошибка записи аналитики: {str(e)}")
 
 @app.route('/api/analytics', methods=['GET'])
 def get_analytics():
-    """Отдает данные для дашборда аналитики"""
+    """
+    Отдает данные для дашборда аналитики. Итоги берутся из агрегатов,
+    сырые события — постранично (параметры limit и offset, новые первыми).
+    """
     try:
-        analytics_file = 'analytics.json'
-        if os.path.exists(analytics_file):
-            with open(analytics_file, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-
-            total_tasks = len(raw_data)
-            if total_tasks == 0:
-                return jsonify({"success": True, "data": {
-                    'total_tasks': 0,
-                    'avg_messages_per_task': 0,
-                    'tasks_per_day': {},
-                    'raw_data': []
-                }})
-
-            total_messages = sum(item['message_count'] for item in raw_data)
-            avg_messages_per_task = total_messages / total_tasks
-
-            tasks_per_day = {}
-            for item in raw_data:
-                day = datetime.fromisoformat(item['timestamp']).strftime('%Y-%m-%d')
-                tasks_per_day[day] = tasks_per_day.get(day, 0) + 1
-
-            processed_analytics = {
-                'total_tasks': total_tasks,
-                'avg_messages_per_task': round(avg_messages_per_task, 2),
-                'tasks_per_day': tasks_per_day,
-                'raw_data': raw_data
-            }
-            return jsonify({"success": True, "data": processed_analytics})
-        else:
-            return jsonify({"success": True, "data": {
-                'total_tasks': 0,
-                'avg_messages_per_task': 0,
-                'tasks_per_day': {},
-                'raw_data': []
-            }})
+        limit = request.args.get('limit', analytics.DEFAULT_PAGE_SIZE, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        return jsonify({"success": True, "data": analytics.get_summary(limit, offset)})
     except Exception as e:
-        logging.error(f"Ошибка чтения файла аналитики: {str(e)}")
+        logging.error(f"Ошибка чтения аналитики: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def upload_filename(name):
+    """
+    Имя файла для истории диалога. Файл хранится под именем хэша, поэтому
+    из имени достаточно убрать путь; кириллица сохраняется.
+    """
+    return os.path.basename((name or '').replace('\\', '/')).strip()[:255]
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
+    """
+    Прием файла, прикрепленного к диалогу. Два варианта запроса:
+    multipart/form-data с полями file и session_id (форма в браузере)
+    или тело запроса целиком — файл (имя в параметре filename или заголовке
+    X-Filename, сессия — в параметре session_id). В обоих случаях файл
+    пишется на диск по частям с подсчетом SHA-256 (см. uploads.py).
+    """
+    writer = None
     try:
-        if 'file' not in request.files:
-            return jsonify({"success": False, "error": "Файл не найден"}), 400
-        
-        file = request.files['file']
-        
-        if file.filename == '':
+        if request.mimetype == 'multipart/form-data':
+            if 'file' not in request.files:
+                return jsonify({"success": False, "error": "Файл не найден"}), 400
+            file = request.files['file']
+            filename = upload_filename(file.filename)
+            writer = file.stream
+            session_id = request.form.get('session_id')
+        else:
+            filename = upload_filename(
+                request.args.get('filename') or unquote(request.headers.get('X-Filename', ''))
+            )
+            writer = uploads.HashingWriter()
+            uploads.write_stream(request.stream, writer)
+            session_id = request.args.get('session_id')
+
+        if filename == '':
             return jsonify({"success": False, "error": "Файл не выбран"}), 400
-        
-        if file:
-            # Используем werkzeug для безопасного имени файла
-            from werkzeug.utils import secure_filename
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(UPLOADS_DIR, filename))
-            logging.info(f"Файл '{filename}' успешно загружен.")
-            return jsonify({"success": True, "filename": filename})
-            
+
+        # Отметка о файле попадает в историю диалога (и в контекст модели)
+        session = sessions.get_session(session_id) if session_id else None
+        if session is None or session['done']:
+            session_id = sessions.create_session()
+        upload = uploads.save_upload(writer, filename, session_id)
+        sessions.append_messages(session_id, [{'sender': 'user', 'text': f"Прикреплен файл: {filename}"}])
+        logging.info(
+            f"Файл '{filename}' успешно загружен: {upload['size']} байт, sha256 {upload['sha256'][:12]}"
+            + (" (уже был в хранилище)" if upload['deduplicated'] else "")
+        )
+        return jsonify({"success": True, **upload, "session_id": session_id})
+
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         logging.error(f"Ошибка загрузки файла: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        if writer is not None:
+            writer.close()
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit_mb = uploads.MAX_UPLOAD_BYTES // (1024 * 1024)
+    return jsonify({"success": False, "error": f"Файл слишком большой (максимум {limit_mb} МБ)"}), 413
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    """
+    Ход диалога. Тело запроса: {"session_id": ..., "message": "текст"}.
+    Без session_id (или с неизвестным либо завершенным) начинается новая
+    сессия; ее id возвращается в ответе. Клиенты старой версии могут
+    по-прежнему прислать всю историю в "messages": без session_id она
+    сохраняется в новую сессию, а с действующим session_id история уже есть
+    на сервере, и из "messages" берется только последнее сообщение.
+    """
     try:
         logging.info("Получен POST запрос в /api/chat")
         data = request.json
-        
-        if not data or 'messages' not in data:
+
+        if not data or not (data.get('message') or data.get('messages')):
             return jsonify({"success": False, "error": "Отсутствуют сообщения в запросе"}), 400
-            
-        messages = data.get('messages')
-        
+
+        session = sessions.get_session(data['session_id']) if data.get('session_id') else None
+        if session is not None and session['done']:
+            session = None
+        if 'message' in data:
+            user_message = data['message']
+            if session is None:
+                session = sessions.get_session(sessions.create_session())
+        else:
+            messages = data['messages']
+            user_message = messages[-1]['text']
+            if session is None:
+                session = sessions.get_session(sessions.create_session(messages[:-1]))
+
         # Валидация последнего сообщения
-        last_message = messages[-1]['text']
-        is_valid, error_message = validate_input(last_message)
+        is_valid, error_message = validate_input(user_message)
         if not is_valid:
             return jsonify({"success": False, "error": error_message}), 400
-            
+
         # Генерация ответа от чат-бота
         try:
-            bot_response = generate_chat_response(messages)
-            
+            started = time.perf_counter()
+            session = compact_session(session, sessions.estimate_tokens(user_message))
+            summary, recent = sessions.context(session)
+            bot_response, usage = generate_chat_response(
+                recent + [{'sender': 'user', 'text': user_message}], summary
+            )
+            stats = {
+                'request_bytes': request.content_length,
+                'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+                'completion_tokens': getattr(usage, 'completion_tokens', None),
+                'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            }
+            logging.info(
+                f"Ход диалога {session['id']}: запрос {stats['request_bytes']} байт, "
+                f"промпт {stats['prompt_tokens']} токенов, в модель ушло {len(recent) + 1} реплик, "
+                f"{stats['latency_ms']} мс"
+            )
+
             # Проверяем, готов ли документ
             if bot_response.startswith('[DOCUMENT_READY]'):
                 bot_response = bot_response.replace('[DOCUMENT_READY]', '').strip()
-                
+
+                # В документ попадает вся история, а не только то, что ушло в модель
+                messages = sessions.get_messages(session['id']) + [{'sender': 'user', 'text': user_message}]
+                sessions.append_turn(session['id'], user_message, bot_response, stats, done=True)
+                # Документ собирается в фоне: ответ чата не ждет его сборки,
+                # клиент узнает о готовности по /api/jobs/<job_id>
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                docx_filename = f"ТЗ_{timestamp}.docx"
-                docx_filepath = os.path.join(DOCX_DIR, docx_filename)
-
-                if create_docx_from_chat(docx_filepath, messages):
-                    log_analytics(messages)
-                    # Добавляем ссылку на скачивание в ответ
-                    download_url = f"/downloads/{docx_filename}"
-                    final_response = f"{bot_response}\n[Скачать документ]({download_url})"
-                    return jsonify({"success": True, "reply": final_response, "document_ready": True})
-                else:
-                    return jsonify({"success": False, "error": "Не удалось создать документ"}), 500
-
-            return jsonify({"success": True, "reply": bot_response})
+                docx_filename = f"ТЗ_{timestamp}_{session['id'][:8]}.docx"
+                job_id = jobs.submit(
+                    docx_filename, lambda: build_document(docx_filename, messages), session_id=session['id']
+                )
+                return jsonify({"success": True, "reply": bot_response, "document_ready": True,
+                                "job_id": job_id, "job_url": f"/api/jobs/{job_id}", "session_id": session['id']})
+
+            sessions.append_turn(session['id'], user_message, bot_response, stats)
+            return jsonify({"success": True, "reply": bot_response, "session_id": session['id']})
+        except LLMOverloadedError as e:
+            logging.warning(f"Запрос отклонен: {str(e)}")
+            response = jsonify({"success": False, "error": str(e), "session_id": session['id']})
+            return response, 503, {"Retry-After": "5"}
         except Exception as e:
             logging.error(f"Ошибка при обработке запроса в чате: {str(e)}")
             return jsonify({"success": False, "error": str(e)}), 500
@@ -300,9 +481,45 @@ def chat():
         print(f"Общая ошибка в /api/chat: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_chat_session(session_id):
+    """История сессии, краткое содержание и замеры по ходам диалога"""
+    session = sessions.get_session(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Сессия не найдена"}), 404
+    return jsonify({"success": True, "data": {
+        **session,
+        'messages': sessions.get_messages(session_id),
+        'turn_stats': sessions.turn_stats(session_id),
+        'uploads': uploads.session_uploads(session_id),
+    }})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Состояние задачи формирования документа: queued, running, done или error"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Задача не найдена"}), 404
+    data = {'job_id': job['id'], 'status': job['status'], 'error': job['error']}
+    if job['status'] == 'done':
+        data['download_url'] = f"/downloads/{job['filename']}"
+    return jsonify({"success": True, "data": data})
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Задача не найдена"}), 404
+    if job['status'] != 'done':
+        return jsonify({"success": False, "error": "Документ еще не готов", "status": job['status']}), 409
+    return send_from_directory(DOCX_DIR, job['filename'], as_attachment=True)
+
 @app.route('/downloads/<filename>')
 def download_file(filename):
     return send_from_directory(DOCX_DIR, filename, as_attachment=True)
 
 if __name__ == '__main__':
+    # Сервер для разработки (с автоперезагрузкой). В эксплуатации:
+    # gunicorn -c gunicorn.conf.py app:app
+    init_worker()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка API GigaChat для нагрузочного теста (load_test.py).
+
+Отвечает на получение токена (/api/v2/oauth) и на /api/v1/chat/completions
+с задержкой, похожей на ответ модели (--delay ± --jitter секунд), и заполняет
+usage, чтобы сервер записывал замеры токенов. Сеть и ключ не нужны.
+
+Запуск заглушки и сервера, настроенного на нее:
+    python gigachat_stub.py --port 8090 --delay 1.0
+    GIGACHAT_API_KEY=stub GIGACHAT_AUTH_URL=http://127.0.0.1:8090/api/v2/oauth \\
+    GIGACHAT_BASE_URL=http://127.0.0.1:8090/api/v1 gunicorn -c gunicorn.conf.py app:app
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Спасибо, это важная информация. Уточните, пожалуйста, кто будет основными "
+    "пользователями системы и сколько их примерно?"
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 1.0
+    jitter = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/oauth"):
+            expires_at = int((time.time() + 1800) * 1000)
+            self._send_json(200, {"access_token": "stub-token", "expires_at": expires_at})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"message": "not found"})
+            return
+        request = json.loads(body)
+        time.sleep(max(0.0, random.uniform(self.delay - self.jitter, self.delay + self.jitter)))
+        prompt_chars = sum(len(message.get("content", "")) for message in request.get("messages", []))
+        self._send_json(200, {
+            "choices": [{"message": {"role": "assistant", "content": REPLY}, "index": 0, "finish_reason": "stop"}],
+            "created": int(time.time()),
+            "model": request.get("model", "GigaChat"),
+            "object": "chat.completion",
+            "usage": {
+                "prompt_tokens": prompt_chars // 3,
+                "completion_tokens": len(REPLY) // 3,
+                "total_tokens": (prompt_chars + len(REPLY)) // 3,
+            },
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка API GigaChat")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=1.0, help="средняя задержка ответа модели, с")
+    parser.add_argument("--jitter", type=float, default=0.2, help="разброс задержки, с")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.jitter = args.jitter
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"[*] Заглушка GigaChat на http://{args.host}:{args.port} (задержка {args.delay} ± {args.jitter} с)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Конфигурация gunicorn для запуска бота ТЗ в эксплуатации:
+    gunicorn -c gunicorn.conf.py app:app
+
+Несколько процессов, в каждом пул потоков (gthread): обращение к GigaChat
+блокирует только свой поток, поэтому медленный ответ модели не задерживает
+остальных пользователей. Логирование и клиент GigaChat создаются в каждом
+процессе после fork (init_worker). Число одновременных обращений к модели
+в процессе ограничено LLM_CONCURRENCY (см. app.py). При остановке процесс
+дожидается начатых запросов и документов (graceful_timeout).
+
+Для локальной разработки с автоперезагрузкой по-прежнему: python app.py
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+worker_class = "gthread"
+# Потоков на процесс: одновременных запросов, которые процесс может обслуживать
+threads = int(os.getenv("WEB_THREADS", "16"))
+# Ответ GigaChat с повторами может занимать десятки секунд
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+# Перезапуск процесса после стольких запросов ограничивает рост памяти
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+accesslog = None
+
+
+def post_worker_init(worker):
+    from app import init_worker
+
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+
+    shutdown_worker()
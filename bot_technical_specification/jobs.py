@@ -0,0 +1,116 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlite_store import SQLiteStore
+
+# Фоновые задачи формирования документов. Чат отвечает сразу, а документ
+# собирается в пуле потоков; клиент узнает о готовности по id задачи.
+# Состояние задач хранится в SQLite, поэтому его видит любой процесс сервера,
+# а не только тот, в котором задача выполняется.
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+# Сколько документов собирается одновременно
+DOCX_WORKERS = int(os.getenv("DOCX_WORKERS", "2"))
+# Задача, которая собирается дольше этого времени (например, процесс
+# перезапустили посреди сборки), считается упавшей. Время ожидания в очереди
+# не учитывается: задача может ждать свободного потока сколько угодно
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+"""
+
+JOB_FIELDS = ("id", "session_id", "filename", "status", "error", "created_at", "started_at", "finished_at")
+
+
+def add_started_at(connection):
+    """Добавляет столбец started_at в базу, созданную до его появления."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+    if "started_at" not in columns:
+        connection.execute("ALTER TABLE jobs ADD COLUMN started_at TEXT")
+
+
+store = SQLiteStore(JOBS_DB, SCHEMA, on_init=add_started_at)
+executor = ThreadPoolExecutor(max_workers=DOCX_WORKERS, thread_name_prefix="docx")
+
+
+def _set_status(job_id, status, error=None):
+    finished_at = datetime.now().isoformat() if status in ("done", "error") else None
+    with store.transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, finished_at, job_id),
+        )
+
+
+def _start(job_id):
+    with store.transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+            (datetime.now().isoformat(), job_id),
+        )
+
+
+def _run(job_id, task):
+    _start(job_id)
+    try:
+        task()
+    except Exception as e:
+        logging.error(f"Ошибка фоновой задачи {job_id}: {str(e)}")
+        _set_status(job_id, "error", str(e))
+        return
+    _set_status(job_id, "done")
+
+
+def submit(filename, task, session_id=None):
+    """
+    Ставит задачу в очередь. task() создает файл filename и бросает
+    исключение при ошибке. Возвращает id задачи.
+    """
+    job_id = uuid.uuid4().hex
+    with store.transaction() as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, session_id, filename, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, session_id, filename, datetime.now().isoformat()),
+        )
+    executor.submit(_run, job_id, task)
+    return job_id
+
+
+def get_job(job_id):
+    """Состояние задачи как словарь или None, если задачи нет."""
+    query = f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?"
+    row = store.connection().execute(query, (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_FIELDS, row))
+    if job['status'] == "running" and job['started_at'] and \
+            datetime.now() - datetime.fromisoformat(job['started_at']) > timedelta(seconds=JOB_TIMEOUT_SECONDS):
+        _expire(job_id)
+        job = dict(zip(JOB_FIELDS, store.connection().execute(query, (job_id,)).fetchone()))
+    return job
+
+
+def _expire(job_id):
+    """Помечает зависшую задачу упавшей (если она за это время не завершилась)."""
+    with store.transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = 'error', error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            ("Задача не завершилась вовремя", datetime.now().isoformat(), job_id),
+        )
+
+
+def shutdown(wait=True):
+    """Останавливает пул: новые задачи не принимаются, начатые (при wait) дорабатывают."""
+    executor.shutdown(wait=wait)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест /api/chat бота ТЗ.
+
+Запускает --users параллельных диалогов, каждый из --turns ходов в своей
+сессии (как ведет диалог клиент: session_id и новое сообщение). Сервер
+должен быть настроен на локальную заглушку GigaChat (gigachat_stub.py),
+тогда задержка модели известна и тест меряет только накладные расходы
+сервера и очередь к модели.
+
+Выводит p50/p99 задержки /api/chat, пропускную способность, число ответов
+503 (все слоты LLM_CONCURRENCY заняты) и ошибок, а также задержку первого
+и последнего ходов диалога.
+
+Пример:
+    python gigachat_stub.py --delay 1.0 &
+    python load_test.py --url http://127.0.0.1:5000 --users 32 --turns 5
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+MESSAGES = [
+    "Нужна система учета заявок на ремонт оборудования для трех цехов",
+    "Пользователи — мастера участков и диспетчеры, всего около 150 человек",
+    "Заявку создает мастер, диспетчер назначает исполнителя и контролирует сроки",
+    "Нужна интеграция с 1С для списания запчастей и отчеты по простоям",
+    "Срок запуска — конец квартала, бюджет согласуем после оценки",
+]
+
+
+def send_message(base_url, session_id, message, timeout):
+    """Отправляет ход диалога. Возвращает (задержка, HTTP-статус, session_id из ответа)."""
+    body = json.dumps({"session_id": session_id, "message": message}).encode("utf-8")
+    req = urllib.request.Request(
+        f"{base_url}/api/chat",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            data = json.loads(resp.read())
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        data = json.loads(e.read() or b"{}")
+        status = e.code
+    except Exception as e:
+        print(f"  [!] Ошибка запроса: {e}")
+        return time.perf_counter() - started, None, session_id
+    return time.perf_counter() - started, status, data.get("session_id", session_id)
+
+
+def run_dialogue(base_url, turns, timeout):
+    """Один пользователь: turns ходов в одной сессии. Возвращает [(номер хода, задержка, статус)]."""
+    session_id = None
+    results = []
+    for turn in range(turns):
+        message = MESSAGES[turn % len(MESSAGES)]
+        latency, status, session_id = send_message(base_url, session_id, message, timeout)
+        results.append((turn, latency, status))
+    return results
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /api/chat")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=16, help="число одновременных диалогов")
+    parser.add_argument("--turns", type=int, default=5, help="ходов в каждом диалоге")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    print(f"[*] {args.users} диалогов по {args.turns} ходов -> {args.url}/api/chat")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        dialogues = list(pool.map(lambda _: run_dialogue(args.url, args.turns, args.timeout), range(args.users)))
+    total_time = time.perf_counter() - started
+
+    results = [result for dialogue in dialogues for result in dialogue]
+    ok = [latency for _, latency, status in results if status == 200]
+    overloaded = sum(1 for _, _, status in results if status == 503)
+    failed = len(results) - len(ok) - overloaded
+
+    print("=" * 50)
+    print(f"Запросов: {len(results)} за {total_time:.1f} с ({len(results) / total_time:.1f} запр/с)")
+    print(f"Успешно: {len(ok)}, отклонено (503): {overloaded}, ошибок: {failed}")
+    if ok:
+        print(f"Задержка /api/chat: p50 {percentile(ok, 50) * 1000:.0f} мс, "
+              f"p99 {percentile(ok, 99) * 1000:.0f} мс, "
+              f"среднее {statistics.mean(ok) * 1000:.0f} мс, макс {max(ok) * 1000:.0f} мс")
+        for turn in (0, args.turns - 1):
+            turn_latencies = [latency for number, latency, status in results if number == turn and status == 200]
+            if turn_latencies:
+                print(f"  ход {turn + 1}: p50 {percentile(turn_latencies, 50) * 1000:.0f} мс")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import math
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlite_store import SQLiteStore
+
+# Диалоги хранятся на сервере: клиент присылает только id сессии и новое
+# сообщение, а не всю историю. Полная история нужна для итогового документа,
+# а в GigaChat уходит краткое содержание старой части диалога и последние
+# реплики (см. context и pending_compaction), поэтому размер запроса
+# и промпта не растет с длиной диалога.
+SESSIONS_DB = os.getenv("SESSIONS_DB", "sessions.db")
+# Сколько токенов несжатой истории отправлять в GigaChat. При превышении
+# старые реплики сворачиваются в краткое содержание.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Сколько токенов последних реплик оставлять дословно после сжатия
+HISTORY_KEEP_TOKENS = int(os.getenv("HISTORY_KEEP_TOKENS", "700"))
+# Оценка числа токенов по длине текста (для русского текста у GigaChat ~3 символа на токен)
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3"))
+# Неактивные сессии удаляются через столько дней
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "7"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    -- Реплики с seq <= summary_upto свернуты в summary
+    summary_upto INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    -- Замеры хода диалога (заполняются у ответов бота)
+    request_bytes INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms REAL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+store = SQLiteStore(SESSIONS_DB, SCHEMA)
+
+
+def estimate_tokens(text):
+    """Приблизительное число токенов в тексте."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def create_session(messages=()):
+    """
+    Создает сессию; messages — уже состоявшаяся часть диалога
+    ({'sender', 'text'}), например от клиента старой версии.
+    Заодно удаляет сессии, неактивные дольше SESSION_TTL_DAYS.
+    """
+    session_id = uuid.uuid4().hex
+    now = datetime.now()
+    with store.transaction() as connection:
+        connection.execute(
+            "DELETE FROM sessions WHERE updated_at < ?",
+            ((now - timedelta(days=SESSION_TTL_DAYS)).isoformat(),),
+        )
+        connection.execute(
+            "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+            (session_id, now.isoformat(), now.isoformat()),
+        )
+        _insert_messages(connection, session_id, 0, messages)
+    return session_id
+
+
+def get_session(session_id):
+    """Сессия как словарь или None, если ее нет (или она удалена по сроку)."""
+    row = store.connection().execute(
+        "SELECT id, created_at, updated_at, summary, summary_upto, done FROM sessions WHERE id = ?",
+        (session_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("id", "created_at", "updated_at", "summary", "summary_upto", "done")
+    return dict(zip(keys, row))
+
+
+def _insert_messages(connection, session_id, last_seq, messages):
+    now = datetime.now().isoformat()
+    for seq, msg in enumerate(messages, start=last_seq + 1):
+        stats = msg.get('stats') or {}
+        connection.execute(
+            "INSERT INTO messages (session_id, seq, sender, text, tokens, created_at, "
+            "request_bytes, prompt_tokens, completion_tokens, latency_ms) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                session_id, seq, msg['sender'], msg['text'], estimate_tokens(msg['text']), now,
+                stats.get('request_bytes'), stats.get('prompt_tokens'),
+                stats.get('completion_tokens'), stats.get('latency_ms'),
+            ),
+        )
+
+
+def append_turn(session_id, user_text, bot_text, stats=None, done=False):
+    """
+    Сохраняет ход диалога (вопрос пользователя и ответ бота) одной транзакцией.
+    Вызывается после успешного ответа модели, поэтому повтор запроса после
+    ошибки не дублирует реплику пользователя. stats — замеры хода
+    (request_bytes, prompt_tokens, completion_tokens, latency_ms).
+    """
+    append_messages(session_id, [
+        {'sender': 'user', 'text': user_text},
+        {'sender': 'bot', 'text': bot_text, 'stats': stats},
+    ], done=done)
+
+
+def append_messages(session_id, messages, done=False):
+    """Добавляет реплики в конец диалога; done=True отмечает диалог завершенным."""
+    with store.transaction() as connection:
+        last_seq = connection.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+        _insert_messages(connection, session_id, last_seq, messages)
+        connection.execute(
+            "UPDATE sessions SET updated_at = ?, done = MAX(done, ?) WHERE id = ?",
+            (datetime.now().isoformat(), int(done), session_id),
+        )
+
+
+def get_messages(session_id, after_seq=0):
+    """Реплики сессии после after_seq: [{'seq', 'sender', 'text', 'tokens'}]."""
+    rows = store.connection().execute(
+        "SELECT seq, sender, text, tokens FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+        (session_id, after_seq),
+    )
+    return [{'seq': seq, 'sender': sender, 'text': text, 'tokens': tokens} for seq, sender, text, tokens in rows]
+
+
+def context(session):
+    """Контекст для модели: (краткое содержание, несвернутые реплики)."""
+    return session['summary'], get_messages(session['id'], session['summary_upto'])
+
+
+def pending_compaction(session, new_tokens=0):
+    """
+    Реплики, которые пора свернуть в краткое содержание, или пустой список.
+    Сжатие нужно, когда несвернутая история вместе с новым сообщением
+    (new_tokens) превышает HISTORY_TOKEN_BUDGET; дословно остаются последние
+    реплики на HISTORY_KEEP_TOKENS (минимум последний ход).
+    """
+    _, recent = context(session)
+    if sum(msg['tokens'] for msg in recent) + new_tokens <= HISTORY_TOKEN_BUDGET:
+        return []
+    kept_tokens = 0
+    keep_from = len(recent)
+    while keep_from > 0:
+        tokens = recent[keep_from - 1]['tokens']
+        if kept_tokens + tokens > HISTORY_KEEP_TOKENS and len(recent) - keep_from >= 2:
+            break
+        kept_tokens += tokens
+        keep_from -= 1
+    # Дословная часть начинается с реплики пользователя
+    while keep_from < len(recent) - 1 and recent[keep_from]['sender'] != 'user':
+        keep_from += 1
+    return recent[:keep_from]
+
+
+def save_summary(session_id, summary, upto_seq):
+    """Запоминает новое краткое содержание, покрывающее реплики до upto_seq включительно."""
+    with store.transaction() as connection:
+        connection.execute(
+            "UPDATE sessions SET summary = ?, summary_upto = MAX(summary_upto, ?) WHERE id = ?",
+            (summary, upto_seq, session_id),
+        )
+
+
+def turn_stats(session_id):
+    """Замеры по ходам диалога: размер запроса, токены промпта и ответа, задержка."""
+    rows = store.connection().execute(
+        "SELECT seq, request_bytes, prompt_tokens, completion_tokens, latency_ms FROM messages "
+        "WHERE session_id = ? AND sender = 'bot' AND latency_ms IS NOT NULL ORDER BY seq",
+        (session_id,),
+    )
+    keys = ("seq", "request_bytes", "prompt_tokens", "completion_tokens", "latency_ms")
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,60 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    """
+    Файл SQLite в режиме WAL, общий для потоков и процессов сервера.
+    Соединение SQLite нельзя делить между потоками, поэтому у каждого потока
+    свое. Схема создается при первом обращении в процессе; тогда же
+    вызывается on_init(соединение), например для переноса старых данных.
+    """
+
+    def __init__(self, path, schema, on_init=None):
+        self.path = path
+        self.schema = schema
+        self.on_init = on_init
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # В WAL достаточно синхронизации при контрольной точке, а не на каждую транзакцию
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def connection(self):
+        """Соединение текущего потока."""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    connection = self._connect()
+                    connection.executescript(self.schema)
+                    if self.on_init is not None:
+                        self.on_init(connection)
+                    connection.close()
+                    self._initialized = True
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    @contextmanager
+    def transaction(self, connection=None):
+        """
+        Транзакция на запись. BEGIN IMMEDIATE сразу берет блокировку записи:
+        одновременные записи из других потоков и процессов ждут (до таймаута
+        соединения), а не завершаются ошибкой посреди транзакции.
+        """
+        connection = connection or self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Проверка пропускной способности и памяти при загрузке больших файлов в /api/upload.
+
+Генерирует содержимое файла на лету (на диск клиента ничего не пишется)
+и отправляет его частями (Transfer-Encoding: chunked): сначала телом запроса,
+затем тот же файл в multipart-форме, как браузер. Для каждой загрузки
+выводит скорость, SHA-256 (сверяется с посчитанным клиентом), признак
+дедупликации (второй раз тот же файл хранится один раз), а также пиковую
+память процессов сервера (VmHWM из /proc, если указан --server-pid на той же машине).
+Последней загрузкой проверяется, что файл больше лимита отклоняется (413).
+
+Пример:
+    python upload_test.py --url http://127.0.0.1:5000 --size-mb 300 --server-pid $(pgrep -f "gunicorn" | head -1)
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import time
+import uuid
+from urllib.parse import quote, urlsplit
+
+PART_SIZE = 1024 * 1024
+
+
+def generate(size, seed):
+    """Содержимое файла размером size частями по PART_SIZE байт."""
+    block = hashlib.sha256(seed.encode()).digest() * (PART_SIZE // 32)
+    sent = 0
+    counter = 0
+    while sent < size:
+        part = block[:min(PART_SIZE, size - sent)]
+        # Части различаются, чтобы файл не сжимался до повторов одного блока
+        part = counter.to_bytes(8, "big") + part[8:]
+        counter += 1
+        sent += len(part)
+        yield part
+
+
+def expected_sha256(size, seed):
+    digest = hashlib.sha256()
+    for part in generate(size, seed):
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def multipart(parts, filename, boundary):
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+           f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    yield from parts
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload(base_url, body, path, content_type, timeout):
+    """Отправляет тело частями (chunked). Возвращает (HTTP-статус, ответ, секунды)."""
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    started = time.perf_counter()
+    connection.request("POST", path, body=body, headers={"Content-Type": content_type}, encode_chunked=True)
+    response = connection.getresponse()
+    data = response.read()
+    seconds = time.perf_counter() - started
+    connection.close()
+    try:
+        data = json.loads(data)
+    except ValueError:
+        data = {"error": data[:200].decode(errors="replace")}
+    return response.status, data, seconds
+
+
+def peak_memory_mb(pids):
+    """Сумма пиковой памяти (VmHWM) процессов и их потомков, МБ."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return total
+
+
+def server_pids(root_pid):
+    pids = [root_pid]
+    for pid in os.listdir("/proc"):
+        if pid.isdigit():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == root_pid:
+                        pids.append(int(pid))
+            except (OSError, ValueError, IndexError):
+                pass
+    return pids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка больших файлов в /api/upload")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--size-mb", type=int, default=300)
+    parser.add_argument("--limit-mb", type=int, default=512, help="лимит сервера (MAX_UPLOAD_MB) для проверки 413")
+    parser.add_argument("--server-pid", type=int, default=None, help="pid сервера (мастер gunicorn) для замера памяти")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    seed = uuid.uuid4().hex
+    print(f"[*] Файл {args.size_mb} МБ, считаем эталонный SHA-256 ...")
+    digest = expected_sha256(size, seed)
+    filename = "Макет интерфейса.bin"
+    pids = server_pids(args.server_pid) if args.server_pid else []
+    if pids:
+        print(f"[*] Пиковая память сервера до загрузки: {peak_memory_mb(pids):.0f} МБ")
+
+    runs = [
+        ("тело запроса", lambda: generate(size, seed),
+         f"/api/upload?filename={quote(filename)}", "application/octet-stream"),
+        ("multipart (повтор)", lambda: multipart(generate(size, seed), "mockup.bin", "gspboundary"),
+         "/api/upload", "multipart/form-data; boundary=gspboundary"),
+    ]
+    for name, body, path, content_type in runs:
+        status, data, seconds = upload(args.url, body(), path, content_type, args.timeout)
+        print(f"[{'+' if status == 200 else '!'}] {name}: HTTP {status}, {seconds:.1f} с, "
+              f"{args.size_mb / seconds:.0f} МБ/с, sha256 {'совпадает' if data.get('sha256') == digest else 'НЕ совпадает'}, "
+              f"дубликат: {data.get('deduplicated')}")
+        if pids:
+            print(f"    пиковая память сервера: {peak_memory_mb(pids):.0f} МБ")
+
+    over = (args.limit_mb + 1) * 1024 * 1024
+    status, data, seconds = upload(
+        args.url, generate(over, seed), "/api/upload?filename=big.bin", "application/octet-stream", args.timeout
+    )
+    print(f"[{'+' if status == 413 else '!'}] файл больше лимита: HTTP {status} за {seconds:.1f} с ({data.get('error')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from sqlite_store import SQLiteStore
+
+# Прикрепленные к диалогу файлы. Файл пишется на диск по частям по мере
+# приема запроса, SHA-256 считается во время записи (второго прохода по
+# файлу нет), а хранится файл под именем своего хэша: одинаковые вложения
+# лежат на диске один раз, а файлы с одинаковыми именами не затирают друг
+# друга. Исходные имена и связь с сессией диалога хранятся в базе.
+UPLOADS_DIR = "uploads"
+# Недописанные файлы; после проверки переносятся в objects/
+UPLOADS_TMP_DIR = os.path.join(UPLOADS_DIR, "tmp")
+UPLOADS_OBJECTS_DIR = os.path.join(UPLOADS_DIR, "objects")
+UPLOADS_DB = os.getenv("UPLOADS_DB", "uploads.db")
+# Ограничение размера одного файла
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+# Размер части при чтении тела запроса
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_session ON uploads (session_id);
+"""
+
+store = SQLiteStore(UPLOADS_DB, SCHEMA)
+for directory in [UPLOADS_TMP_DIR, UPLOADS_OBJECTS_DIR]:
+    os.makedirs(directory, exist_ok=True)
+
+
+class HashingWriter:
+    """
+    Файл для приема загрузки: пишет во временный файл, считает SHA-256
+    и размер и прерывает прием (413), как только размер превысил
+    MAX_UPLOAD_BYTES. Werkzeug пишет сюда части multipart-запроса
+    (см. UploadRequest в app.py), для тела запроса без multipart данные
+    копирует write_stream. Если файл не сохранен (commit), при закрытии
+    временный файл удаляется.
+    """
+
+    def __init__(self, max_size=MAX_UPLOAD_BYTES):
+        self.max_size = max_size
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(dir=UPLOADS_TMP_DIR, delete=False)
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(f"Файл больше {self.max_size // (1024 * 1024)} МБ")
+        self.hash.update(data)
+        return self.file.write(data)
+
+    # Werkzeug после записи перематывает файл; читать его из памяти не нужно
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def readline(self, *args):
+        return self.file.readline(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if not self.committed and os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+    def commit(self):
+        """
+        Переносит файл в хранилище под именем его хэша.
+        Возвращает (sha256, размер, был ли такой файл уже сохранен).
+        """
+        self.file.close()
+        digest = self.hash.hexdigest()
+        path = object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        duplicate = os.path.exists(path)
+        if duplicate:
+            os.remove(self.file.name)
+        else:
+            os.replace(self.file.name, path)
+        self.committed = True
+        return digest, self.size, duplicate
+
+
+def write_stream(stream, writer, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Копирует тело запроса в writer частями по chunk_size байт."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        writer.write(chunk)
+
+
+def object_path(digest):
+    """Путь к файлу в хранилище: objects/<2 символа хэша>/<хэш>."""
+    return os.path.join(UPLOADS_OBJECTS_DIR, digest[:2], digest)
+
+
+def save_upload(writer, filename, session_id=None):
+    """Сохраняет принятый файл и запись о нем. Возвращает описание загрузки."""
+    digest, size, duplicate = writer.commit()
+    upload_id = uuid.uuid4().hex
+    with store.transaction() as connection:
+        connection.execute(
+            "INSERT INTO uploads (id, session_id, filename, sha256, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (upload_id, session_id, filename, digest, size, datetime.now().isoformat()),
+        )
+    return {'upload_id': upload_id, 'filename': filename, 'sha256': digest, 'size': size, 'deduplicated': duplicate}
+
+
+def session_uploads(session_id):
+    """Файлы, прикрепленные к сессии диалога."""
+    rows = store.connection().execute(
+        "SELECT id, filename, sha256, size, created_at FROM uploads WHERE session_id = ? ORDER BY created_at",
+        (session_id,),
+    )
+    keys = ("upload_id", "filename", "sha256", "size", "created_at")
+    return [dict(zip(keys, row)) for row in rows]
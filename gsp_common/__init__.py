@@ -0,0 +1 @@
+# Общий код для обоих ботов (NLP-ассистент и бот для составления ТЗ)
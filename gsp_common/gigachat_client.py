@@ -0,0 +1,299 @@
+"""
+Общий клиент GigaChat для обоих ботов.
+
+Оборачивает клиент из SDK gigachat и добавляет то, чего в нем нет:
+- прогрев при старте (OAuth-токен и TLS-соединение готовы до первого запроса);
+- обновление токена заранее, до истечения срока действия;
+- таймаут на каждый вызов и ограниченное число повторов с экспоненциальной
+  задержкой и случайным разбросом (jitter);
+- автоматический выключатель (circuit breaker): при недоступности GigaChat
+  запросы сразу завершаются ошибкой, а не копятся в ожидании таймаутов.
+
+Один экземпляр клиента переиспользует HTTP-соединения (httpx) между вызовами,
+поэтому его нужно создавать один раз на процесс.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from gigachat import GigaChat
+from gigachat.exceptions import AuthenticationError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+# HTTP-статусы, при которых повтор запроса имеет смысл
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """GigaChat признан недоступным, запрос отклонен без обращения к API."""
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель.
+    После failure_threshold неудачных вызовов подряд переходит в состояние "open"
+    и отклоняет вызовы reset_timeout секунд. Затем пропускает один пробный вызов
+    ("half_open"): успех замыкает цепь, неудача снова размыкает ее. Если пробный
+    вызов прерван (отмена запроса, брошенный поток), пробным может стать следующий.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Проверяет, можно ли выполнить вызов; иначе бросает CircuitOpenError.
+        Возвращает True, если вызов пробный: тогда по его завершении нужно вызвать
+        end_trial, даже если итог не записан (record_success/record_failure).
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            raise CircuitOpenError("GigaChat временно недоступен, запрос отклонен")
+
+    def end_trial(self):
+        """Пробный вызов завершен без итога: цепь снова разомкнута, но ждать reset_timeout не нужно."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("GigaChat: цепь разомкнута после %s ошибок подряд", self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Сетевые ошибки, таймауты и ответы 429/5xx считаются временными."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, ResponseError) and not isinstance(error, AuthenticationError):
+        status_code = error.args[1] if len(error.args) > 1 else None
+        return status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def record_outcome(breaker, error):
+    """
+    Учитывает неудачный вызов в выключателе. Отказ API (4xx, в том числе
+    авторизации) не размыкает цепь: GigaChat ответил, значит, он доступен.
+    """
+    if isinstance(error, ResponseError) and not is_retryable(error):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def describe_error(error):
+    """Короткое описание ошибки для логов (без тела и заголовков ответа)."""
+    if isinstance(error, ResponseError) and len(error.args) > 1:
+        return f"HTTP {error.args[1]}"
+    return f"{type(error).__name__}: {error}"
+
+
+class ResilientGigaChat:
+    """Клиент GigaChat с прогревом, обновлением токена, повторами и выключателем."""
+
+    def __init__(
+        self,
+        credentials=None,
+        timeout=30.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        token_refresh_margin=120.0,
+        breaker=None,
+        **client_kwargs,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.token_refresh_margin = token_refresh_margin
+        self.breaker = breaker or CircuitBreaker()
+        self.uses_oauth = bool(credentials)
+        self._client = GigaChat(credentials=credentials, timeout=timeout, **client_kwargs)
+        self._token_lock = threading.Lock()
+        self._atoken_lock = None
+
+    # --- Токен ---
+
+    def _token_expires_soon(self):
+        token = getattr(self._client, "_access_token", None)
+        if token is None:
+            return True
+        return token.expires_at / 1000 - time.time() < self.token_refresh_margin
+
+    def _refresh_token_if_needed(self):
+        if not self.uses_oauth or not self._token_expires_soon():
+            return
+        with self._token_lock:
+            if self._token_expires_soon():
+                self._client._reset_token()
+                self._client.get_token()
+                logger.info("GigaChat: токен доступа обновлен")
+
+    async def _arefresh_token_if_needed(self):
+        if not self.uses_oauth or not self._token_expires_soon():
+            return
+        if self._atoken_lock is None:
+            self._atoken_lock = asyncio.Lock()
+        async with self._atoken_lock:
+            if self._token_expires_soon():
+                self._client._reset_token()
+                await self._client.aget_token()
+                logger.info("GigaChat: токен доступа обновлен")
+
+    def warm_up(self):
+        """
+        Получает токен и открывает соединение заранее, чтобы первый пользователь
+        после перезапуска не ждал авторизации. Возвращает True при успехе.
+        """
+        try:
+            self._refresh_token_if_needed()
+            logger.info("GigaChat: клиент прогрет")
+            return True
+        except Exception as e:
+            logger.error("GigaChat: не удалось прогреть клиент: %s", e)
+            return False
+
+    # --- Повторы ---
+
+    def _backoff(self, attempt):
+        """Задержка перед повтором: экспоненциальная, со случайным разбросом (full jitter)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, func):
+        trial = self.breaker.before_call()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._refresh_token_if_needed()
+                    result = func()
+                except Exception as e:
+                    if attempt < self.max_retries and is_retryable(e):
+                        delay = self._backoff(attempt)
+                        logger.warning("GigaChat: временная ошибка (%s), повтор через %.2f с", describe_error(e), delay)
+                        time.sleep(delay)
+                        continue
+                    record_outcome(self.breaker, e)
+                    raise
+                self.breaker.record_success()
+                return result
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    async def _acall(self, func):
+        trial = self.breaker.before_call()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self._arefresh_token_if_needed()
+                    result = await func()
+                except Exception as e:
+                    if attempt < self.max_retries and is_retryable(e):
+                        delay = self._backoff(attempt)
+                        logger.warning("GigaChat: временная ошибка (%s), повтор через %.2f с", describe_error(e), delay)
+                        await asyncio.sleep(delay)
+                        continue
+                    record_outcome(self.breaker, e)
+                    raise
+                self.breaker.record_success()
+                return result
+        finally:
+            # Отмена запроса (CancelledError) не должна оставить цепь в half_open
+            if trial:
+                self.breaker.end_trial()
+
+    # --- Вызовы API ---
+
+    def chat(self, payload):
+        """Синхронный запрос к модели (как GigaChat.chat)."""
+        return self._call(lambda: self._client.chat(payload))
+
+    async def achat(self, payload):
+        """Асинхронный запрос к модели (как GigaChat.achat)."""
+        return await self._acall(lambda: self._client.achat(payload))
+
+    async def astream(self, payload):
+        """
+        Потоковый ответ модели (как GigaChat.astream). Повтор возможен только
+        до получения первого фрагмента: начатый ответ повторять нельзя.
+        """
+        trial = self.breaker.before_call()
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    await self._arefresh_token_if_needed()
+                    async for chunk in self._client.astream(payload):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    if not started and attempt < self.max_retries and is_retryable(e):
+                        delay = self._backoff(attempt)
+                        logger.warning("GigaChat: временная ошибка (%s), повтор через %.2f с", describe_error(e), delay)
+                        await asyncio.sleep(delay)
+                        continue
+                    record_outcome(self.breaker, e)
+                    raise
+                self.breaker.record_success()
+                return
+        finally:
+            # Клиент мог бросить поток (GeneratorExit) или отменить запрос
+            if trial:
+                self.breaker.end_trial()
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+def create_client(credentials=None, **overrides):
+    """
+    Создает клиент с настройками из переменных окружения:
+    GIGACHAT_TIMEOUT, GIGACHAT_MAX_RETRIES, GIGACHAT_BREAKER_THRESHOLD,
+    GIGACHAT_BREAKER_RESET, GIGACHAT_MAX_CONNECTIONS, GIGACHAT_VERIFY_SSL,
+    GIGACHAT_BASE_URL, GIGACHAT_ACCESS_TOKEN.
+    Явно переданные параметры имеют приоритет.
+    """
+    settings = {
+        "timeout": float(os.getenv("GIGACHAT_TIMEOUT", "30")),
+        "max_retries": int(os.getenv("GIGACHAT_MAX_RETRIES", "2")),
+        "max_connections": int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "20")),
+        "verify_ssl_certs": os.getenv("GIGACHAT_VERIFY_SSL", "0") == "1",
+        "breaker": CircuitBreaker(
+            failure_threshold=int(os.getenv("GIGACHAT_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("GIGACHAT_BREAKER_RESET", "30")),
+        ),
+    }
+    if os.getenv("GIGACHAT_BASE_URL"):
+        settings["base_url"] = os.getenv("GIGACHAT_BASE_URL")
+    if os.getenv("GIGACHAT_ACCESS_TOKEN"):
+        settings["access_token"] = os.getenv("GIGACHAT_ACCESS_TOKEN")
+    settings.update(overrides)
+    return ResilientGigaChat(credentials=credentials, **settings)
@@ -15,6 +15,8 @@ import {
 const ChatPage = () => {
   const [messages, setMessages] = useState([]);
   const [inputValue, setInputValue] = useState('');
+  // Dialogue history for bot A is kept on the server; only the session id is sent
+  const [sessionId, setSessionId] = useState(null);
 
   const getActiveBot = (message) => {
     const keywords = ['new project', 'application', 'tech spec', 'technical specification'];
@@ -27,6 +29,22 @@ const ChatPage = () => {
     return 'B';
   };
 
+  const waitForDocument = async (jobUrl) => {
+    for (let attempt = 0; attempt < 600; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      try {
+        const response = await axios.get(`${process.env.REACT_APP_CHATBOT_A_URL}${jobUrl}`);
+        const job = response.data.data;
+        if (job.status === 'done' || job.status === 'error') {
+          return job;
+        }
+      } catch (error) {
+        // Transient network error: keep polling
+      }
+    }
+    return { status: 'error' };
+  };
+
   // TODO: A more sophisticated routing logic should be implemented in a dedicated backend service (BFF).
   // This could involve using a more advanced NLP model to classify the user's intent and route the query
   // to the appropriate chatbot. For now, we are using a simple keyword-based approach.
@@ -42,14 +60,12 @@ const ChatPage = () => {
     try {
       let response;
       if (activeBot === 'A') {
-        const chatHistory = messages.map(msg => ({
-          sender: msg.sender,
-          text: msg.text,
-        }));
-        chatHistory.push(userMessage);
         response = await axios.post(`${process.env.REACT_APP_CHATBOT_A_URL}/api/chat`, {
-          messages: chatHistory,
+          session_id: sessionId,
+          message: inputValue,
         });
+        // A finished specification ends the session; the next message starts a new one
+        setSessionId(response.data.document_ready ? null : response.data.session_id);
       } else {
         response = await axios.post(`${process.env.REACT_APP_CHATBOT_B_URL}/ask`, {
           query: inputValue,
@@ -58,6 +74,15 @@ const ChatPage = () => {
 
       const botMessage = { sender: 'bot', text: response.data.answer || response.data.reply };
       setMessages((prevMessages) => [...prevMessages, botMessage]);
+
+      if (activeBot === 'A' && response.data.job_id) {
+        // The specification document is built in the background; poll until it is ready
+        const job = await waitForDocument(response.data.job_url);
+        const text = job.status === 'done'
+          ? `Document is ready: ${process.env.REACT_APP_CHATBOT_A_URL}${job.download_url}`
+          : `Failed to create the document: ${job.error || 'no response from the server'}`;
+        setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text }]);
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMessage = {